@@ -9,33 +9,43 @@ Sistema completo de rede social com:
 - Chat DM entre amigos
 - Notificações em tempo real
 - Sistema de amizades
-- Armazenamento em CSV
+- Armazenamento em CSV ou SQLite
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-from functools import wraps
-from datetime import datetime, timezone
+from flask import (
+    Flask, render_template, request, redirect, url_for, session, jsonify, Response, stream_with_context,
+    send_from_directory,
+)
+from functools import wraps, lru_cache
+from datetime import timezone
 from zoneinfo import ZoneInfo
 import secrets
-import csv
+import hashlib
+import atexit
+import click
+import json
+import time
 import os
 
+from storage import (
+    create_storage, parse_timestamp, SqliteStorage, CsvStorage,
+    migrate_csv_to_sqlite, normalize_timestamps, NotificationRetention, RetentionCompactor,
+)
+from events import EventBus
+from metrics import RequestMetrics
+from profiling import RequestProfiler
+from notifications import NotificationQueue
+
 # ========================================
 # CONFIGURAÇÃO DE DIRETÓRIOS
 # ========================================
 BASE_DIR = os.path.dirname(__file__)
 SRC_DIR = os.path.join(BASE_DIR, 'src')
 PAGES_DIR = os.path.join(SRC_DIR, 'pages')
-DATA_DIR = os.path.join(SRC_DIR, 'data')
+# Pasta dos CSVs (FLUKER_DATA_DIR aponta para outra base, ex.: a do benchmark)
+DATA_DIR = os.environ.get('FLUKER_DATA_DIR', os.path.join(SRC_DIR, 'data'))
 STATIC_DIR = os.path.join(SRC_DIR, 'static')
 
-# Caminhos dos arquivos CSV
-CSV_PATH = os.path.join(DATA_DIR, 'users.csv')
-MESSAGES_PATH = os.path.join(DATA_DIR, 'messages.csv')
-POSTS_PATH = os.path.join(DATA_DIR, 'posts.csv')
-NOTIF_PATH = os.path.join(DATA_DIR, 'notifications.csv')
-FRIENDS_PATH = os.path.join(DATA_DIR, 'friends.csv')
-
 # ========================================
 # CONFIGURAÇÃO DO FLASK
 # ========================================
@@ -43,215 +53,351 @@ app = Flask(__name__, template_folder=PAGES_DIR, static_folder=STATIC_DIR)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', secrets.token_hex(32))
 
 # ========================================
-# INICIALIZAÇÃO DOS ARQUIVOS CSV
+# MÉTRICAS
 # ========================================
 
-def ensure_csv():
-    """Garante que o CSV de usuários existe"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(CSV_PATH):
-        with open(CSV_PATH, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(['id', 'username', 'password', 'email'])
-
-def ensure_messages_csv():
-    """Garante que o CSV de mensagens existe"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(MESSAGES_PATH):
-        with open(MESSAGES_PATH, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(['id', 'sender_id', 'receiver_id', 'timestamp', 'content'])
-
-def ensure_posts_csv():
-    """Garante que o CSV de posts existe com suporte a curtidas"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(POSTS_PATH):
-        with open(POSTS_PATH, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(['id', 'author_id', 'author_name', 'timestamp', 'content', 'likes', 'likes_by'])
-
-def ensure_notifications_csv():
-    """Garante que o CSV de notificações existe"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(NOTIF_PATH):
-        with open(NOTIF_PATH, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(['id', 'user_id', 'type', 'actor_id', 'message_id', 'timestamp', 'read', 'text'])
-
-def ensure_friends_csv():
-    """Garante que o CSV de amizades existe"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(FRIENDS_PATH):
-        with open(FRIENDS_PATH, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(['user1_id', 'user2_id', 'status', 'timestamp'])
+# Instrumentação por requisição e endpoint /metrics (Prometheus); '1' liga
+METRICS_ENABLED = os.environ.get('FLUKER_METRICS', '0') == '1'
+
+metrics = RequestMetrics(enabled=METRICS_ENABLED)
+metrics.init_app(app)
 
 # ========================================
-# GERADORES DE ID
+# PROFILER AMOSTRADO
 # ========================================
 
-def next_id():
-    """Retorna o próximo ID disponível para usuários"""
-    ensure_csv()
-    with open(CSV_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        ids = [int(row['id']) for row in reader if row.get('id')]
-        return (max(ids) + 1) if ids else 1
-
-def next_message_id():
-    """Retorna o próximo ID disponível para mensagens"""
-    ensure_messages_csv()
-    with open(MESSAGES_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        ids = [int(r['id']) for r in reader if r.get('id')]
-        return (max(ids) + 1) if ids else 1
-
-def next_post_id():
-    """Retorna o próximo ID disponível para posts"""
-    ensure_posts_csv()
-    with open(POSTS_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        ids = [int(r['id']) for r in reader if r.get('id')]
-        return (max(ids) + 1) if ids else 1
-
-def next_notif_id():
-    """Retorna o próximo ID disponível para notificações"""
-    ensure_notifications_csv()
-    with open(NOTIF_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        ids = [int(x['id']) for x in reader if x.get('id')]
-        return (max(ids) + 1) if ids else 1
+# Fração das requisições perfiladas com cProfile (0 desliga)
+PROFILE_RATE = float(os.environ.get('FLUKER_PROFILE_RATE', '0'))
+
+# Só guarda perfis de requisições que levaram pelo menos isso (ms)
+PROFILE_SLOW_MS = float(os.environ.get('FLUKER_PROFILE_SLOW_MS', '200'))
+
+# Endpoints sorteáveis, separados por vírgula (vazio = todos), ex.: home_page,api_messages
+PROFILE_ROUTES = [r.strip() for r in os.environ.get('FLUKER_PROFILE_ROUTES', '').split(',') if r.strip()]
+
+# Pasta rotativa dos perfis e quantos ficam guardados
+PROFILE_DIR = os.environ.get('FLUKER_PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+PROFILE_KEEP = int(os.environ.get('FLUKER_PROFILE_KEEP', '200'))
+
+# Usuários (IDs ou usernames, separados por vírgula) com acesso às rotas de administração
+ADMINS = {a.strip() for a in os.environ.get('FLUKER_ADMINS', '').split(',') if a.strip()}
+
+profiler = RequestProfiler(
+    PROFILE_DIR,
+    rate=PROFILE_RATE,
+    slow_ms=PROFILE_SLOW_MS,
+    routes=PROFILE_ROUTES,
+    keep=PROFILE_KEEP,
+)
+profiler.init_app(app)
 
 # ========================================
-# FUNÇÕES DE HORÁRIO
+# ARMAZENAMENTO
 # ========================================
 
-def to_sp_display(ts_str: str) -> str:
-    """
-    Converte timestamp UTC para horário de São Paulo
-    Aceita formatos: ISO 8601, YYYY-MM-DD HH:MM:SS, DD/MM/YYYY HH:MM
-    Retorna: DD/MM/YYYY HH:MM
-    """
+# Motor de armazenamento: 'csv' (padrão) ou 'sqlite'
+STORAGE_BACKEND = os.environ.get('FLUKER_STORAGE', 'csv')
+SQLITE_PATH = os.environ.get('FLUKER_SQLITE_PATH', os.path.join(DATA_DIR, 'fluker.db'))
+
+# Janela (ms) em que o escritor agrupa mutações do mesmo CSV num único commit
+WRITE_BATCH_MS = float(os.environ.get('FLUKER_WRITE_BATCH_MS', '2'))
+
+# Intervalo (s) entre compactações do log de curtidas em posts.csv
+LIKES_COMPACT_SECONDS = float(os.environ.get('FLUKER_LIKES_COMPACT_SECONDS', '30'))
+
+# Linhas do messages.csv a partir das quais ele é selado num segmento do histórico (0 desliga)
+MESSAGES_SEGMENT_ROWS = int(os.environ.get('FLUKER_MESSAGES_SEGMENT_ROWS', '100000'))
+
+# Timelines materializadas mantidas em memória (as usadas mais recentemente)
+TIMELINE_CACHE = int(os.environ.get('FLUKER_TIMELINE_CACHE', '10000'))
+
+storage = create_storage(
+    STORAGE_BACKEND,
+    data_dir=DATA_DIR,
+    sqlite_path=SQLITE_PATH,
+    write_batch_ms=WRITE_BATCH_MS,
+    likes_compact_seconds=LIKES_COMPACT_SECONDS,
+    message_segment_rows=MESSAGES_SEGMENT_ROWS,
+    timeline_cache=TIMELINE_CACHE,
+)
+
+# Índices em memória prontos antes da primeira requisição
+storage.warm()
+
+@atexit.register
+def _close_storage_on_exit():
     try:
-        if not ts_str:
-            return ""
-        
-        sp_tz = ZoneInfo("America/Sao_Paulo")
-        dt = None
-
-        # Tenta ISO 8601
-        if 'T' in ts_str:
-            try:
-                dt = datetime.fromisoformat(ts_str)
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=timezone.utc)
-            except ValueError:
-                pass
-
-        # Tenta YYYY-MM-DD HH:MM:SS
-        if dt is None:
-            try:
-                dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
-            except ValueError:
-                pass
-
-        # Tenta DD/MM/YYYY HH:MM
-        if dt is None:
-            try:
-                dt = datetime.strptime(ts_str, "%d/%m/%Y %H:%M").replace(tzinfo=timezone.utc)
-            except ValueError:
-                pass
-
-        if dt is None:
-            return ts_str
-
-        return dt.astimezone(sp_tz).strftime("%d/%m/%Y %H:%M")
+        storage.close()
     except Exception:
-        return ts_str
+        pass
+
+# ========================================
+# EVENTOS EM TEMPO REAL
+# ========================================
+
+# Stream SSE (/api/stream); com '0' o cliente fica só no polling
+SSE_ENABLED = os.environ.get('FLUKER_SSE', '1') != '0'
+
+# Duração máxima (s) de uma conexão SSE antes de o cliente reconectar
+STREAM_MAX_SECONDS = float(os.environ.get('FLUKER_STREAM_MAX_SECONDS', '300'))
+
+# Intervalo (s) dos comentários de keep-alive no stream
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get('FLUKER_STREAM_HEARTBEAT_SECONDS', '15'))
+
+# Espera máxima (s) aceita no parâmetro wait (long-polling) de mensagens e notificações
+LONG_POLL_MAX_SECONDS = float(os.environ.get('FLUKER_LONG_POLL_MAX_SECONDS', '25'))
 
+events = EventBus()
+
+def long_poll_seconds():
+    """Valor do parâmetro ?wait= da requisição, limitado a LONG_POLL_MAX_SECONDS"""
+    wait = request.args.get('wait', default=0, type=float) or 0
+    return max(0.0, min(wait, LONG_POLL_MAX_SECONDS))
+
+def publish_like(post_id, author_id, likes, actor_id):
+    """Avisa quem pode ver o post (autor e amigos do autor) que as curtidas mudaram"""
+    audience = set(get_friends(author_id)) | {str(author_id), str(actor_id)}
+    events.publish(audience, 'like', post_id=str(post_id), likes=likes)
+
+def publish_friends(*user_ids):
+    """Avisa os envolvidos que a relação de amizade mudou"""
+    events.publish(user_ids, 'friends')
+
+# ========================================
+# GET CONDICIONAL (ETAG)
+# ========================================
+
+def data_etag(*parts):
+    """ETag a partir das versões dos dados e dos parâmetros que mudam a resposta"""
+    raw = '|'.join(str(p) for p in parts)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=12).hexdigest()
+
+def revalidate(user_id, current_etag, wait=0):
+    """
+    Compara If-None-Match com o ETag atual (current_etag() só lê versões)
+    Com wait, um cliente já atualizado espera (long-polling) o ETag mudar.
+    Retorna (etag, se o cliente já tem esta versão)
+    """
+    etag = current_etag()
+    if not request.if_none_match.contains(etag):
+        return etag, False
+
+    if wait:
+        def changed():
+            new = current_etag()
+            return new if new != etag else None
+
+        etag = events.wait_for(user_id, changed, wait) or etag
+    return etag, request.if_none_match.contains(etag)
+
+def wait_tagged(user_id, current_etag, check, wait):
+    """
+    Long-polling que devolve (etag, resultado do último check())
+    O ETag é lido antes de cada check(): nunca anuncia uma versão mais nova que os dados.
+    """
+    etag = None
+
+    def tagged():
+        nonlocal etag
+        etag = current_etag()
+        return check()
+
+    result = events.wait_for(user_id, tagged, wait)
+    return etag, result
+
+def with_etag(resp, etag):
+    """Anexa o ETag e pede revalidação a cada uso (sem cache compartilhado)"""
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+def not_modified(etag):
+    """Resposta 304 (o cliente já tem esta versão)"""
+    return with_etag(app.response_class(status=304), etag)
+
+# ========================================
+# FUNÇÕES DE HORÁRIO
+# ========================================
+
+@lru_cache(maxsize=None)
 def tz_sp():
-    """Retorna timezone de São Paulo (fallback para UTC se não disponível)"""
+    """Retorna timezone de São Paulo (fallback para UTC se não disponível), criada uma única vez"""
     try:
         return ZoneInfo("America/Sao_Paulo")
     except Exception:
         return timezone.utc
 
+# Horários já formatados: timestamps UTC são agrupados pelo minuto
+# ('YYYY-MM-DDTHH:MM'), os demais pelo texto inteiro
+_display_cache = {}
+_DISPLAY_CACHE_MAX = 50000
+
+def _display_key(ts_str):
+    if ts_str[10:11] == 'T' and (ts_str[-1] == 'Z' or ts_str.endswith('+00:00')):
+        return ts_str[:16]
+    return ts_str
+
+@metrics.timed('to_sp_display')
+def to_sp_display(ts_str: str) -> str:
+    """
+    Converte timestamp UTC para horário de São Paulo
+    Aceita formatos: ISO 8601, YYYY-MM-DD HH:MM:SS, DD/MM/YYYY HH:MM
+    Retorna: DD/MM/YYYY HH:MM
+    """
+    if not ts_str:
+        return ""
+
+    key = _display_key(ts_str)
+    display = _display_cache.get(key)
+    if display is None:
+        dt = parse_timestamp(ts_str)
+        display = dt.astimezone(tz_sp()).strftime("%d/%m/%Y %H:%M") if dt else ts_str
+        if len(_display_cache) >= _DISPLAY_CACHE_MAX:
+            _display_cache.clear()
+        _display_cache[key] = display
+    return display
+
+@metrics.timed('to_sp_display_many')
+def to_sp_display_many(timestamps):
+    """Converte uma lista de timestamps de uma vez (mesma ordem)"""
+    cache = _display_cache
+    result = []
+    for ts_str in timestamps:
+        display = cache.get(_display_key(ts_str)) if ts_str else ""
+        result.append(display if display is not None else to_sp_display(ts_str))
+    return result
+
 # ========================================
 # SISTEMA DE NOTIFICAÇÕES
 # ========================================
 
+# Gravação em segundo plano; com '0' cada notificação é gravada na própria requisição
+NOTIFY_ASYNC = os.environ.get('FLUKER_NOTIFY_ASYNC', '1') != '0'
+
+# Máximo de notificações por lote e janela (ms) de agrupamento da fila
+NOTIFY_BATCH = int(os.environ.get('FLUKER_NOTIFY_BATCH', '500'))
+NOTIFY_LINGER_MS = float(os.environ.get('FLUKER_NOTIFY_LINGER_MS', '5'))
+
+def notification_text(type, actor_name):
+    """Texto automático de cada tipo de notificação"""
+    if type == 'like':
+        return f"{actor_name} curtiu seu post"
+    if type == 'friend_accepted':
+        return f"{actor_name} aceitou sua solicitação de amizade"
+    if type == 'friend_request':
+        return f"{actor_name} enviou uma solicitação de amizade"
+    if type == 'dm':
+        return f"Nova DM de: {actor_name}"
+    return None
+
+def deliver_notifications(items):
+    """
+    Grava um lote de notificações e avisa os destinatários
+    Os nomes dos atores saem de uma única busca; IDs e append são por lote
+    """
+    names = resolve_usernames({actor_id for _, _, actor_id, _, text in items if actor_id and not text})
+    rows = [
+        (user_id, type, actor_id, post_id,
+         text or notification_text(type, names[str(actor_id)] if actor_id else ''))
+        for user_id, type, actor_id, post_id, text in items
+    ]
+    storage.notifications.create_many(rows)
+    for user_id, type, *_ in rows:
+        events.publish([user_id], 'notification', notification_type=type)
+
+notification_queue = NotificationQueue(
+    deliver_notifications,
+    max_batch=NOTIFY_BATCH,
+    linger_ms=NOTIFY_LINGER_MS,
+    synchronous=not NOTIFY_ASYNC,
+)
+
+@atexit.register
+def _flush_notifications_on_exit():
+    # Registrado depois do storage, então roda antes de ele fechar
+    notification_queue.close()
+
+# Retenção: máximo de notificações por usuário e idade máxima em dias (0 desliga cada um)
+NOTIFY_MAX_PER_USER = int(os.environ.get('FLUKER_NOTIFY_MAX_PER_USER', '200'))
+NOTIFY_MAX_AGE_DAYS = float(os.environ.get('FLUKER_NOTIFY_MAX_AGE_DAYS', '90'))
+
+# Intervalo (s) entre passadas do compactador de notificações (0 desliga)
+NOTIFY_COMPACT_SECONDS = float(os.environ.get('FLUKER_NOTIFY_COMPACT_SECONDS', '600'))
+
+# Segmentos mensais com as notificações que saíram da retenção
+ARCHIVE_DIR = os.environ.get('FLUKER_ARCHIVE_DIR', os.path.join(DATA_DIR, 'archive'))
+
+notification_retention = NotificationRetention(
+    ARCHIVE_DIR,
+    max_per_user=NOTIFY_MAX_PER_USER,
+    max_age_days=NOTIFY_MAX_AGE_DAYS,
+)
+notification_compactor = RetentionCompactor(storage.notifications, notification_retention, NOTIFY_COMPACT_SECONDS)
+notification_compactor.start()
+
+@metrics.timed('create_notification')
 def create_notification(user_id, type, actor_id=None, post_id=None, text=None):
     """
-    Cria uma nova notificação para o usuário
+    Enfileira uma nova notificação para o usuário (gravada em segundo plano)
     Tipos: 'like', 'friend_accepted', 'friend_request', 'dm'
+    Sem texto, usa o texto automático do tipo com o nome do ator
     """
-    ensure_notifications_csv()
-    
-    # Gera texto automático se não fornecido
-    if not text:
-        actor_name = ''
-        if actor_id:
-            u = get_user_by_id(actor_id)
-            actor_name = u['username'] if u else f"user_{actor_id}"
-        
-        if type == 'like':
-            text = f"{actor_name} curtiu seu post"
-        elif type == 'friend_accepted':
-            text = f"{actor_name} aceitou sua solicitação de amizade"
-        elif type == 'friend_request':
-            text = f"{actor_name} enviou uma solicitação de amizade"
-        elif type == 'dm':
-            text = f"Nova DM de: {actor_name}"
-    
-    # Salva no CSV
-    with open(NOTIF_PATH, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([
-            next_notif_id(),
-            str(user_id),
-            type,
-            str(actor_id) if actor_id else '',
-            str(post_id) if post_id else '',
-            datetime.now(timezone.utc).isoformat(),
-            '0',  # não lida
-            text
-        ])
+    notification_queue.submit((str(user_id), type, actor_id, post_id, text))
 
 # ========================================
 # UTILITÁRIOS DE USUÁRIOS
 # ========================================
 
-def get_all_users():
-    """Retorna todos os usuários cadastrados (sem senha)"""
-    ensure_csv()
-    users = []
-    with open(CSV_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            users.append({
-                'id': r['id'],
-                'username': r['username'],
-                'email': r['email'],
-            })
-    return users
-
 def user_exists(user_id):
     """Verifica se um usuário existe pelo ID"""
-    ensure_csv()
-    with open(CSV_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            if r.get('id') == str(user_id):
-                return True
-    return False
+    return storage.users.exists(user_id)
 
 def get_user_by_id(user_id):
     """Busca usuário por ID (sem senha)"""
-    ensure_csv()
-    with open(CSV_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            if r.get('id') == str(user_id):
-                return {
-                    'id': r['id'],
-                    'username': r['username'],
-                    'email': r['email']
-                }
-    return None
+    return storage.users.get(user_id)
+
+@metrics.timed('resolve_usernames')
+def resolve_usernames(user_ids):
+    """
+    Resolve vários IDs para username numa única busca
+    IDs sem usuário viram 'user_<id>'
+    """
+    ids = [str(uid) for uid in user_ids]
+    found = storage.users.get_many(ids)
+    return {uid: found[uid]['username'] if uid in found else f"user_{uid}" for uid in ids}
+
+# ========================================
+# FEED
+# ========================================
+
+# Posts por página do feed (e limite máximo aceito em ?limit=)
+FEED_PAGE_SIZE = int(os.environ.get('FLUKER_FEED_PAGE_SIZE', '20'))
+FEED_MAX_PAGE_SIZE = 100
+
+def feed_page_limit():
+    """Valor de ?limit= da requisição, entre 1 e FEED_MAX_PAGE_SIZE"""
+    limit = request.args.get('limit', default=FEED_PAGE_SIZE, type=int) or FEED_PAGE_SIZE
+    return max(1, min(limit, FEED_MAX_PAGE_SIZE))
+
+@metrics.timed('load_feed_page')
+def load_feed_page(user_id, before_id=None, limit=FEED_PAGE_SIZE):
+    """
+    Uma página do feed já pronta para exibir (horário de SP e curtidas)
+    Retorna (posts, before_id da próxima página ou None)
+    """
+    rows, next_before_id = storage.timeline.page(user_id, before_id, limit)
+    displays = to_sp_display_many([p.get('timestamp', '') for p in rows])
+    states = storage.likes.states([p['id'] for p in rows], user_id)
+    posts = []
+    for p, ts_disp in zip(rows, displays):
+        likes, liked = states.get(p['id'], (0, False))
+        posts.append(dict(
+            p,
+            timestamp_display=ts_disp,
+            likes=likes,
+            liked_by_me=liked,
+        ))
+    return posts, next_before_id
 
 # ========================================
 # DECORATOR DE AUTENTICAÇÃO
@@ -266,96 +412,60 @@ def login_required(view_func):
         return view_func(*args, **kwargs)
     return wrapper
 
+def is_admin():
+    """O usuário logado está em FLUKER_ADMINS (por ID ou username)"""
+    return str(session.get('user_id')) in ADMINS or session.get('username') in ADMINS
+
+def admin_required(view_func):
+    """Protege rotas de administração (exige login e FLUKER_ADMINS)"""
+    @wraps(view_func)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'error': 'acesso restrito a administradores'}), 403
+        return view_func(*args, **kwargs)
+    return wrapper
+
 # ========================================
 # SISTEMA DE AMIZADES
 # ========================================
 
+@metrics.timed('get_friends')
 def get_friends(user_id):
     """Retorna lista de IDs dos amigos mútuos do usuário"""
-    ensure_friends_csv()
-    friends = []
-    user_id_str = str(user_id)
-    
-    with open(FRIENDS_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Status '1' = amizade aceita
-            if row['status'] == '1':
-                if row['user1_id'] == user_id_str and row['user2_id'] != user_id_str:
-                    friends.append(row['user2_id'])
-                elif row['user2_id'] == user_id_str and row['user1_id'] != user_id_str:
-                    friends.append(row['user1_id'])
-    
-    return friends
+    return storage.friends.friends_of(user_id)
 
 def get_friend_requests(user_id):
     """Retorna solicitações de amizade pendentes recebidas pelo usuário"""
-    ensure_friends_csv()
-    requests = []
-    user_id_str = str(user_id)
+    rows = storage.friends.incoming_requests(user_id)
+    names = resolve_usernames(row['user1_id'] for row in rows)
     
-    with open(FRIENDS_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Status '0' = pendente, user2 é quem recebe
-            if row['user2_id'] == user_id_str and row['status'] == '0':
-                u = get_user_by_id(row['user1_id'])
-                requests.append({
-                    'user_id': row['user1_id'],
-                    'username': u['username'] if u else f"user_{row['user1_id']}",
-                    'timestamp': row['timestamp']
-                })
-    
-    return requests
+    return [
+        {
+            'user_id': row['user1_id'],
+            'username': names[row['user1_id']],
+            'timestamp': row['timestamp']
+        }
+        for row in rows
+    ]
 
 def are_friends(user1_id, user2_id):
     """Verifica se dois usuários são amigos mútuos"""
     if str(user1_id) == str(user2_id):
         return True
     
-    user1_friends = get_friends(user1_id)
-    return str(user2_id) in user1_friends
+    return storage.friends.are_friends(user1_id, user2_id)
 
 def send_friend_request(sender_id, receiver_id):
     """Envia uma solicitação de amizade (cria pendência)"""
-    ensure_friends_csv()
-    s = str(sender_id)
-    r = str(receiver_id)
-    
-    if s == r:
+    if str(sender_id) == str(receiver_id):
         return False
     
-    # Verifica se já existe alguma relação
-    with open(FRIENDS_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if ((row['user1_id'] == s and row['user2_id'] == r) or
-                (row['user1_id'] == r and row['user2_id'] == s)):
-                return False
-    
-    # Cria nova solicitação pendente
-    with open(FRIENDS_PATH, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([
-            s, r, '0', datetime.now().strftime('%d/%m/%Y %H:%M')
-        ])
-    
-    return True
+    return storage.friends.create_request(sender_id, receiver_id)
 
 def check_pending_request(user1_id, user2_id):
     """Verifica se existe solicitação pendente entre dois usuários"""
-    ensure_friends_csv()
-    a = str(user1_id)
-    b = str(user2_id)
-    
-    with open(FRIENDS_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row['status'] == '0':
-                if ((row['user1_id'] == a and row['user2_id'] == b) or
-                    (row['user1_id'] == b and row['user2_id'] == a)):
-                    return True
-    
-    return False
+    return storage.friends.has_pending(user1_id, user2_id)
 
 def update_friend_request_status(requester_id: str, target_id: str, new_status: str) -> bool:
     """
@@ -363,107 +473,23 @@ def update_friend_request_status(requester_id: str, target_id: str, new_status:
     new_status: '1' (aceita) ou '2' (rejeitada)
     Retorna True se atualizou alguma linha
     """
-    ensure_friends_csv()
-    requester_id = str(requester_id)
-    target_id = str(target_id)
-    updated = False
-    rows = []
-    fieldnames = ['user1_id', 'user2_id', 'status', 'timestamp']
-
-    # Lê todas as linhas
-    with open(FRIENDS_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        if reader.fieldnames:
-            fieldnames = reader.fieldnames
-        
-        for row in reader:
-            # Atualiza se encontrar a solicitação pendente
-            if (row.get('user1_id') == requester_id and
-                row.get('user2_id') == target_id and
-                row.get('status') == '0'):
-                row['status'] = str(new_status)
-                updated = True
-            rows.append(row)
-
-    # Reescreve o arquivo se houve mudança
-    if updated:
-        with open(FRIENDS_PATH, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
-
-    return updated
+    return storage.friends.update_status(requester_id, target_id, new_status)
 
 def delete_pending_friend_request(requester_id: str, target_id: str) -> bool:
     """
-    Remove uma solicitação pendente do CSV
+    Remove uma solicitação pendente
     Usado para rejeitar solicitações
     """
-    ensure_friends_csv()
-    requester_id = str(requester_id)
-    target_id = str(target_id)
-
-    # Lê todas as linhas
-    with open(FRIENDS_PATH, 'r', newline='', encoding='utf-8') as f:
-        rows = list(csv.DictReader(f))
-        fieldnames = rows[0].keys() if rows else ['user1_id', 'user2_id', 'status', 'timestamp']
-
-    before = len(rows)
-    
-    # Filtra removendo a solicitação pendente
-    rows = [
-        r for r in rows
-        if not (r.get('user1_id') == requester_id and 
-                r.get('user2_id') == target_id and 
-                r.get('status') == '0')
-    ]
-    
-    removed_any = len(rows) < before
-
-    # Reescreve se removeu algo
-    if removed_any:
-        with open(FRIENDS_PATH, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
-
-    return removed_any
+    return storage.friends.delete_pending(requester_id, target_id)
 
 def remove_friend_request_notifications(target_user_id: str, requester_id: str) -> int:
     """
     Remove notificações de solicitação de amizade após aceitar/rejeitar
     Retorna quantas foram removidas
     """
-    ensure_notifications_csv()
-    target_user_id = str(target_user_id)
-    requester_id = str(requester_id)
-
-    # Lê todas as notificações
-    with open(NOTIF_PATH, 'r', newline='', encoding='utf-8') as f:
-        rows = list(csv.DictReader(f))
-        fieldnames = rows[0].keys() if rows else [
-            'id', 'user_id', 'type', 'actor_id', 'message_id', 'timestamp', 'read', 'text'
-        ]
-
-    before = len(rows)
-    
-    # Remove notificações de friend_request relacionadas
-    rows = [
-        r for r in rows
-        if not (r.get('user_id') == target_user_id and
-                r.get('type') == 'friend_request' and
-                r.get('actor_id') == requester_id)
-    ]
-    
-    removed = before - len(rows)
-
-    # Reescreve o arquivo
-    with open(NOTIF_PATH, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-
-    return removed
+    # Uma solicitação ainda na fila seria gravada depois da remoção
+    notification_queue.flush()
+    return storage.notifications.remove_friend_requests(target_user_id, requester_id)
 
 # ========================================
 # ROTAS - PÁGINAS PÚBLICAS
@@ -491,44 +517,32 @@ def recover_page():
 @app.route('/salvar', methods=['POST'])
 def salvar():
     """Cria uma nova conta de usuário"""
-    ensure_csv()
     username = request.form.get('usuario', '').strip()
     password = request.form.get('senha', '').strip()
     email = request.form.get('email', '').strip()
 
     # Adiciona novo usuário
-    with open(CSV_PATH, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([next_id(), username, password, email])
+    storage.users.create(username, password, email)
 
     return redirect(url_for('index'))
 
 @app.post('/login')
 def login():
     """Faz login com username ou email"""
-    ensure_csv()
     login_input = request.form.get('usuario', '').strip()
     password = request.form.get('senha', '').strip()
 
     if not login_input or not password:
         return redirect(url_for('index'))
 
-    # Procura credenciais no CSV
-    with open(CSV_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            row_user = (row.get('username') or '').strip()
-            row_email = (row.get('email') or '').strip()
-            row_pass = (row.get('password') or '').strip()
-
-            credencial_ok = (login_input == row_user) or (login_input == row_email)
-            senha_ok = (password == row_pass)
-
-            if credencial_ok and senha_ok:
-                # Login bem-sucedido
-                session['user_id'] = row.get('id')
-                session['username'] = row_user
-                session['email'] = row_email
-                return redirect(url_for('home_page'))
+    # Procura credenciais
+    user = storage.users.authenticate(login_input, password)
+    if user:
+        # Login bem-sucedido
+        session['user_id'] = user['id']
+        session['username'] = user['username']
+        session['email'] = user['email']
+        return redirect(url_for('home_page'))
 
     # Credenciais inválidas
     return redirect(url_for('index', erro=1))
@@ -546,30 +560,16 @@ def logout():
 @app.get('/home')
 @login_required
 def home_page():
-    """Feed principal com posts do usuário e amigos"""
-    ensure_posts_csv()
+    """
+    Feed principal com posts do usuário e amigos
+    Paginado por chave: ?before_id=<id> traz os posts mais antigos que ele
+    """
     me = str(session.get('user_id'))
+    before_id = request.args.get('before_id', type=int)
+    limit = feed_page_limit()
 
-    # Carrega todos os posts
-    with open(POSTS_PATH, 'r', newline='', encoding='utf-8') as f:
-        all_posts = list(csv.DictReader(f))
-
-    # Pega lista de amigos
-    my_friends = set(get_friends(me))
-
-    # Filtra posts: meus ou de amigos
-    visible_posts = []
-    for p in all_posts:
-        author_id = p.get('author_id')
-        if not author_id:
-            continue
-        
-        if author_id == me or author_id in my_friends:
-            p['timestamp_display'] = to_sp_display(p.get('timestamp', ''))
-            visible_posts.append(p)
-
-    # Ordena do mais recente para o mais antigo
-    visible_posts.sort(key=lambda x: int(x['id']), reverse=True)
+    # Página da timeline (mais recentes primeiro)
+    visible_posts, next_before_id = load_feed_page(me, before_id, limit)
 
     # Pega solicitações pendentes
     pending_requests = get_friend_requests(me)
@@ -577,6 +577,7 @@ def home_page():
     return render_template(
         'feed.html',
         posts=visible_posts,
+        next_before_id=next_before_id,
         username=session.get('username'),
         user_id=me,
         friend_requests=pending_requests
@@ -596,21 +597,18 @@ def perfil(user_id):
     if not profile_user:
         return redirect(url_for('home_page'))
 
-    # Carrega posts do usuário
-    ensure_posts_csv()
-    user_posts = []
-    with open(POSTS_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get('author_id') == str(user_id):
-                user_posts.append(row)
-
-    # Ordena e pega os 3 mais recentes
-    user_posts.sort(key=lambda x: int(x['id']), reverse=True)
-    recent_posts = user_posts[:3]
-    
-    for p in recent_posts:
-        p['timestamp_display'] = to_sp_display(p.get('timestamp', ''))
+    # Só os 3 posts mais recentes do usuário
+    user_posts, _ = storage.posts.page_by_author(user_id, limit=3)
+    displays = to_sp_display_many([p.get('timestamp', '') for p in user_posts])
+    states = storage.likes.states([p['id'] for p in user_posts], session.get('user_id'))
+    recent_posts = [
+        dict(
+            p,
+            timestamp_display=ts_disp,
+            likes=states.get(p['id'], (0, False))[0],
+        )
+        for p, ts_disp in zip(user_posts, displays)
+    ]
 
     # Verifica relação com o usuário atual
     current_user_id = str(session.get('user_id'))
@@ -638,23 +636,13 @@ def perfil(user_id):
 @login_required
 def postar():
     """Cria um novo post no feed"""
-    ensure_posts_csv()
     content = request.form.get('content', '').strip()
     
     if not content:
         return redirect(url_for('home_page'))
 
     # Salva post com curtidas zeradas
-    with open(POSTS_PATH, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([
-            next_post_id(),
-            session['user_id'],
-            session['username'],
-            datetime.now(timezone.utc).isoformat(),
-            content,
-            0,   # likes
-            ''   # likes_by
-        ])
+    storage.posts.create(session['user_id'], session['username'], content)
     
     return redirect(url_for('home_page'))
 
@@ -662,49 +650,13 @@ def postar():
 @login_required
 def curtir(post_id):
     """Curte ou descurte um post (toggle)"""
-    ensure_posts_csv()
     me = str(session.get('user_id'))
 
-    # Lê todos os posts
-    with open(POSTS_PATH, 'r', newline='', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        posts = list(reader)
-        fieldnames = list(reader.fieldnames or [])
-
-    # Garante que a coluna likes_by existe
-    if 'likes_by' not in fieldnames:
-        fieldnames.append('likes_by')
-        for p in posts:
-            if 'likes_by' not in p:
-                p['likes_by'] = ''
-
-    post_author_id = None
-    was_liked = False
-
-    # Processa o toggle de curtida
-    for p in posts:
-        if int(p['id']) == post_id:
-            post_author_id = p.get('author_id')
-            likes_by = [x for x in (p.get('likes_by') or '').split(';') if x]
-            
-            if me in likes_by:
-                # Remove curtida
-                likes_by = [x for x in likes_by if x != me]
-                was_liked = False
-            else:
-                # Adiciona curtida
-                likes_by.append(me)
-                was_liked = True
-            
-            p['likes_by'] = ';'.join(likes_by)
-            p['likes'] = str(len(likes_by))
-            break
-
-    # Reescreve o arquivo
-    with open(POSTS_PATH, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(posts)
+    # Registra a curtida
+    toggled = storage.likes.toggle(post_id, me)
+    was_liked, likes_count, post_author_id = toggled if toggled else (False, 0, None)
+    if toggled:
+        publish_like(post_id, post_author_id, likes_count, me)
 
     # Cria notificação se curtiu post de outro usuário
     if was_liked and post_author_id and post_author_id != me:
@@ -728,6 +680,7 @@ def add_friend(user_id):
     sender_id = str(session.get('user_id'))
     
     if send_friend_request(sender_id, user_id):
+        publish_friends(sender_id, user_id)
         create_notification(
             user_id=user_id,
             type='friend_request',
@@ -743,6 +696,7 @@ def accept_friend(user_id):
     """Aceita solicitação de amizade (rota legada, use a API)"""
     receiver_id = str(session.get('user_id'))
     update_friend_request_status(user_id, receiver_id, '1')
+    publish_friends(user_id, receiver_id)
     
     # Remove notificação de solicitação
     remove_friend_request_notifications(receiver_id, user_id)
@@ -761,25 +715,67 @@ def accept_friend(user_id):
 # API - USUÁRIOS
 # ========================================
 
+def friend_users(user_id, friend_ids):
+    """Dados públicos dos amigos, na ordem do cadastro (por ID)"""
+    friends = storage.users.get_many(f for f in friend_ids if f != str(user_id))
+    return sorted(friends.values(), key=lambda u: int(u['id']) if u['id'].isdigit() else 0)
+
 @app.get('/api/friends')
 @login_required
 def api_users():
     """Lista apenas amigos mútuos (para o chat)"""
     uid = str(session.get('user_id'))
-    all_users = get_all_users()
-    friends = get_friends(uid)
-    
-    # Filtra apenas amigos
-    users = [u for u in all_users if u['id'] != uid and u['id'] in friends]
+    etag, fresh = revalidate(uid, lambda: data_etag('friends', uid, storage.friends.version(uid)))
+    if fresh:
+        return not_modified(etag)
+
+    return with_etag(jsonify({'users': friend_users(uid, get_friends(uid))}), etag)
+
+@app.get('/api/users/<user_id>/posts')
+@login_required
+def api_user_posts(user_id):
+    """Posts de um usuário, mais recentes primeiro (?before_id=&limit=)"""
+    me = str(session.get('user_id'))
+    if not user_exists(user_id):
+        return jsonify({'error': 'usuário não encontrado'}), 404
+
+    before_id = request.args.get('before_id', type=int)
+    rows, next_before_id = storage.posts.page_by_author(user_id, before_id, feed_page_limit())
+
+    items = []
+    displays = to_sp_display_many([p.get('timestamp', '') for p in rows])
+    states = storage.likes.states([p['id'] for p in rows], me)
+    for p, ts_disp in zip(rows, displays):
+        likes, liked = states.get(p['id'], (0, False))
+        items.append({
+            'id': int(p['id']),
+            'author_id': p['author_id'],
+            'author_name': p['author_name'],
+            'timestamp_display': ts_disp,
+            'content': p['content'],
+            'likes': likes,
+            'liked_by_me': liked,
+        })
     
-    return jsonify({'users': users})
+    return jsonify({
+        'posts': items,
+        'next_before_id': int(next_before_id) if next_before_id else None,
+    })
+
+# Resultados da busca de usuários (padrão e máximo aceito em ?limit=)
+USER_SEARCH_LIMIT = 10
+USER_SEARCH_MAX_LIMIT = 50
 
-@app.get('/api/users')
+@app.get('/api/users/search')
 @login_required
-def api_all_users():
-    """Lista todos os usuários (para busca)"""
+def api_search_users():
+    """Usuários cujo username ou email começa com ?q= (até ?limit=)"""
     uid = str(session.get('user_id'))
-    users = [u for u in get_all_users() if u['id'] != uid]
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', default=USER_SEARCH_LIMIT, type=int) or USER_SEARCH_LIMIT
+    limit = max(1, min(limit, USER_SEARCH_MAX_LIMIT))
+
+    users = storage.users.search(query, limit, exclude_id=uid) if query else []
     
     return jsonify({'users': users})
 
@@ -787,54 +783,62 @@ def api_all_users():
 # API - MENSAGENS (CHAT DM)
 # ========================================
 
+def message_items(rows):
+    """Mensagens no formato da API (horário de SP, ordem de ID)"""
+    items = []
+    displays = to_sp_display_many([r.get('timestamp', '') for r in rows])
+    for r, ts_disp in zip(rows, displays):
+        items.append({
+            'id': int(r['id']),
+            'sender_id': r['sender_id'],
+            'receiver_id': r['receiver_id'],
+            'timestamp_display': ts_disp,
+            'content': r['content'],
+        })
+    
+    # Ordena por ID
+    items.sort(key=lambda x: x['id'])
+    return items
+
 @app.get('/api/messages')
 @login_required
 def api_messages():
-    """Busca mensagens entre mim e outro usuário (apenas amigos)"""
+    """
+    Busca mensagens entre mim e outro usuário (apenas amigos)
+    Com ?wait=<s>, segura a requisição até chegar mensagem nova (long-polling)
+    Com If-None-Match, responde 304 se a conversa não mudou
+    """
     partner_id = request.args.get('partner_id', type=str)
     since_id = request.args.get('since_id', default=0, type=int)
+    wait = long_poll_seconds()
     me = str(session.get('user_id'))
 
     # Valida se são amigos
     if not partner_id or not user_exists(partner_id) or not are_friends(me, partner_id):
         return jsonify({'error': 'partner_id inválido ou não são amigos'}), 400
 
-    ensure_messages_csv()
-    items = []
-    
+    def current_etag():
+        return data_etag(
+            'messages', me, partner_id, since_id,
+            storage.messages.version(me, partner_id), storage.friends.version(me),
+        )
+
+    etag, fresh = revalidate(me, current_etag, wait)
+    if fresh:
+        return not_modified(etag)
+    if request.if_none_match:
+        wait = 0  # o cliente tem uma versão anterior: responde já
+
     # Lê mensagens entre os dois usuários
-    with open(MESSAGES_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            if not r.get('id'):
-                continue
-            
-            try:
-                mid = int(r['id'])
-            except:
-                continue
-            
-            # Pula mensagens antigas (polling incremental)
-            if mid <= since_id:
-                continue
-            
-            s = r['sender_id']
-            t = r['receiver_id']
-            
-            # Filtra conversas entre me e partner
-            if (s == me and t == partner_id) or (s == partner_id and t == me):
-                items.append({
-                    'id': mid,
-                    'sender_id': s,
-                    'receiver_id': t,
-                    'timestamp_display': to_sp_display(r.get('timestamp', '')),
-                    'content': r['content'],
-                })
-    
-    # Ordena por ID
-    items.sort(key=lambda x: x['id'])
+    def load():
+        return storage.messages.conversation(me, partner_id, since_id)
+
+    if wait:
+        etag, rows = wait_tagged(me, current_etag, load, wait)
+    else:
+        rows = load()
     
-    return jsonify({'messages': items})
+    return with_etag(jsonify({'messages': message_items(rows)}), etag)
 
 @app.post('/api/send')
 @login_required
@@ -853,12 +857,8 @@ def api_send():
         return jsonify({'error': 'Mensagem vazia'}), 400
 
     # Salva mensagem
-    ensure_messages_csv()
-    mid = next_message_id()
-    now = datetime.now(timezone.utc).isoformat()
-    
-    with open(MESSAGES_PATH, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([mid, me, partner_id, now, content])
+    mid, now = storage.messages.create(me, partner_id, content)
+    events.publish([me, partner_id], 'dm', message_id=mid, sender_id=me, receiver_id=partner_id)
 
     # Cria notificação para o destinatário
     sender_name = session.get('username') or f'user_{me}'
@@ -872,6 +872,36 @@ def api_send():
     
     return jsonify({'ok': True, 'id': mid, 'timestamp': now})
 
+# ========================================
+# API - FEED
+# ========================================
+
+@app.get('/api/feed')
+@login_required
+def api_feed():
+    """Página do feed em JSON (?before_id=&limit=)"""
+    me = str(session.get('user_id'))
+    before_id = request.args.get('before_id', type=int)
+    posts, next_before_id = load_feed_page(me, before_id, feed_page_limit())
+
+    items = [
+        {
+            'id': int(p['id']),
+            'author_id': p['author_id'],
+            'author_name': p['author_name'],
+            'timestamp_display': p['timestamp_display'],
+            'content': p['content'],
+            'likes': p['likes'],
+            'liked_by_me': p['liked_by_me'],
+        }
+        for p in posts
+    ]
+    
+    return jsonify({
+        'posts': items,
+        'next_before_id': int(next_before_id) if next_before_id else None,
+    })
+
 # ========================================
 # API - CURTIDAS
 # ========================================
@@ -879,79 +909,62 @@ def api_send():
 @app.get('/api/post_likes')
 @login_required
 def api_post_likes():
-    """Retorna estado de curtidas de todos os posts (para sincronização)"""
-    ensure_posts_csv()
-    result = {}
+    """
+    Estado das curtidas (para sincronização)
+    Com ?ids=1,2,3 (posts na tela) e ?since=<versão>, devolve só os posts
+    que mudaram desde a versão informada, ou 304 se nenhum mudou.
+    A versão atual vai no corpo e no cabeçalho X-Likes-Version.
+    Cada post vem como {likes, liked_by_me}. Sem ids, devolve o mapa completo
+    de todos os posts, que também traz likes_by (IDs separados por ';').
+    Com If-None-Match, responde 304 se nenhuma curtida mudou.
+    """
+    ids_param = request.args.get('ids')
+    me = str(session.get('user_id'))
+    since = request.args.get('since', '')
+
+    etag, fresh = revalidate(me, lambda: data_etag('likes', me, ids_param, since, storage.likes.version()))
+    if fresh:
+        return not_modified(etag)
+    
+    if ids_param is None:
+        result = {}
+        for pid, likers in storage.likes.snapshot().items():
+            result[pid] = {
+                'likes': len(likers),
+                'likes_by': ';'.join(sorted(likers, key=int)),
+                'liked_by_me': me in likers,
+            }
+        return with_etag(jsonify(result), etag)
+
+    post_ids = [p for p in ids_param.split(',') if p.strip()][:500]
     
-    with open(POSTS_PATH, 'r', newline='', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            pid = r.get('id')
-            if not pid:
-                continue
-            
-            likes_by = (r.get('likes_by') or '').strip()
-            
-            try:
-                likes = int(r.get('likes') or 0)
-            except:
-                likes = 0
-            
-            result[pid] = {'likes': likes, 'likes_by': likes_by}
+    version, changed = storage.likes.changed_since(since, post_ids, me)
     
-    return jsonify(result)
+    # Nada mudou nos posts visíveis
+    if since and not changed:
+        resp = not_modified(etag)
+        resp.headers['X-Likes-Version'] = version
+        return resp
+
+    posts = {
+        pid: {'likes': likes, 'liked_by_me': liked}
+        for pid, (likes, liked) in changed.items()
+    }
+    resp = with_etag(jsonify({'version': version, 'posts': posts}), etag)
+    resp.headers['X-Likes-Version'] = version
+    return resp
 
 @app.post('/api/toggle_like/<int:post_id>')
 @login_required
 def api_toggle_like(post_id):
     """Toggle de curtida via API (para React)"""
-    ensure_posts_csv()
     me = str(session.get('user_id'))
 
-    # Lê todos os posts
-    with open(POSTS_PATH, 'r', newline='', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        posts = list(reader)
-        fieldnames = list(reader.fieldnames or [])
-
-    # Garante colunas necessárias
-    required_fields = ['id', 'author_id', 'author_name', 'timestamp', 'content', 'likes', 'likes_by']
-    for rf in required_fields:
-        if rf not in fieldnames:
-            fieldnames.append(rf)
-    
-    for p in posts:
-        for rf in required_fields:
-            if rf not in p:
-                p[rf] = ''
-
-    post_author_id = None
-    liked_now = False
-    new_likes_count = 0
-
-    # Processa toggle
-    for p in posts:
-        if int(p['id']) == post_id:
-            post_author_id = p.get('author_id')
-            likes_by = [x for x in (p.get('likes_by') or '').split(';') if x]
-            
-            if me in likes_by:
-                likes_by = [x for x in likes_by if x != me]
-                liked_now = False
-            else:
-                likes_by.append(me)
-                liked_now = True
-            
-            p['likes_by'] = ';'.join(likes_by)
-            p['likes'] = str(len(likes_by))
-            new_likes_count = len(likes_by)
-            break
-
-    # Reescreve arquivo
-    with open(POSTS_PATH, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(posts)
+    # Registra a curtida
+    toggled = storage.likes.toggle(post_id, me)
+    liked_now, new_likes_count, post_author_id = toggled if toggled else (False, 0, None)
+    if toggled:
+        publish_like(post_id, post_author_id, new_likes_count, me)
 
     # Cria notificação se curtiu
     if liked_now and post_author_id and post_author_id != me:
@@ -965,88 +978,87 @@ def api_toggle_like(post_id):
     return jsonify({
         'success': True,
         'likes': new_likes_count,
-        'liked': liked_now,
+        'liked_by_me': liked_now,
     })
 
 # ========================================
 # API - NOTIFICAÇÕES
 # ========================================
 
-@app.get('/api/notifications')
-@login_required
-def api_notifications():
-    """Lista notificações do usuário atual"""
-    ensure_notifications_csv()
-    me = str(session.get('user_id'))
+def notification_items(rows):
+    """Notificações no formato da API (texto com o horário de SP)"""
     items = []
     
-    # Lê notificações do usuário
-    with open(NOTIF_PATH, 'r', newline='', encoding='utf-8') as f:
-        for r in csv.DictReader(f):
-            if r.get('user_id') != me:
-                continue
-
-            # Converte timestamp para horário de SP
-            ts_iso = r.get('timestamp', '')
-            ts_disp = to_sp_display(ts_iso)
-
-            # Monta texto com horário
-            base_text = r.get('text') or 'Nova notificação'
-            
-            if ts_disp and f"({ts_disp})" not in base_text:
-                composed_text = f"{base_text} ({ts_disp})"
-            else:
-                composed_text = base_text
+    # Converte timestamps para horário de SP (de uma vez)
+    displays = to_sp_display_many([r.get('timestamp', '') for r in rows])
 
-            # Monta item
-            item = dict(r)
-            item['timestamp_display'] = ts_disp
-            item['text'] = composed_text
-            item.pop('timestamp', None)
+    for r, ts_disp in zip(rows, displays):
+        # Monta texto com horário
+        base_text = r.get('text') or 'Nova notificação'
+        
+        if ts_disp and f"({ts_disp})" not in base_text:
+            composed_text = f"{base_text} ({ts_disp})"
+        else:
+            composed_text = base_text
+
+        # Monta item
+        item = dict(r)
+        item['timestamp_display'] = ts_disp
+        item['text'] = composed_text
+        item.pop('timestamp', None)
+
+        items.append(item)
+    
+    return items
 
-            items.append(item)
+@app.get('/api/notifications')
+@login_required
+def api_notifications():
+    """
+    Lista notificações do usuário atual
+    Com ?wait=<s>&since_id=<id da mais recente que o cliente tem>, segura a
+    requisição até a lista mudar (long-polling)
+    Com If-None-Match, responde 304 (ou espera, com wait) se nada mudou
+    """
+    me = str(session.get('user_id'))
+    wait = long_poll_seconds()
+    since_id = request.args.get('since_id', type=str)
 
-    # Ordena por ID decrescente
-    def sort_key(x):
-        try:
-            return int(x.get('id') or 0)
-        except:
-            return 0
+    def current_etag():
+        return data_etag('notifications', me, storage.notifications.version(me))
 
-    items.sort(key=sort_key, reverse=True)
+    etag, fresh = revalidate(me, current_etag, wait)
+    if fresh:
+        return not_modified(etag)
+    if request.if_none_match:
+        wait = 0  # o cliente tem uma versão anterior: responde já
     
-    # Conta não lidas
-    unread = sum(1 for x in items if (x.get('read') or '0') == '0')
+    # Só as 50 mais recentes (já em ordem decrescente) e o total de não lidas
+    def load():
+        return storage.notifications.latest(me, 50)
+
+    def changed():
+        latest = load()
+        newest = latest[0][0]['id'] if latest[0] else '0'
+        return latest if newest != since_id else None
+
+    if wait and since_id is not None:
+        etag, latest = wait_tagged(me, current_etag, changed, wait)
+        rows, unread = latest or load()
+    else:
+        rows, unread = load()
     
-    return jsonify({'unread': unread, 'items': items[:50]})
+    return with_etag(jsonify({'unread': unread, 'items': notification_items(rows)}), etag)
 
 @app.post('/api/notifications/mark_all_read')
 @login_required
 def api_notifications_mark_all_read():
-    """Marca todas as notificações como lidas e remove do CSV"""
-    ensure_notifications_csv()
+    """Marca todas as notificações como lidas e remove do armazenamento"""
     me = str(session.get('user_id'))
 
-    # Lê todas as notificações
-    with open(NOTIF_PATH, 'r', newline='', encoding='utf-8') as f:
-        rows = list(csv.DictReader(f))
-        fieldnames = rows[0].keys() if rows else [
-            'id', 'user_id', 'type', 'actor_id', 'message_id', 'timestamp', 'read', 'text'
-        ]
-
-    # Marca minhas notificações como lidas
-    for r in rows:
-        if r.get('user_id') == me:
-            r['read'] = '1'
-
-    # Remove as que ficaram lidas (minhas)
-    rows = [r for r in rows if not (r.get('user_id') == me and (r.get('read') or '0') == '1')]
-
-    # Reescreve o CSV
-    with open(NOTIF_PATH, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    # Minhas notificações ficam lidas e saem do armazenamento
+    storage.notifications.clear_user(me)
+    events.publish([me], 'notification', notification_type='read')
 
     return jsonify({'ok': True})
 
@@ -1070,6 +1082,7 @@ def api_friend_request_accept():
     
     if not ok:
         return jsonify({'ok': False, 'error': 'Solicitação não encontrada ou já processada'}), 400
+    publish_friends(requester_id, me)
 
     # Remove notificação de solicitação
     remove_friend_request_notifications(target_user_id=me, requester_id=requester_id)
@@ -1079,7 +1092,7 @@ def api_friend_request_accept():
         user_id=requester_id,
         type='friend_accepted',
         actor_id=me,
-        text=f"{get_user_by_id(me)['username']} aceitou sua solicitação de amizade!"
+        text=f"{resolve_usernames([me])[me]} aceitou sua solicitação de amizade!"
     )
     
     return jsonify({'ok': True})
@@ -1100,23 +1113,241 @@ def api_friend_request_reject():
     
     if not removed:
         return jsonify({'ok': False, 'error': 'Solicitação não encontrada ou já processada'}), 400
+    publish_friends(requester_id, me)
 
     # Remove notificações relacionadas
     remove_friend_request_notifications(target_user_id=me, requester_id=requester_id)
 
     return jsonify({'ok': True})
 
+# ========================================
+# API - SINCRONIZAÇÃO
+# ========================================
+
+# Seções aceitas em /api/sync (?include=)
+SYNC_SECTIONS = ('messages', 'likes', 'notifications', 'friends')
+
+@app.get('/api/sync')
+@login_required
+def api_sync():
+    """
+    Todas as atualizações do cliente numa só requisição
+    ?include= escolhe as seções; cada uma tem seu cursor e só vem na resposta se mudou:
+    - messages: partner_id e since_id (último ID recebido da conversa aberta)
+    - likes: likes_ids (posts na tela) e likes_since (versão das curtidas)
+    - notifications: notifications_version (versão recebida da última vez)
+    - friends: friends_version
+    Com ?wait=<s>, segura a requisição até alguma seção mudar (long-polling);
+    com If-None-Match, responde 304 se nenhuma versão mudou
+    """
+    me = str(session.get('user_id'))
+    wait = long_poll_seconds()
+    args = request.args
+    include = set(args.get('include', ','.join(SYNC_SECTIONS)).split(',')) & set(SYNC_SECTIONS)
+    partner_id = args.get('partner_id', '') if 'messages' in include else ''
+    since_id = args.get('since_id', default=0, type=int)
+    post_ids = [p for p in args.get('likes_ids', '').split(',') if p.strip()][:500] if 'likes' in include else []
+    cursors = sorted((k, v) for k, v in args.items() if k != 'wait')
+
+    def current_etag():
+        return data_etag(
+            'sync', me, cursors,
+            storage.friends.version(me),
+            storage.notifications.version(me) if 'notifications' in include else '',
+            storage.messages.version(me, partner_id) if partner_id.isdigit() else '',
+            storage.likes.version() if post_ids else '',
+        )
+
+    etag, fresh = revalidate(me, current_etag, wait)
+    if fresh:
+        return not_modified(etag)
+    if request.if_none_match:
+        wait = 0  # o cliente tem uma versão anterior: responde já
+
+    # Uma busca de amizades por requisição (também valida o parceiro do chat)
+    friend_ids = set(get_friends(me))
+
+    def collect():
+        """Seções que mudaram em relação aos cursores (vazio se nada mudou)"""
+        out = {}
+        if partner_id:
+            if partner_id not in friend_ids:
+                out['messages'] = {'partner_id': partner_id, 'error': 'partner_id inválido ou não são amigos'}
+            else:
+                rows = storage.messages.conversation(me, partner_id, since_id)
+                if rows:
+                    out['messages'] = {'partner_id': partner_id, 'messages': message_items(rows)}
+
+        if post_ids:
+            version, changed = storage.likes.changed_since(args.get('likes_since', ''), post_ids, me)
+            if changed:
+                out['likes'] = {
+                    'version': version,
+                    'posts': {pid: {'likes': likes, 'liked_by_me': liked} for pid, (likes, liked) in changed.items()},
+                }
+
+        if 'notifications' in include:
+            version = storage.notifications.version(me)
+            if version != args.get('notifications_version'):
+                rows, unread = storage.notifications.latest(me, 50)
+                out['notifications'] = {'version': version, 'unread': unread, 'items': notification_items(rows)}
+
+        if 'friends' in include:
+            version = storage.friends.version(me)
+            if version != args.get('friends_version'):
+                out['friends'] = {'version': version, 'users': friend_users(me, get_friends(me))}
+        return out
+
+    if wait:
+        etag, result = wait_tagged(me, current_etag, collect, wait)
+    else:
+        result = collect()
+    
+    return with_etag(jsonify(result), etag)
+
+# ========================================
+# API - STREAM DE EVENTOS (SSE)
+# ========================================
+
+def sse_format(event):
+    """Serializa um evento no formato text/event-stream"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@app.get('/api/stream')
+@login_required
+def api_stream():
+    """
+    Stream SSE com os eventos do usuário atual
+    A conexão fecha após STREAM_MAX_SECONDS e o navegador reconecta sozinho
+    """
+    if not SSE_ENABLED:
+        return jsonify({'error': 'stream desativado'}), 404
+
+    me = str(session.get('user_id'))
+
+    def generate():
+        # Assina só quando o stream começa: se o cliente cair antes, nada fica registrado
+        sub = events.subscribe(me)
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        try:
+            # Avisa o cliente de que está conectado (e o intervalo de reconexão)
+            yield 'retry: 3000\nevent: ready\ndata: {}\n\n'
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                batch = sub.get(timeout=min(STREAM_HEARTBEAT_SECONDS, remaining))
+                if batch:
+                    yield ''.join(sse_format(e) for e in batch)
+                else:
+                    yield ': ping\n\n'
+        finally:
+            sub.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+# ========================================
+# ADMINISTRAÇÃO - PERFIS DE REQUISIÇÕES LENTAS
+# ========================================
+
+@app.get('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """Lista os perfis mais recentes de requisições lentas (?limit=, máx. 200)"""
+    if not profiler.enabled:
+        return jsonify({'error': 'profiler desativado'}), 404
+    limit = max(1, min(request.args.get('limit', default=50, type=int) or 50, 200))
+    return jsonify({
+        'rate': profiler.rate,
+        'slow_ms': profiler.slow_ms,
+        'profiles': profiler.recent(limit),
+    })
+
+@app.get('/admin/profiles/<name>')
+@admin_required
+def admin_profile_download(name):
+    """Baixa o .prof (pstats) de um perfil da lista"""
+    filename = profiler.profile_file(name) if profiler.enabled else None
+    if filename is None:
+        return jsonify({'error': 'perfil não encontrado'}), 404
+    return send_from_directory(profiler.out_dir, filename, as_attachment=True)
+
+# ========================================
+# COMANDOS CLI
+# ========================================
+
+@app.cli.group('storage')
+def storage_cli():
+    """Comandos de manutenção do armazenamento"""
+
+@storage_cli.command('migrate')
+@click.option('--db', 'db_path', default=SQLITE_PATH, show_default=True, help='Arquivo SQLite de destino')
+@click.option('--replace', is_flag=True, help='Apaga o conteúdo atual do banco antes de importar')
+def storage_migrate(db_path, replace):
+    """Migra os CSVs de src/data para um banco SQLite"""
+    source = storage if isinstance(storage, CsvStorage) else CsvStorage(DATA_DIR)
+    target = SqliteStorage(db_path)
+    counts = migrate_csv_to_sqlite(source, target, replace=replace)
+    target.close()
+    for table, n in counts.items():
+        click.echo(f'{table}: {n}')
+    click.echo(f'Banco pronto em {db_path}. Use FLUKER_STORAGE=sqlite para ativá-lo.')
+
+@storage_cli.command('normalize-timestamps')
+@click.option('--legacy-tz', default='America/Sao_Paulo', show_default=True,
+              help='Fuso em que foram gravados os timestamps DD/MM/YYYY HH:MM')
+def storage_normalize_timestamps(legacy_tz):
+    """Reescreve timestamps legados no formato canônico UTC (YYYY-MM-DDTHH:MM:SSZ)"""
+    counts = normalize_timestamps(storage, ZoneInfo(legacy_tz))
+    storage.close()
+    for table, n in counts.items():
+        click.echo(f'{table}: {n}')
+
+@storage_cli.command('compact-notifications')
+def storage_compact_notifications():
+    """Aplica agora a retenção das notificações (arquiva e coalesce)"""
+    notification_queue.close()
+    result = notification_compactor.run_once()
+    storage.close()
+    click.echo(f"arquivadas: {result['archived']}")
+    click.echo(f"coalescidas: {result['coalesced']}")
+    for segment, n in sorted(result['segments'].items()):
+        click.echo(f'{segment}: {n}')
+
+def csv_storage_or_fail():
+    """Motor atual, se for o CSV (comandos só do motor CSV)"""
+    if not isinstance(storage, CsvStorage):
+        raise click.ClickException('Disponível só com FLUKER_STORAGE=csv')
+    return storage
+
+@storage_cli.command('rotate-messages')
+@click.option('--segment-rows', type=int, default=MESSAGES_SEGMENT_ROWS, show_default=True,
+              help='Linhas por segmento selado')
+@click.option('--all', 'seal_all', is_flag=True, help='Sela também o resto menor que um segmento')
+def storage_rotate_messages(segment_rows, seal_all):
+    """Sela o messages.csv em segmentos do histórico (src/data/messages/)"""
+    store = csv_storage_or_fail()
+    sealed = store.messages.rotate(segment_rows=segment_rows, seal_all=seal_all)
+    store.close()
+    for name in sealed:
+        click.echo(name)
+    click.echo(f'{len(sealed)} segmento(s) selado(s); {len(store.cache.rows(store.messages_path))} mensagem(ns) no arquivo ativo')
+
+@storage_cli.command('reindex-messages')
+def storage_reindex_messages():
+    """Reconstrói os índices (.idx) dos segmentos de mensagens"""
+    store = csv_storage_or_fail()
+    for name, n in store.messages.reindex().items():
+        click.echo(f'{name}: {n}')
+
 # ========================================
 # INICIALIZAÇÃO
 # ========================================
 
 if __name__ == '__main__':
-    # Garante que todos os CSVs existem
-    ensure_csv()
-    ensure_messages_csv()
-    ensure_posts_csv()
-    ensure_notifications_csv()
-    ensure_friends_csv()
-    
-    # Inicia servidor
-    app.run(host="127.0.0.1", port=5001, debug=True)
\ No newline at end of file
+    # Inicia servidor (o armazenamento já garante arquivos/esquema)
+    app.run(host="127.0.0.1", port=5001, debug=True)
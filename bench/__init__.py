@@ -0,0 +1,14 @@
+# bench/__init__.py
+"""
+========================================
+BENCHMARK DO FLUKER
+========================================
+Mede como as rotas escalam com o tamanho da base:
+- generate: gera uma base sintética determinística nos esquemas dos CSVs
+- driver: sobe o app sobre essa base e dispara pollers concorrentes pelo
+  test client do Flask, medindo vazão e latência (p50/p95/p99) por rota
+
+Uso (a partir da raiz do repositório):
+    python -m bench.generate --out /tmp/fluker-bench --scale 0.1
+    python -m bench.driver --data /tmp/fluker-bench --duration 30 --pollers 16 --output bench.json
+"""
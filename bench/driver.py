@@ -0,0 +1,196 @@
+# bench/driver.py
+"""
+========================================
+DRIVER DO BENCHMARK
+========================================
+Sobe o app sobre uma base gerada por bench.generate e dispara N pollers
+concorrentes, cada um com seu próprio test client (sessão logada), numa
+mistura ponderada de rotas. Ao fim grava um JSON com vazão e latência
+(média, p50, p95, p99) por rota, para comparar commits entre si.
+
+O app roda sobre uma cópia temporária da base (curtidas, notificações e
+sequências de ID são gravadas durante a carga), então toda execução parte
+do mesmo estado gerado.
+"""
+
+import subprocess
+import threading
+import argparse
+import tempfile
+import shutil
+import random
+import json
+import time
+import sys
+import os
+
+from bench.generate import MANIFEST, username, password
+
+# Peso de cada rota na mistura dos pollers (login é medido uma vez por poller)
+DEFAULT_MIX = {
+    'home_page': 2,
+    'perfil': 1,
+    'api_messages': 4,
+    'api_toggle_like': 1,
+    'api_notifications': 4,
+}
+
+ENDPOINTS = ('login',) + tuple(DEFAULT_MIX)
+
+def percentile(sorted_values, pct):
+    """Percentil por posto mais próximo de uma lista já ordenada"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+def summarize(samples, errors, duration):
+    """Resumo por rota: contagem, erros, req/s e latências em ms"""
+    report = {}
+    for name in ENDPOINTS:
+        values = sorted(samples.get(name, ()))
+        count = len(values)
+        ms = lambda v: None if v is None else round(v * 1000, 3)
+        report[name] = {
+            'count': count,
+            'errors': errors.get(name, 0),
+            'rps': round(count / duration, 2) if duration else None,
+            'mean_ms': ms(sum(values) / count) if count else None,
+            'p50_ms': ms(percentile(values, 50)),
+            'p95_ms': ms(percentile(values, 95)),
+            'p99_ms': ms(percentile(values, 99)),
+        }
+    return report
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Poller(threading.Thread):
+    """Um usuário logado disparando requisições até o prazo acabar"""
+
+    def __init__(self, app_module, user_id, counts, mix, deadline, seed):
+        super().__init__(daemon=True)
+        self.app_module = app_module
+        self.user_id = user_id
+        self.n_users = counts['users']
+        self.n_posts = counts['posts']
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.samples = {}
+        self.errors = {}
+
+    def timed(self, name, call, ok=(200,)):
+        started = time.perf_counter()
+        try:
+            resp = call()
+            status = resp.status_code
+            resp.close()
+        except Exception:
+            status = None
+        elapsed = time.perf_counter() - started
+        if status in ok:
+            self.samples.setdefault(name, []).append(elapsed)
+        else:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def run(self):
+        client = self.app_module.app.test_client()
+        uid = self.user_id
+        self.timed('login', lambda: client.post('/login', data={
+            'usuario': username(uid), 'senha': password(uid),
+        }), ok=(302,))
+
+        friends = self.app_module.get_friends(uid) or [uid]
+        requests = {
+            'home_page': lambda: client.get('/home'),
+            'perfil': lambda: client.get(f'/perfil/{self.rng.randint(1, self.n_users)}'),
+            'api_messages': lambda: client.get(f'/api/messages?partner_id={self.rng.choice(friends)}'),
+            'api_toggle_like': lambda: client.post(f'/api/toggle_like/{self.rng.randint(1, self.n_posts)}'),
+            'api_notifications': lambda: client.get('/api/notifications'),
+        }
+        while time.perf_counter() < self.deadline:
+            name = self.rng.choices(self.names, self.weights)[0]
+            self.timed(name, requests[name])
+
+def run(data_dir, duration=30.0, pollers=16, seed=7, mix=None):
+    """Executa o benchmark sobre uma cópia de data_dir e retorna o relatório"""
+    with open(os.path.join(data_dir, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix='fluker-bench-')
+    try:
+        work_data = os.path.join(work_dir, 'data')
+        shutil.copytree(data_dir, work_data)
+        return _run(work_data, manifest, duration, pollers, seed, mix or DEFAULT_MIX)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def _run(data_dir, manifest, duration, pollers, seed, mix):
+    # A base precisa ser escolhida antes de importar o app
+    os.environ['FLUKER_DATA_DIR'] = os.path.abspath(data_dir)
+    os.environ.setdefault('FLUKER_SSE', '0')
+    started = time.perf_counter()
+    import app as app_module
+    warm_seconds = time.perf_counter() - started
+
+    counts = manifest['counts']
+    rng = random.Random(seed)
+    user_ids = rng.sample(range(1, counts['users'] + 1), min(pollers, counts['users']))
+    deadline = time.perf_counter() + duration
+    threads = [
+        Poller(app_module, uid, counts, mix, deadline, seed + i)
+        for i, uid in enumerate(user_ids)
+    ]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    # Grava o que ficou na fila antes de a cópia ser apagada
+    app_module.notification_queue.close()
+
+    samples, errors = {}, {}
+    for t in threads:
+        for name, values in t.samples.items():
+            samples.setdefault(name, []).extend(values)
+        for name, n in t.errors.items():
+            errors[name] = errors.get(name, 0) + n
+
+    return {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'storage': app_module.STORAGE_BACKEND,
+        'config': {'duration': duration, 'pollers': len(threads), 'seed': seed, 'mix': mix},
+        'dataset': manifest,
+        'warm_seconds': round(warm_seconds, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'endpoints': summarize(samples, errors, elapsed),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mede vazão e latência das rotas sobre uma base sintética')
+    parser.add_argument('--data', required=True, help='Pasta gerada por bench.generate')
+    parser.add_argument('--duration', type=float, default=30.0, help='Segundos de carga')
+    parser.add_argument('--pollers', type=int, default=16, help='Usuários concorrentes')
+    parser.add_argument('--seed', type=int, default=7, help='Semente da escolha de usuários e rotas')
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout)')
+    args = parser.parse_args(argv)
+
+    report = run(args.data, duration=args.duration, pollers=args.pollers, seed=args.seed)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+if __name__ == '__main__':
+    main()
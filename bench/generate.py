@@ -0,0 +1,168 @@
+# bench/generate.py
+"""
+========================================
+GERADOR DE BASE SINTÉTICA
+========================================
+Escreve users/posts/friends/messages/notifications.csv nos esquemas atuais,
+de forma determinística (mesma semente e escala = mesmos arquivos), e um
+bench_manifest.json com as contagens (usuário N = userN / senhaN).
+
+Escala 1.0: 10k usuários, 200k amizades, 1M mensagens, 500k notificações
+e 50k posts. --scale multiplica todas as contagens.
+"""
+
+import argparse
+import random
+import json
+import time
+import csv
+import os
+
+from storage.base import (
+    USER_FIELDS, POST_FIELDS, MESSAGE_FIELDS, NOTIFICATION_FIELDS, FRIEND_FIELDS,
+    LIKE_LOG_FIELDS, TIMESTAMP_FORMAT, encode_id_set,
+)
+
+# Contagens na escala 1.0
+BASE_COUNTS = {
+    'users': 10_000,
+    'friendships': 200_000,
+    'messages': 1_000_000,
+    'notifications': 500_000,
+    'posts': 50_000,
+}
+
+# Fração das amizades que ficam pendentes (status '0')
+PENDING_RATIO = 0.1
+
+# Início dos timestamps gerados (2025-01-01T00:00:00Z)
+EPOCH = 1735689600
+
+WORDS = (
+    'oi', 'tudo', 'bem', 'fluker', 'post', 'hoje', 'amanhã', 'show', 'valeu',
+    'bora', 'foto', 'legal', 'kkk', 'top', 'saudade', 'festa', 'jogo', 'aula',
+)
+
+MANIFEST = 'bench_manifest.json'
+
+def username(uid):
+    return f'user{uid}'
+
+def password(uid):
+    return f'senha{uid}'
+
+def scaled_counts(scale):
+    """Contagens da escala pedida (no mínimo 2 usuários e 1 de cada)"""
+    counts = {k: max(1, int(v * scale)) for k, v in BASE_COUNTS.items()}
+    counts['users'] = max(2, counts['users'])
+    # Não há mais pares distintos que n*(n-1)/2
+    n = counts['users']
+    counts['friendships'] = min(counts['friendships'], n * (n - 1) // 2)
+    return counts
+
+def _timestamp(offset):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(EPOCH + offset))
+
+def _text(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+def _writer(path, fields):
+    f = open(path, 'w', newline='', encoding='utf-8')
+    w = csv.writer(f)
+    w.writerow(fields)
+    return f, w
+
+def generate(out_dir, scale=1.0, seed=42):
+    """Gera a base em out_dir e retorna o manifesto"""
+    rng = random.Random(seed)
+    counts = scaled_counts(scale)
+    n_users = counts['users']
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Usuários
+    f, w = _writer(os.path.join(out_dir, 'users.csv'), USER_FIELDS)
+    with f:
+        for uid in range(1, n_users + 1):
+            w.writerow([uid, username(uid), password(uid), f'{username(uid)}@bench.fluker'])
+
+    # Amizades: pares distintos, a maioria aceita
+    pairs = set()
+    while len(pairs) < counts['friendships']:
+        a, b = rng.randint(1, n_users), rng.randint(1, n_users)
+        if a != b:
+            pairs.add((a, b) if a < b else (b, a))
+    pairs = sorted(pairs)
+    rng.shuffle(pairs)
+
+    accepted = []
+    f, w = _writer(os.path.join(out_dir, 'friends.csv'), FRIEND_FIELDS)
+    with f:
+        for i, (a, b) in enumerate(pairs):
+            if rng.random() < 0.5:
+                a, b = b, a
+            status = '0' if rng.random() < PENDING_RATIO else '1'
+            if status == '1':
+                accepted.append((a, b))
+            w.writerow([a, b, status, _timestamp(i)])
+    if not accepted:
+        accepted.append(pairs[0])
+
+    # Posts, com curtidas concentradas em poucos posts (distribuição de Pareto)
+    f, w = _writer(os.path.join(out_dir, 'posts.csv'), POST_FIELDS)
+    with f:
+        for pid in range(1, counts['posts'] + 1):
+            author = rng.randint(1, n_users)
+            n_likes = min(n_users, int(rng.paretovariate(1.2)) - 1)
+            likers = set(rng.sample(range(1, n_users + 1), n_likes)) if n_likes > 0 else set()
+            w.writerow([
+                pid, author, username(author), _timestamp(pid * 60),
+                _text(rng, 3, 30), len(likers), encode_id_set(likers),
+            ])
+
+    # Mensagens entre amigos
+    f, w = _writer(os.path.join(out_dir, 'messages.csv'), MESSAGE_FIELDS)
+    with f:
+        for mid in range(1, counts['messages'] + 1):
+            a, b = rng.choice(accepted)
+            if rng.random() < 0.5:
+                a, b = b, a
+            w.writerow([mid, a, b, _timestamp(mid), _text(rng, 1, 12)])
+
+    # Notificações com os mesmos tipos e textos do app
+    f, w = _writer(os.path.join(out_dir, 'notifications.csv'), NOTIFICATION_FIELDS)
+    with f:
+        for nid in range(1, counts['notifications'] + 1):
+            uid = rng.randint(1, n_users)
+            actor = rng.randint(1, n_users)
+            kind = rng.random()
+            if kind < 0.6:
+                row = ['like', actor, rng.randint(1, counts['posts']), f'{username(actor)} curtiu seu post']
+            elif kind < 0.9:
+                row = ['dm', actor, rng.randint(1, counts['messages']), f'Nova DM de: {username(actor)}']
+            else:
+                row = ['friend_request', actor, '', f'{username(actor)} enviou uma solicitação de amizade']
+            w.writerow([nid, uid, row[0], row[1], row[2], _timestamp(nid * 2), '0', row[3]])
+
+    # Log de curtidas vazio (o motor dobra tudo em posts.csv)
+    f, _ = _writer(os.path.join(out_dir, 'likes_log.csv'), LIKE_LOG_FIELDS)
+    f.close()
+
+    manifest = {'seed': seed, 'scale': scale, 'counts': counts}
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera uma base sintética para o benchmark')
+    parser.add_argument('--out', required=True, help='Pasta de destino dos CSVs')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplicador das contagens (1.0 = 10k usuários)')
+    parser.add_argument('--seed', type=int, default=42, help='Semente do gerador')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    manifest = generate(args.out, scale=args.scale, seed=args.seed)
+    manifest['seconds'] = round(time.perf_counter() - started, 2)
+    print(json.dumps(manifest, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# events.py
+"""
+========================================
+BARRAMENTO DE EVENTOS EM PROCESSO
+========================================
+Avisa as conexões abertas de cada usuário quando algo muda para ele
+(mensagem nova, curtida, notificação, amizade). Usado pelo stream SSE
+e pelo long-polling (wait_for).
+
+Os eventos só circulam dentro do processo: com vários workers, o cliente
+mantém um polling lento de segurança para o que vier de outro processo.
+"""
+
+from collections import deque
+import threading
+import itertools
+import time
+
+class Subscription:
+    """Fila de eventos de uma conexão"""
+
+    def __init__(self, bus, user_id, maxlen):
+        self.bus = bus
+        self.user_id = user_id
+        self.events = deque(maxlen=maxlen)
+        self.cond = threading.Condition()
+        self.closed = False
+
+    def push(self, event):
+        with self.cond:
+            self.events.append(event)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Espera até `timeout` segundos e retorna os eventos pendentes (lista vazia se nada chegou)"""
+        with self.cond:
+            if not self.events and not self.closed:
+                self.cond.wait(timeout)
+            items = list(self.events)
+            self.events.clear()
+            return items
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class EventBus:
+    """
+    Publica eventos para os assinantes de cada usuário
+    Eventos são dicts com 'type' e dados; cada um recebe um 'id' crescente
+    """
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs = {}  # user_id -> set(Subscription)
+        self._waiters = {}  # user_id -> [Condition, nº de requisições esperando, seq]
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self, user_id):
+        sub = Subscription(self, str(user_id), self.queue_size)
+        with self._lock:
+            self._subs.setdefault(sub.user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.user_id]
+
+    def publish(self, user_ids, type, **data):
+        """Entrega o evento a todas as conexões dos usuários informados"""
+        event = dict(data, type=type, id=next(self._ids))
+        users = {str(u) for u in user_ids}
+        with self._lock:
+            self.published += 1
+            targets = [sub for uid in users for sub in self._subs.get(uid, ())]
+            waiting = [self._waiters[uid] for uid in users if uid in self._waiters]
+        for sub in targets:
+            sub.push(event)
+        for waiter in waiting:
+            with waiter[0]:
+                waiter[2] += 1
+                waiter[0].notify_all()
+        return event
+
+    def wait_for(self, user_id, check, timeout, recheck=1.0):
+        """
+        Long-polling: espera até check() trazer algo ou o timeout vencer
+        Acorda com qualquer evento publicado para o usuário; também reavalia
+        check() a cada `recheck` segundos, para dados gravados por outro processo.
+        Retorna o último resultado de check().
+        """
+        uid = str(user_id)
+        with self._lock:
+            waiter = self._waiters.setdefault(uid, [threading.Condition(), 0, 0])
+            waiter[1] += 1
+        cond = waiter[0]
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                with cond:
+                    seq = waiter[2]
+                result = check()
+                remaining = deadline - time.monotonic()
+                if result or remaining <= 0:
+                    return result
+                with cond:
+                    if waiter[2] == seq:
+                        cond.wait(min(recheck, remaining))
+        finally:
+            with self._lock:
+                waiter[1] -= 1
+                if not waiter[1]:
+                    del self._waiters[uid]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._subs),
+                'subscriptions': sum(len(s) for s in self._subs.values()),
+                'waiting': sum(w[1] for w in self._waiters.values()),
+                'published': self.published,
+            }
@@ -0,0 +1,227 @@
+# metrics.py
+"""
+========================================
+MÉTRICAS POR REQUISIÇÃO (PROMETHEUS)
+========================================
+Mede cada requisição do Flask: tempo total, E/S de CSV (arquivos abertos,
+linhas varridas, bytes lidos/escritos, reescritas, acertos do cache) e o
+tempo gasto em etapas nomeadas (helpers do app e renderização de templates).
+Tudo fica agregado por endpoint e é exposto em texto do Prometheus.
+
+As etapas são inclusivas: uma etapa chamada dentro de outra conta nas duas.
+"""
+
+from flask import Response, request
+from flask.signals import before_render_template, template_rendered
+from bisect import bisect_left
+from functools import wraps
+import threading
+import time
+
+from storage import IoStats, track_io
+
+# Limites dos buckets (o +Inf é implícito)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROWS_BUCKETS = (0, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+BYTES_BUCKETS = (0, 1_024, 16_384, 131_072, 1_048_576, 8_388_608, 67_108_864)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _labels(pairs):
+    escaped = (
+        (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Contador com rótulos"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def lines(self):
+        for values, total in sorted(self.series.items()):
+            yield f'{self.name}{_labels(zip(self.labels, values))} {_number(total)}'
+
+class Histogram:
+    """Histograma com rótulos e buckets fixos"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series = {}  # rótulos -> [contagem por bucket..., soma, total]
+
+    def observe(self, values, value):
+        data = self.series.get(values)
+        if data is None:
+            data = self.series[values] = [0] * (len(self.buckets) + 1) + [0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def lines(self):
+        bounds = [_number(b) for b in self.buckets] + ['+Inf']
+        for values, data in sorted(self.series.items()):
+            pairs = list(zip(self.labels, values))
+            cumulative = 0
+            for bound, n in zip(bounds, data):
+                cumulative += n
+                yield f'{self.name}_bucket{_labels(pairs + [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(pairs)} {_number(data[-1])}'
+            yield f'{self.name}_count{_labels(pairs)} {cumulative}'
+
+class RequestScope:
+    """O que está sendo medido na requisição atual"""
+
+    __slots__ = ('started', 'io', 'stages', 'templates')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.io = IoStats()
+        self.stages = {}  # etapa -> [chamadas, segundos]
+        self.templates = []  # inícios das renderizações em andamento
+
+    def add_stage(self, name, seconds):
+        entry = self.stages.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+class RequestMetrics:
+    """
+    Instrumentação do app: ligada com init_app(app)
+    Desligada (enabled=False), timed() devolve a função original e nada é registrado
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        endpoint = ('endpoint',)
+        self.requests = Counter('fluker_requests_total', 'Requisições atendidas', ('endpoint', 'status'))
+        self.duration = Histogram('fluker_request_duration_seconds', 'Tempo total da requisição', endpoint, DURATION_BUCKETS)
+        self.rows = Histogram('fluker_request_csv_rows_scanned', 'Linhas de CSV varridas por requisição', endpoint, ROWS_BUCKETS)
+        self.bytes_read = Histogram('fluker_request_csv_bytes_read', 'Bytes de CSV lidos por requisição', endpoint, BYTES_BUCKETS)
+        self.io_totals = {
+            name: Counter(f'fluker_csv_{name}_total', help, endpoint)
+            for name, help in (
+                ('files_opened', 'Arquivos CSV abertos'),
+                ('rows_scanned', 'Linhas de CSV varridas'),
+                ('bytes_read', 'Bytes de CSV lidos'),
+                ('bytes_written', 'Bytes de CSV escritos'),
+                ('rewrites', 'Reescritas completas de CSV'),
+                ('cache_hits', 'Leituras atendidas pelo cache de tabelas'),
+            )
+        }
+        self.stage_seconds = Counter('fluker_stage_seconds_total', 'Tempo gasto em cada etapa', ('endpoint', 'stage'))
+        self.stage_calls = Counter('fluker_stage_calls_total', 'Chamadas de cada etapa', ('endpoint', 'stage'))
+
+    @property
+    def families(self):
+        return [
+            self.requests, self.duration, self.rows, self.bytes_read,
+            *self.io_totals.values(), self.stage_seconds, self.stage_calls,
+        ]
+
+    def _scope(self):
+        return getattr(self._local, 'scope', None)
+
+    def timed(self, stage):
+        """Decorator que soma o tempo da função à etapa `stage` da requisição atual"""
+        def decorator(fn):
+            if not self.enabled:
+                return fn
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                scope = self._scope()
+                if scope is None:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    scope.add_stage(stage, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def init_app(self, app):
+        """Registra os hooks de requisição e o endpoint /metrics"""
+        if not self.enabled:
+            return
+        app.before_request(self._begin)
+        app.after_request(self._finish)
+        app.teardown_request(self._clear)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.add_url_rule('/metrics', 'metrics', self.endpoint)
+
+    def _begin(self):
+        scope = RequestScope()
+        self._local.scope = scope
+        track_io(scope.io)
+
+    def _finish(self, response):
+        scope = self._scope()
+        if scope is not None:
+            self.observe(request.endpoint or 'unmatched', response.status_code, scope)
+            self._clear()
+        return response
+
+    def _clear(self, exc=None):
+        self._local.scope = None
+        track_io(None)
+
+    def _template_started(self, sender, template, context, **extra):
+        scope = self._scope()
+        if scope is not None:
+            scope.templates.append(time.perf_counter())
+
+    def _template_finished(self, sender, template, context, **extra):
+        scope = self._scope()
+        if scope is not None and scope.templates:
+            scope.add_stage('render_template', time.perf_counter() - scope.templates.pop())
+
+    def observe(self, endpoint, status, scope):
+        """Agrega uma requisição terminada"""
+        elapsed = time.perf_counter() - scope.started
+        key = (endpoint,)
+        io = scope.io.as_dict()
+        with self._lock:
+            self.requests.inc((endpoint, str(status)))
+            self.duration.observe(key, elapsed)
+            self.rows.observe(key, io['rows_scanned'])
+            self.bytes_read.observe(key, io['bytes_read'])
+            for name, value in io.items():
+                if value:
+                    self.io_totals[name].inc(key, value)
+            for stage, (calls, seconds) in scope.stages.items():
+                self.stage_calls.inc((endpoint, stage), calls)
+                self.stage_seconds.inc((endpoint, stage), seconds)
+
+    def render(self):
+        """Todas as métricas no formato de texto do Prometheus"""
+        out = []
+        with self._lock:
+            for family in self.families:
+                out.append(f'# HELP {family.name} {family.help}')
+                out.append(f'# TYPE {family.name} {family.kind}')
+                out.extend(family.lines())
+        return '\n'.join(out) + '\n'
+
+    def endpoint(self):
+        return Response(self.render(), content_type=CONTENT_TYPE)
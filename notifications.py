@@ -0,0 +1,97 @@
+# notifications.py
+"""
+========================================
+FILA DE NOTIFICAÇÕES EM SEGUNDO PLANO
+========================================
+Tira a gravação de notificações do caminho da requisição: as rotas só
+enfileiram, e uma thread esvazia a fila em lotes. Cada lote é entregue
+de uma vez a `deliver(itens)`, que resolve os nomes dos atores numa busca
+só, reserva um bloco de IDs e grava todas as linhas num único append.
+
+flush() espera o que já foi enfileirado ser gravado (testes e rotas que
+removem notificações antes de ler); close() faz o flush e encerra a thread.
+"""
+
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class NotificationQueue:
+    """
+    Fila atendida por uma thread (iniciada no primeiro submit)
+    Com synchronous=True, submit() entrega na hora, na thread de quem chamou
+    """
+
+    def __init__(self, deliver, max_batch=500, linger_ms=5, synchronous=False):
+        self.deliver = deliver
+        self.max_batch = max_batch
+        self.linger_s = linger_ms / 1000.0
+        self.synchronous = synchronous
+        self._cond = threading.Condition()
+        self._items = []
+        self._submitted = 0
+        self._done = 0
+        self._closed = False
+        self._worker = None
+        self.batches = 0
+
+    def submit(self, item):
+        """Enfileira um item para a próxima entrega"""
+        with self._cond:
+            inline = self.synchronous or self._closed
+            if not inline:
+                self._items.append(item)
+                self._submitted += 1
+                self._ensure_worker()
+                self._cond.notify_all()
+        if inline:
+            self.deliver([item])
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='notification-queue', daemon=True)
+            self._worker.start()
+
+    def flush(self, timeout=None):
+        """Espera a entrega de tudo que foi enfileirado até agora; False se o tempo acabou"""
+        with self._cond:
+            target = self._submitted
+            return self._cond.wait_for(lambda: self._done >= target, timeout)
+
+    def close(self, timeout=5):
+        """Entrega o que falta e encerra a thread; novos itens passam a ser entregues na hora"""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def pending(self):
+        with self._cond:
+            return self._submitted - self._done
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._items or self._closed)
+                if not self._items:
+                    return
+            # Janela de agrupamento
+            if self.linger_s > 0:
+                time.sleep(self.linger_s)
+            with self._cond:
+                batch = self._items[:self.max_batch]
+                del self._items[:self.max_batch]
+            try:
+                self.deliver(batch)
+                self.batches += 1
+            except Exception:
+                logger.exception('Falha ao gravar %d notificações', len(batch))
+            finally:
+                with self._cond:
+                    self._done += len(batch)
+                    self._cond.notify_all()
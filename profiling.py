@@ -0,0 +1,150 @@
+# profiling.py
+"""
+========================================
+PROFILER AMOSTRADO POR REQUISIÇÃO
+========================================
+Roda cProfile numa fração das requisições (opcionalmente só de algumas
+rotas) e guarda em disco as que passaram do limite de lentidão:
+- <nome>.prof: pstats (abre com snakeviz, flameprof, gprof2dot...)
+- <nome>.json: rota, duração e as funções com maior tempo próprio
+
+A pasta é rotativa (só os `keep` perfis mais novos ficam). Requisições
+não sorteadas não pagam nada além do sorteio. Um perfil por vez: o
+profiler do Python não aceita dois ativos ao mesmo tempo, então um
+sorteio que cai durante outro perfil é ignorado.
+"""
+
+from flask import g, request
+from datetime import datetime, timezone
+import threading
+import cProfile
+import secrets
+import pstats
+import random
+import json
+import time
+import os
+
+from storage import utc_now_iso
+
+class RequestProfiler:
+    """Ligado com init_app(app) quando rate > 0"""
+
+    def __init__(self, out_dir, rate=0.0, slow_ms=0.0, routes=(), keep=200, top=15):
+        self.out_dir = out_dir
+        self.rate = rate
+        self.slow_ms = slow_ms
+        self.routes = frozenset(routes)
+        self.keep = keep
+        self.top = top
+        self._busy = threading.Lock()
+        self._files_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def init_app(self, app):
+        """Registra os hooks que abrem e fecham o perfil de cada requisição sorteada"""
+        if not self.enabled:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        app.before_request(self._begin)
+        app.after_request(self._finish)
+        app.teardown_request(self._abort)
+
+    def _begin(self):
+        if self.routes and request.endpoint not in self.routes:
+            return
+        if random.random() >= self.rate or not self._busy.acquire(blocking=False):
+            return
+        profile = cProfile.Profile()
+        g._profile = (profile, time.perf_counter())
+        profile.enable()
+
+    def _stop(self):
+        """Encerra o perfil da requisição atual; retorna (perfil, ms) ou None"""
+        entry = g.pop('_profile', None)
+        if entry is None:
+            return None
+        profile, started = entry
+        profile.disable()
+        self._busy.release()
+        return profile, (time.perf_counter() - started) * 1000
+
+    def _finish(self, response):
+        stopped = self._stop()
+        if stopped is not None and stopped[1] >= self.slow_ms:
+            self.dump(stopped[0], stopped[1], response.status_code)
+        return response
+
+    def _abort(self, exc=None):
+        self._stop()
+
+    def dump(self, profile, duration_ms, status):
+        """Grava o perfil e o resumo da requisição atual e apaga os mais antigos"""
+        endpoint = request.endpoint or 'unmatched'
+        # O prefixo com microssegundos deixa a ordem dos nomes cronológica
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+        name = f'{stamp}-{endpoint}-{duration_ms:.0f}ms-{secrets.token_hex(3)}'
+        stats = pstats.Stats(profile)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top]
+        summary = {
+            'name': name,
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': status,
+            'duration_ms': round(duration_ms, 3),
+            'timestamp': utc_now_iso(),
+            'top': [
+                {
+                    'function': pstats.func_std_string(func),
+                    'calls': nc,
+                    'tottime_ms': round(tt * 1000, 3),
+                    'cumtime_ms': round(ct * 1000, 3),
+                }
+                for func, (cc, nc, tt, ct, callers) in top
+            ],
+        }
+        with self._files_lock:
+            stats.dump_stats(os.path.join(self.out_dir, f'{name}.prof'))
+            with open(os.path.join(self.out_dir, f'{name}.json'), 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False)
+            self._rotate()
+
+    def _names(self):
+        """Nomes dos perfis guardados, do mais antigo ao mais novo"""
+        try:
+            files = os.listdir(self.out_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(f[:-5] for f in files if f.endswith('.json'))
+
+    def _rotate(self):
+        names = self._names()
+        for name in names[:max(0, len(names) - self.keep)]:
+            for ext in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(self.out_dir, name + ext))
+                except FileNotFoundError:
+                    pass
+
+    def recent(self, limit=50):
+        """Resumos dos perfis mais recentes (mais novo primeiro)"""
+        out = []
+        for name in reversed(self._names()):
+            if len(out) >= limit:
+                break
+            try:
+                with open(os.path.join(self.out_dir, f'{name}.json'), encoding='utf-8') as f:
+                    out.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue
+        return out
+
+    def profile_file(self, name):
+        """Nome do .prof de um perfil guardado (None se não existe)"""
+        if name not in self._names():
+            return None
+        return f'{name}.prof'
@@ -4,14 +4,248 @@ console.log("[reactPolling] carregado");
 // SISTEMA DE POLLING COM REACT
 // ========================================
 // Componentes React para chat, curtidas e notificações
-// com atualização automática via polling
+// com atualização via stream SSE (/api/stream) e um único polling
+// de reserva (/api/sync) para todos eles
 
 const { useState, useEffect, useCallback, useRef } = React;
 
-// Intervalos de polling (em milissegundos)
-const NOTIF_POLLING_MS = 2000;  // Notificações a cada 2s
-const LIKES_POLLING_MS = 2000;  // Curtidas a cada 2s
-const POLLING_MS = 2000;        // Mensagens a cada 2s
+// Intervalo de polling (em milissegundos)
+const POLLING_MS = 2000;        // Mensagens, curtidas, notificações e amigos a cada 2s
+const STREAM_FALLBACK_MS = 30000; // Com o stream conectado, polling só de segurança
+const LONG_POLL_SECONDS = 25;     // Espera do long-polling quando não há stream
+
+// ========================================
+// STREAM DE EVENTOS (SSE)
+// ========================================
+// Repassa os eventos do servidor como eventos da janela "fluker:<tipo>".
+// "fluker:resync" avisa que eventos podem ter sido perdidos (conexão
+// aberta/caída) e os componentes devem buscar o estado de novo.
+const STREAM_EVENTS = ["dm", "like", "notification", "friends"];
+
+const EventStream = {
+  source: null,
+  connected: false,
+
+  start() {
+    if (this.source || typeof EventSource === "undefined") return;
+
+    const source = new EventSource("/api/stream");
+    this.source = source;
+
+    source.addEventListener("ready", () => {
+      this.connected = true;
+      window.dispatchEvent(new Event("fluker:resync"));
+    });
+
+    STREAM_EVENTS.forEach((type) => {
+      source.addEventListener(type, (e) => {
+        let detail = {};
+        try {
+          detail = JSON.parse(e.data);
+        } catch {
+          // Evento sem dados
+        }
+        window.dispatchEvent(new CustomEvent(`fluker:${type}`, { detail }));
+      });
+    });
+
+    source.onerror = () => {
+      const wasConnected = this.connected;
+      this.connected = false;
+      // Stream indisponível (ex.: desativado no servidor): fica no polling
+      if (source.readyState === EventSource.CLOSED) this.source = null;
+      if (wasConnected) window.dispatchEvent(new Event("fluker:resync"));
+    };
+  },
+
+  // Intervalo de polling conforme o estado do stream
+  interval(baseMs) {
+    return this.connected ? STREAM_FALLBACK_MS : baseMs;
+  },
+};
+
+// Executa fn em loop respeitando o intervalo atual; retorna { stop, now }
+// Com longPoll, sem stream conectado, fn recebe { wait } e as esperas são
+// emendadas (no máximo uma requisição a cada baseMs).
+// now() roda fn já: interrompe um long-poll em curso ou, se uma chamada
+// curta estiver em andamento, repete logo depois dela.
+function schedulePolling(fn, baseMs, { longPoll = false } = {}) {
+  let timer = null;
+  let stopped = false;
+  let controller = null;
+  let running = false;
+  let waiting = false;
+  let again = false;
+
+  const loop = async () => {
+    clearTimeout(timer);
+    const started = Date.now();
+    const useLongPoll = longPoll && !EventStream.connected;
+    controller = new AbortController();
+    running = true;
+    waiting = useLongPoll;
+    try {
+      await fn({ wait: useLongPoll ? LONG_POLL_SECONDS : 0, signal: controller.signal });
+    } finally {
+      running = false;
+      if (!stopped) {
+        const delay = again
+          ? 0
+          : useLongPoll
+          ? Math.max(0, baseMs - (Date.now() - started))
+          : EventStream.interval(baseMs);
+        again = false;
+        timer = setTimeout(loop, delay);
+      }
+    }
+  };
+
+  timer = setTimeout(loop, EventStream.interval(baseMs));
+  return {
+    stop() {
+      stopped = true;
+      clearTimeout(timer);
+      if (controller) controller.abort();
+    },
+    now() {
+      if (stopped) return;
+      if (!running) {
+        loop();
+        return;
+      }
+      again = true;
+      if (waiting) controller.abort();
+    },
+  };
+}
+
+// Assina eventos da janela; retorna a função de limpeza
+function onWindowEvents(types, handler) {
+  types.forEach((t) => window.addEventListener(t, handler));
+  return () => types.forEach((t) => window.removeEventListener(t, handler));
+}
+
+// ========================================
+// GET CONDICIONAL (ETAG)
+// ========================================
+// Cria um fetch que guarda o ETag da última resposta de cada URL (sem o
+// wait) e o manda em If-None-Match: sem mudanças, o servidor responde 304
+// sem corpo e quem chamou mantém o estado que já tem. Cada componente usa
+// o seu, para um componente novo nunca receber 304 de dados que não tem.
+function createConditionalFetch() {
+  const etags = new Map();
+
+  return async (url, options = {}) => {
+    const u = new URL(url, window.location.origin);
+    u.searchParams.delete("wait");
+    const key = u.pathname + u.search;
+
+    const headers = new Headers(options.headers || {});
+    const etag = etags.get(key);
+    if (etag) headers.set("If-None-Match", etag);
+
+    const res = await fetch(url, {
+      credentials: "same-origin",
+      ...options,
+      headers,
+      cache: "no-store",
+    });
+    const tag = res.headers.get("ETag");
+    if (res.ok && tag) etags.set(key, tag);
+    return res;
+  };
+}
+
+// ========================================
+// SINCRONIZAÇÃO (/api/sync)
+// ========================================
+// Um único laço de polling para a página: cada componente registra uma
+// seção com params() (seus cursores; null = nada a pedir agora) e
+// apply(dados). Cada tick é uma requisição só, e cada seção recebe o que
+// mudou. Eventos do stream e ações locais pedem um tick imediato.
+const SyncClient = {
+  sections: new Map(),  // nome -> { params, apply }
+  poller: null,
+  pending: null,
+  listening: false,
+  conditionalFetch: createConditionalFetch(),
+
+  register(name, section) {
+    this.sections.set(name, section);
+    this.start();
+    this.now({ full: true });
+
+    return () => {
+      if (this.sections.get(name) === section) this.sections.delete(name);
+      if (this.sections.size === 0) this.stop();
+    };
+  },
+
+  start() {
+    if (this.poller) return;
+    this.poller = schedulePolling((opts) => this.tick(opts), POLLING_MS, { longPoll: true });
+    this.listen();
+  },
+
+  stop() {
+    if (!this.poller) return;
+    this.poller.stop();
+    this.poller = null;
+  },
+
+  // Tick imediato (adiado um instante para agrupar pedidos seguidos)
+  // full: alguma seção precisa do estado completo, então não manda If-None-Match
+  now({ full = false } = {}) {
+    if (full) this.conditionalFetch = createConditionalFetch();
+    if (this.pending) return;
+    this.pending = setTimeout(() => {
+      this.pending = null;
+      if (this.poller) this.poller.now();
+    }, 0);
+  },
+
+  listen() {
+    if (this.listening) return;
+    this.listening = true;
+    const types = STREAM_EVENTS.map((t) => `fluker:${t}`);
+    // notifications-updated: ação local (aceitar amizade, marcar como lidas...)
+    onWindowEvents([...types, "fluker:resync", "notifications-updated"], () => this.now());
+  },
+
+  async tick({ wait = 0, signal } = {}) {
+    const url = new URL("/api/sync", window.location.origin);
+    const include = [];
+    this.sections.forEach((section, name) => {
+      const params = section.params();
+      if (!params) return;
+      include.push(name);
+      Object.entries(params).forEach(([k, v]) => url.searchParams.set(k, String(v)));
+    });
+    if (include.length === 0) return;
+    url.searchParams.set("include", include.join(","));
+    if (wait > 0) url.searchParams.set("wait", String(wait));
+
+    try {
+      const res = await this.conditionalFetch(url.toString(), { signal });
+
+      // Nada mudou desde a última resposta
+      if (res.status === 304 || !res.ok) return;
+
+      const ct = res.headers.get("content-type") || "";
+      if (!ct.includes("application/json")) {
+        console.warn("Resposta não-JSON (possível redirect). Status:", res.status);
+        return;
+      }
+
+      const data = await res.json();
+      this.sections.forEach((section, name) => {
+        if (data[name]) section.apply(data[name]);
+      });
+    } catch (e) {
+      if (e.name !== "AbortError") console.error("Erro na sincronização:", e);
+    }
+  },
+};
 
 // ========================================
 // COMPONENTE: CHAT DM COM POLLING
@@ -31,114 +265,98 @@ function ChatDM({ currentUserId }) {
   const messagesEndRef = useRef(null);
   const lastSendTime = useRef(0);
   const lastMsgIdRef = useRef(0);
+  const partnerIdRef = useRef(null);      // Parceiro selecionado (para a sincronização)
+  const loadedPartnerRef = useRef(null);  // Parceiro cuja conversa já foi carregada
   
-  // Sincroniza ref com state
+  // Sincroniza refs com state
   useEffect(() => {
     lastMsgIdRef.current = lastMsgId;
   }, [lastMsgId]);
 
+  useEffect(() => {
+    partnerIdRef.current = partnerId;
+  }, [partnerId]);
+
   const GAP_MS = POLLING_MS;
 
-  // Carrega lista de amigos (apenas amigos mútuos podem conversar)
-  const loadUsers = useCallback(async () => {
-    try {
-      const res = await fetch("/api/friends", { credentials: "same-origin" });
-      if (!res.ok) throw new Error("Falha ao buscar usuários");
-      
-      const data = await res.json();
-      const list = data.users || [];
-
-      setUsers((prev) => {
-        // Verifica se o parceiro atual ainda é amigo
-        const stillExists = list.some(
-          (u) => String(u.id) === String(partnerId)
-        );
-        
-        if (!stillExists) {
-          if (list.length > 0) {
-            // Seleciona o primeiro amigo
-            setPartnerId(String(list[0].id));
-          } else {
-            // Sem amigos
-            setPartnerId(null);
-            setMessages([
-              {
-                id: "no-friends",
-                content: "💬 Para usar o chat, você precisa ter amigos mútuos.",
-                sender_id: 0,
-                timestamp: new Date().toISOString(),
-              },
-            ]);
-          }
-        }
-        return list;
-      });
-    } catch (e) {
-      console.error("Erro ao carregar usuários:", e);
+  const showNotice = (id, content) => {
+    setMessages([{ id, content, sender_id: 0, timestamp: new Date().toISOString() }]);
+  };
+
+  // Aplica a lista de amigos (apenas amigos mútuos podem conversar)
+  const applyUsers = useCallback((list) => {
+    setUsers(list);
+
+    // Verifica se o parceiro atual ainda é amigo
+    const stillExists = list.some(
+      (u) => String(u.id) === String(partnerIdRef.current)
+    );
+    if (stillExists) return;
+
+    if (list.length > 0) {
+      // Seleciona o primeiro amigo
+      setPartnerId(String(list[0].id));
+    } else {
+      // Sem amigos
+      setPartnerId(null);
+      showNotice("no-friends", "💬 Para usar o chat, você precisa ter amigos mútuos.");
     }
-  }, [partnerId]);
+  }, []);
 
-  // Carrega mensagens da conversa (incremental ou completo)
-  const loadMessages = useCallback(
-    async (fullReload = false) => {
-      if (!partnerId) return;
-      
-      try {
-        const url = new URL("/api/messages", window.location.origin);
-        url.searchParams.set("partner_id", String(partnerId));
-        
-        // Se não for reload completo, busca apenas novas mensagens
-        const since = fullReload ? 0 : lastMsgIdRef.current;
-        if (since > 0) url.searchParams.set("since_id", String(since));
-
-        const res = await fetch(url.toString(), { credentials: "same-origin" });
-
-        if (!res.ok) {
-          if (res.status === 400) {
-            // Não são mais amigos
-            setMessages([
-              {
-                id: "error",
-                content: "❌ Vocês não são mais amigos. Chat desativado.",
-                sender_id: 0,
-                timestamp: new Date().toISOString(),
-              },
-            ]);
-            return;
-          }
-          console.error("loadMessages status:", res.status);
-          return;
-        }
+  // Acrescenta mensagens novas, descartando o que outra busca já trouxe
+  const appendMessages = useCallback((received) => {
+    const newMessages = received.filter((m) => Number(m.id) > lastMsgIdRef.current);
+    if (newMessages.length === 0) return;
 
-        const ct = res.headers.get("content-type") || "";
-        if (!ct.includes("application/json")) {
-          console.error("Resposta não-JSON (possível redirect).");
-          return;
-        }
+    setMessages((prev) => [...prev, ...newMessages]);
+
+    // Atualiza último ID recebido
+    const maxId = Math.max(...newMessages.map((m) => Number(m.id)));
+    setLastMsgId(maxId);
+    lastMsgIdRef.current = maxId;
+  }, []);
 
-        const data = await res.json();
-        const newMessages = Array.isArray(data.messages) ? data.messages : [];
+  // Carrega a conversa inteira (ao trocar de parceiro)
+  const loadConversation = useCallback(async (partner) => {
+    try {
+      const url = new URL("/api/messages", window.location.origin);
+      url.searchParams.set("partner_id", String(partner));
 
-        if (fullReload) {
-          // Substitui todas as mensagens
-          setMessages(newMessages);
-        } else if (newMessages.length > 0) {
-          // Adiciona novas mensagens
-          setMessages((prev) => [...prev, ...newMessages]);
-        }
+      const res = await fetch(url.toString(), { credentials: "same-origin" });
+      if (partnerIdRef.current !== partner) return; // Trocou de novo no meio
 
-        // Atualiza último ID recebido
-        if (newMessages.length > 0) {
-          const maxId = Math.max(...newMessages.map((m) => Number(m.id)));
-          setLastMsgId(maxId);
-          lastMsgIdRef.current = maxId;
+      if (!res.ok) {
+        if (res.status === 400) {
+          // Não são mais amigos
+          showNotice("error", "❌ Vocês não são mais amigos. Chat desativado.");
+          return;
         }
-      } catch (e) {
-        console.error("Erro ao carregar mensagens:", e);
+        console.error("loadConversation status:", res.status);
+        return;
       }
-    },
-    [partnerId]
-  );
+
+      const ct = res.headers.get("content-type") || "";
+      if (!ct.includes("application/json")) {
+        console.error("Resposta não-JSON (possível redirect).");
+        return;
+      }
+
+      const data = await res.json();
+      const received = Array.isArray(data.messages) ? data.messages : [];
+
+      // Substitui todas as mensagens
+      setMessages(received);
+      const maxId = received.length > 0 ? Math.max(...received.map((m) => Number(m.id))) : 0;
+      setLastMsgId(maxId);
+      lastMsgIdRef.current = maxId;
+
+      // Daqui em diante as novas chegam pela sincronização
+      loadedPartnerRef.current = partner;
+      SyncClient.now();
+    } catch (e) {
+      console.error("Erro ao carregar mensagens:", e);
+    }
+  }, []);
 
   // Envia uma mensagem
   const sendMessage = useCallback(async () => {
@@ -167,36 +385,48 @@ function ChatDM({ currentUserId }) {
       if (data?.ok) {
         setMessageInput("");
         // Busca novas mensagens (incremental)
-        await loadMessages(false);
+        SyncClient.now();
       }
     } catch (e) {
       console.error("Erro ao enviar:", e);
     } finally {
       setIsSending(false);
     }
-  }, [messageInput, partnerId, isSending, loadMessages, GAP_MS]);
+  }, [messageInput, partnerId, isSending, GAP_MS]);
 
-  // Carrega usuários na montagem
+  // Amigos e mensagens novas vêm da sincronização da página
   useEffect(() => {
-    loadUsers();
-  }, [loadUsers]);
+    let friendsVersion = "";
+    const stopFriends = SyncClient.register("friends", {
+      params: () => ({ friends_version: friendsVersion }),
+      apply: (data) => {
+        friendsVersion = data.version || "";
+        applyUsers(data.users || []);
+      },
+    });
 
-  // Escuta evento de atualização de notificações (pode ter nova amizade)
-  useEffect(() => {
-    const handler = () => {
-      loadUsers();
-    };
-    window.addEventListener("notifications-updated", handler);
-    return () => window.removeEventListener("notifications-updated", handler);
-  }, [loadUsers]);
+    const stopMessages = SyncClient.register("messages", {
+      // Só depois de carregar a conversa, a partir do último ID recebido
+      params: () => {
+        const partner = loadedPartnerRef.current;
+        if (!partner || partner !== partnerIdRef.current) return null;
+        return { partner_id: partner, since_id: lastMsgIdRef.current };
+      },
+      apply: (data) => {
+        if (String(data.partner_id) !== String(loadedPartnerRef.current)) return;
+        if (data.error) {
+          showNotice("error", "❌ Vocês não são mais amigos. Chat desativado.");
+          return;
+        }
+        appendMessages(data.messages || []);
+      },
+    });
 
-  // Polling de usuários a cada 10s
-  useEffect(() => {
-    const id = setInterval(() => {
-      loadUsers();
-    }, 10000);
-    return () => clearInterval(id);
-  }, [loadUsers]);
+    return () => {
+      stopFriends();
+      stopMessages();
+    };
+  }, [applyUsers, appendMessages]);
 
   // Quando troca de parceiro, recarrega mensagens
   useEffect(() => {
@@ -205,26 +435,16 @@ function ChatDM({ currentUserId }) {
     setMessages([]);
     setLastMsgId(0);
     lastMsgIdRef.current = 0;
+    loadedPartnerRef.current = null;
     
     // Carrega tudo e rola pro fim
     (async () => {
-      await loadMessages(true);
+      await loadConversation(partnerId);
       setTimeout(() => {
         messagesEndRef.current?.scrollIntoView({ behavior: "auto" });
       }, 0);
     })();
-  }, [partnerId, loadMessages]);
-
-  // Polling de mensagens (incremental)
-  useEffect(() => {
-    if (!partnerId) return;
-    
-    const interval = setInterval(() => {
-      loadMessages(false);
-    }, POLLING_MS);
-    
-    return () => clearInterval(interval);
-  }, [partnerId, loadMessages]);
+  }, [partnerId, loadConversation]);
 
   // Rola pro fim quando mensagens mudam
   useEffect(() => {
@@ -325,7 +545,64 @@ function ChatDM({ currentUserId }) {
 }
 
 // ========================================
-// COMPONENTE: BOTÃO DE CURTIDA COM POLLING
+// SINCRONIZAÇÃO DE CURTIDAS (VERSIONADA)
+// ========================================
+// Seção "likes" da sincronização, compartilhada por todos os botões da
+// página: envia a última versão vista e os posts na tela, e o servidor
+// devolve só os posts que mudaram
+const LikeSync = {
+  version: "",
+  listeners: new Map(),  // postId -> Set(callback)
+  unregister: null,
+
+  subscribe(postId, callback) {
+    const id = String(postId);
+    if (!this.listeners.has(id)) this.listeners.set(id, new Set());
+    this.listeners.get(id).add(callback);
+
+    // Post novo na tela: a próxima busca precisa trazer o estado completo
+    this.version = "";
+    if (this.unregister) {
+      SyncClient.now({ full: true });
+    } else {
+      this.unregister = SyncClient.register("likes", {
+        params: () => this.params(),
+        apply: (data) => this.apply(data),
+      });
+    }
+
+    return () => {
+      const set = this.listeners.get(id);
+      if (set) {
+        set.delete(callback);
+        if (set.size === 0) this.listeners.delete(id);
+      }
+      if (this.listeners.size === 0 && this.unregister) {
+        this.unregister();
+        this.unregister = null;
+      }
+    };
+  },
+
+  params() {
+    if (this.listeners.size === 0) return null;
+    return {
+      likes_ids: Array.from(this.listeners.keys()).join(","),
+      likes_since: this.version,
+    };
+  },
+
+  apply(data) {
+    this.version = data.version || this.version;
+    Object.entries(data.posts || {}).forEach(([postId, info]) => {
+      const set = this.listeners.get(String(postId));
+      if (set) set.forEach((cb) => cb(info));
+    });
+  },
+};
+
+// ========================================
+// COMPONENTE: BOTÃO DE CURTIDA
 // ========================================
 function LikeButton({ postId, initialLikes, initialLiked, currentUserId }) {
   // Estados do botão
@@ -333,47 +610,12 @@ function LikeButton({ postId, initialLikes, initialLiked, currentUserId }) {
   const [isLiked, setIsLiked] = React.useState(initialLiked === "true");
   const [isLoading, setIsLoading] = React.useState(false);
 
-  // Polling: sincroniza estado com servidor
+  // Recebe do LikeSync as mudanças deste post
   React.useEffect(() => {
-    const syncWithServer = async () => {
-      try {
-        const res = await fetch("/api/post_likes", {
-          credentials: "same-origin",
-        });
-        if (!res.ok) return;
-
-        const ct = res.headers.get("content-type") || "";
-        if (!ct.includes("application/json")) {
-          console.warn(
-            "Resposta não-JSON (possível redirect). Status:",
-            res.status
-          );
-          return;
-        }
-
-        const data = await res.json();
-        const serverInfo = data[postId];
-        
-        if (serverInfo) {
-          // Verifica se eu curti
-          const likesBy = String(serverInfo.likes_by || "")
-            .split(";")
-            .filter(Boolean);
-          const amILiked = likesBy.includes(String(currentUserId));
-          const serverLikes = parseInt(serverInfo.likes || 0) || 0;
-
-          setIsLiked(amILiked);
-          setLikes(serverLikes);
-        }
-      } catch {
-        // Silencioso
-      }
-    };
-
-    // Executa imediatamente e depois no intervalo
-    syncWithServer();
-    const interval = setInterval(syncWithServer, LIKES_POLLING_MS);
-    return () => clearInterval(interval);
+    return LikeSync.subscribe(postId, (info) => {
+      setIsLiked(info.liked_by_me === true);
+      setLikes(parseInt(info.likes || 0) || 0);
+    });
   }, [postId, currentUserId]);
 
   // Toggle de curtida (otimista)
@@ -421,7 +663,7 @@ function LikeButton({ postId, initialLikes, initialLiked, currentUserId }) {
       } else {
         // Confirma com dados do servidor
         setLikes(parseInt(data.likes || 0));
-        setIsLiked(data.liked === true);
+        setIsLiked(data.liked_by_me === true);
       }
     } catch (err) {
       console.error("Erro ao curtir:", err);
@@ -462,45 +704,22 @@ function LikeButton({ postId, initialLikes, initialLiked, currentUserId }) {
 // COMPONENTE: NOTIFICAÇÕES COM POLLING
 // ========================================
 function NotificationSystem() {
-  const { useCallback, useEffect, useState } = React;
+  const { useEffect, useState } = React;
   
   const [unreadCount, setUnreadCount] = useState(0);
   const [notifications, setNotifications] = useState([]);
-
-  // Busca notificações do servidor
-  const fetchNotifications = useCallback(async () => {
-    try {
-      const res = await fetch("/api/notifications", {
-        credentials: "same-origin",
-      });
-      if (!res.ok) return;
-
-      const ct = res.headers.get("content-type") || "";
-      if (!ct.includes("application/json")) {
-        console.warn(
-          "Resposta não-JSON (possível redirect). Status:",
-          res.status
-        );
-        return;
-      }
-
-      const data = await res.json();
-      setUnreadCount(data.unread || 0);
-      setNotifications(data.items || []);
-
-      // Dispara evento para outros componentes
-      window.dispatchEvent(new Event("notifications-updated"));
-    } catch {
-      // Silencioso
-    }
-  }, []);
-
-  // Polling de notificações
+  // Notificações vêm da sincronização da página (só quando a versão muda)
   useEffect(() => {
-    fetchNotifications();
-    const interval = setInterval(fetchNotifications, NOTIF_POLLING_MS);
-    return () => clearInterval(interval);
-  }, [fetchNotifications]);
+    let version = "";
+    return SyncClient.register("notifications", {
+      params: () => ({ notifications_version: version }),
+      apply: (data) => {
+        version = data.version || "";
+        setUnreadCount(data.unread || 0);
+        setNotifications(data.items || []);
+      },
+    });
+  }, []);
 
   // Atualiza badge de não lidas
   useEffect(() => {
@@ -647,6 +866,9 @@ function NotificationSystem() {
 document.addEventListener("DOMContentLoaded", () => {
   try {
     console.log("[reactPolling] DOMContentLoaded");
+
+    // Conecta o stream de eventos (sem ele, os componentes seguem no polling)
+    EventStream.start();
     
     // Monta NotificationSystem
     const notifRoot = document.createElement("div");
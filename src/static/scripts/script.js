@@ -313,7 +313,11 @@ async function searchUsers(query) {
   if (!resultsContainer) return;
 
   try {
-    const response = await fetch("/api/users", { credentials: "same-origin" });
+    const url = new URL("/api/users/search", window.location.origin);
+    url.searchParams.set("q", query);
+    url.searchParams.set("limit", "10");
+
+    const response = await fetch(url.toString(), { credentials: "same-origin" });
     
     if (!response.ok) throw new Error("Erro ao buscar usuários");
 
@@ -326,18 +330,9 @@ async function searchUsers(query) {
       return;
     }
 
+    // O servidor já filtra por prefixo de username OU email
     const data = await response.json();
-    const allUsers = data.users || [];
-
-    // Filtra por username OU email
-    const q = query.toLowerCase();
-    const filtered = allUsers.filter((user) => {
-      const u = (user.username || "").toLowerCase();
-      const e = (user.email || "").toLowerCase();
-      return u.includes(q) || e.includes(q);
-    });
-
-    renderSearchResults(filtered);
+    renderSearchResults(data.users || []);
   } catch (error) {
     console.error("Erro na busca de usuários:", error);
     resultsContainer.innerHTML =
@@ -0,0 +1,43 @@
+# storage/__init__.py
+"""
+========================================
+CAMADA DE ARMAZENAMENTO
+========================================
+Repositórios (users, posts, likes, messages, notifications, friends, timeline)
+com dois motores intercambiáveis:
+- csv: arquivos em src/data (padrão, bom para instalações pequenas)
+- sqlite: banco único em modo WAL com índices
+"""
+
+from .base import (
+    Storage, utc_now_iso, encode_id_set, decode_id_set, parse_timestamp, is_canonical_timestamp,
+)
+from .csvio import IoStats, track_io
+from .csv_engine import CsvStorage
+from .sqlite_engine import SqliteStorage
+from .migrate import migrate_csv_to_sqlite, normalize_timestamps
+from .retention import NotificationRetention, RetentionCompactor
+
+BACKENDS = ('csv', 'sqlite')
+
+def create_storage(backend, data_dir, sqlite_path=None, write_batch_ms=2, likes_compact_seconds=30,
+                   message_segment_rows=0, timeline_cache=10000):
+    """Instancia o motor de armazenamento configurado"""
+    if backend == 'csv':
+        return CsvStorage(
+            data_dir,
+            write_batch_ms=write_batch_ms,
+            likes_compact_seconds=likes_compact_seconds,
+            message_segment_rows=message_segment_rows,
+            timeline_cache=timeline_cache,
+        )
+    if backend == 'sqlite':
+        return SqliteStorage(sqlite_path)
+    raise ValueError(f'Motor de armazenamento desconhecido: {backend!r} (use {", ".join(BACKENDS)})')
+
+__all__ = [
+    'Storage', 'CsvStorage', 'SqliteStorage', 'BACKENDS',
+    'create_storage', 'migrate_csv_to_sqlite', 'normalize_timestamps', 'utc_now_iso', 'encode_id_set',
+    'decode_id_set', 'parse_timestamp', 'is_canonical_timestamp', 'IoStats', 'track_io',
+    'NotificationRetention', 'RetentionCompactor',
+]
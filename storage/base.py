@@ -0,0 +1,315 @@
+# storage/base.py
+"""
+========================================
+CONTRATO DOS REPOSITÓRIOS
+========================================
+Interfaces que as rotas usam para persistência. Cada motor (CSV, SQLite)
+implementa todos os repositórios e os expõe num objeto Storage.
+
+Convenções:
+- IDs entram como str ou int e saem sempre como str
+- Linhas são dicts com os mesmos campos dos CSVs originais
+- Linhas retornadas são somente leitura (copie antes de alterar)
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+USER_FIELDS = ['id', 'username', 'password', 'email']
+POST_FIELDS = ['id', 'author_id', 'author_name', 'timestamp', 'content', 'likes', 'likes_by']
+MESSAGE_FIELDS = ['id', 'sender_id', 'receiver_id', 'timestamp', 'content']
+NOTIFICATION_FIELDS = ['id', 'user_id', 'type', 'actor_id', 'message_id', 'timestamp', 'read', 'text']
+FRIEND_FIELDS = ['user1_id', 'user2_id', 'status', 'timestamp']
+LIKE_LOG_FIELDS = ['post_id', 'user_id', 'op', 'timestamp']
+
+# Formato canônico de todos os timestamps gravados (UTC, ISO 8601, segundos)
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def utc_now_iso():
+    """Timestamp atual em UTC no formato canônico"""
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def is_canonical_timestamp(value):
+    """Se o texto já está no formato canônico (YYYY-MM-DDTHH:MM:SSZ)"""
+    return len(value) == 20 and value[10] == 'T' and value[-1] == 'Z'
+
+def parse_timestamp(value, local_tz=timezone.utc):
+    """
+    Lê um timestamp em qualquer formato já usado pelo projeto:
+    ISO 8601 (canônico ou com offset), YYYY-MM-DD HH:MM:SS e DD/MM/YYYY HH:MM
+    Os dois primeiros sem fuso são UTC; DD/MM/YYYY HH:MM (gravado com o
+    relógio local do servidor) é lido em local_tz. Retorna None se não reconhece.
+    """
+    if not value:
+        return None
+
+    # Canônico: campos em posições fixas
+    if is_canonical_timestamp(value):
+        try:
+            return datetime(
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                tzinfo=timezone.utc,
+            )
+        except ValueError:
+            return None
+
+    # Tenta ISO 8601
+    if 'T' in value:
+        try:
+            dt = datetime.fromisoformat(value)
+            return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+
+    # Tenta YYYY-MM-DD HH:MM:SS
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        pass
+
+    # Tenta DD/MM/YYYY HH:MM
+    try:
+        return datetime.strptime(value, '%d/%m/%Y %H:%M').replace(tzinfo=local_tz)
+    except ValueError:
+        return None
+
+def canonical_timestamp(value, local_tz=timezone.utc):
+    """Converte um timestamp legado para o formato canônico (inalterado se não reconhece)"""
+    if not value or is_canonical_timestamp(value):
+        return value
+    dt = parse_timestamp(value, local_tz)
+    return dt.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT) if dt else value
+
+def encode_id_set(ids):
+    """
+    Serializa um conjunto de IDs inteiros para a coluna likes_by
+    Em ordem, com sequências consecutivas como faixas: {1,2,3,7,9,10} -> '1-3;7;9-10'
+    """
+    parts = []
+    start = prev = None
+    for n in sorted(ids):
+        if prev is not None and n == prev + 1:
+            prev = n
+            continue
+        if start is not None:
+            parts.append(str(start) if start == prev else f'{start}-{prev}')
+        start = prev = n
+    if start is not None:
+        parts.append(str(start) if start == prev else f'{start}-{prev}')
+    return ';'.join(parts)
+
+def decode_id_set(text):
+    """Lê a coluna likes_by (faixas ou o formato antigo '1;2;3') como set de inteiros"""
+    ids = set()
+    for part in (text or '').split(';'):
+        start, _, end = part.strip().partition('-')
+        if not start.isdigit():
+            continue
+        if end.isdigit():
+            ids.update(range(int(start), int(end) + 1))
+        else:
+            ids.add(int(start))
+    return ids
+
+def public_user(row):
+    """Dados públicos do usuário (sem senha)"""
+    return {'id': row['id'], 'username': row['username'], 'email': row['email']}
+
+class UserRepository(ABC):
+    """Cadastro de usuários"""
+
+    @abstractmethod
+    def get(self, user_id):
+        """Usuário por ID (sem senha) ou None"""
+
+    @abstractmethod
+    def get_many(self, user_ids):
+        """{id: usuário (sem senha)} dos IDs que existem, numa única busca"""
+
+    @abstractmethod
+    def exists(self, user_id):
+        """Se existe usuário com o ID"""
+
+    @abstractmethod
+    def search(self, prefix, limit=10, exclude_id=None):
+        """
+        Até `limit` usuários (sem senha) cujo username ou email começa com
+        `prefix`, sem diferenciar maiúsculas; exclude_id fica de fora
+        """
+
+    @abstractmethod
+    def authenticate(self, login, password):
+        """Usuário (sem senha) cujo username ou email e senha conferem, ou None"""
+
+    @abstractmethod
+    def create(self, username, password, email):
+        """Cria o usuário e retorna o ID"""
+
+class PostRepository(ABC):
+    """Posts do feed"""
+
+    @abstractmethod
+    def all(self):
+        """Todos os posts"""
+
+    @abstractmethod
+    def page_by_author(self, author_id, before_id=None, limit=20):
+        """
+        (posts do autor com id < before_id, até `limit`, mais novos primeiro,
+        before_id da próxima página ou None se acabou)
+        """
+
+    @abstractmethod
+    def create(self, author_id, author_name, content):
+        """Cria o post e retorna o ID"""
+
+class LikeRepository(ABC):
+    """Curtidas dos posts"""
+
+    @abstractmethod
+    def toggle(self, post_id, user_id):
+        """Curte/descurte; retorna (curtiu_agora, total, author_id) ou None se o post não existe"""
+
+    @abstractmethod
+    def snapshot(self):
+        """{post_id: set(user_ids)} de todos os posts"""
+
+    @abstractmethod
+    def states(self, post_ids, user_id):
+        """
+        {post_id: (total, se user_id curtiu)} dos posts de `post_ids` que existem
+        (post_ids None traz todos os posts)
+        """
+
+    @abstractmethod
+    def version(self):
+        """Token opaco da versão global das curtidas"""
+
+    @abstractmethod
+    def changed_since(self, token, post_ids, user_id):
+        """
+        (token atual, {post_id: (total, se user_id curtiu)}) só dos posts de
+        `post_ids` que mudaram depois de `token`; token vazio ou desconhecido traz todos
+        """
+
+    def compact(self):
+        """Consolida o armazenamento de curtidas (quando o motor precisa)"""
+        return 0
+
+class MessageRepository(ABC):
+    """Mensagens diretas"""
+
+    @abstractmethod
+    def create(self, sender_id, receiver_id, content):
+        """Grava a mensagem e retorna (id, timestamp)"""
+
+    @abstractmethod
+    def conversation(self, user_a, user_b, since_id=0):
+        """Mensagens entre dois usuários com id > since_id, em ordem de id"""
+
+    @abstractmethod
+    def version(self, user_a, user_b):
+        """Token opaco que muda a cada mensagem da conversa"""
+
+class NotificationRepository(ABC):
+    """Notificações por usuário"""
+
+    @abstractmethod
+    def create(self, user_id, type, actor_id, post_id, text):
+        """Grava a notificação e retorna o ID"""
+
+    @abstractmethod
+    def create_many(self, items):
+        """Grava várias notificações (user_id, type, actor_id, post_id, text) de uma vez; retorna os IDs"""
+
+    @abstractmethod
+    def latest(self, user_id, limit=50):
+        """(até `limit` notificações mais recentes primeiro, total de não lidas)"""
+
+    @abstractmethod
+    def version(self, user_id):
+        """Token opaco que muda a cada notificação criada ou removida do usuário"""
+
+    @abstractmethod
+    def remove_friend_requests(self, target_user_id, requester_id):
+        """Remove notificações de solicitação de amizade; retorna quantas"""
+
+    @abstractmethod
+    def clear_user(self, user_id):
+        """Remove todas as notificações do usuário (marcar como lidas)"""
+
+    @abstractmethod
+    def compact(self, retention):
+        """Aplica uma NotificationRetention; retorna {'archived', 'coalesced', 'segments'}"""
+
+class FriendshipRepository(ABC):
+    """Solicitações e amizades. Status: '0' pendente, '1' aceita"""
+
+    @abstractmethod
+    def version(self, user_id):
+        """Token opaco que muda a cada solicitação ou amizade que envolve o usuário"""
+
+    @abstractmethod
+    def friends_of(self, user_id):
+        """IDs dos amigos mútuos"""
+
+    @abstractmethod
+    def are_friends(self, user_a, user_b):
+        """Se os dois têm amizade aceita"""
+
+    @abstractmethod
+    def incoming_requests(self, user_id):
+        """Solicitações pendentes recebidas: linhas com user1_id e timestamp"""
+
+    @abstractmethod
+    def has_pending(self, user_a, user_b):
+        """Se há solicitação pendente entre os dois (qualquer direção)"""
+
+    @abstractmethod
+    def create_request(self, sender_id, receiver_id):
+        """Cria solicitação pendente; False se já existe relação entre os dois"""
+
+    @abstractmethod
+    def update_status(self, requester_id, target_id, new_status):
+        """Muda o status de uma solicitação pendente; True se atualizou"""
+
+    @abstractmethod
+    def delete_pending(self, requester_id, target_id):
+        """Remove uma solicitação pendente; True se removeu"""
+
+class TimelineRepository(ABC):
+    """Feed de cada usuário: posts dele e dos amigos, do mais novo ao mais antigo"""
+
+    @abstractmethod
+    def page(self, user_id, before_id=None, limit=20):
+        """
+        (posts com id < before_id, até `limit`, mais novos primeiro,
+        before_id da próxima página ou None se acabou)
+        """
+
+class Storage(ABC):
+    """Conjunto de repositórios de um motor de armazenamento"""
+
+    name = None
+    users: UserRepository
+    posts: PostRepository
+    likes: LikeRepository
+    messages: MessageRepository
+    notifications: NotificationRepository
+    friends: FriendshipRepository
+    timeline: TimelineRepository
+
+    @abstractmethod
+    def init(self):
+        """Cria arquivos/esquema que ainda não existem"""
+
+    def warm(self):
+        """Pré-carrega o que o motor mantém em memória (chamado na inicialização)"""
+
+    def close(self):
+        """Libera recursos e conclui escritas pendentes"""
+
+    def stats(self):
+        """Contadores internos do motor"""
+        return {}
@@ -0,0 +1,1078 @@
+# storage/csv_engine.py
+"""
+========================================
+MOTOR DE ARMAZENAMENTO CSV
+========================================
+Repositórios sobre os arquivos de src/data:
+- Leituras pelo cache de tabelas (reparse só quando o arquivo muda)
+- Escritas pelo escritor único (group commit, lock entre processos)
+- IDs por sequências persistentes
+- Curtidas em log append-only compactado em segundo plano
+"""
+
+from collections import OrderedDict, deque
+from bisect import bisect_left, bisect_right, insort
+import threading
+import heapq
+import logging
+import secrets
+import time
+import csv
+import os
+
+from .base import (
+    Storage, UserRepository, PostRepository, LikeRepository, MessageRepository,
+    NotificationRepository, FriendshipRepository, TimelineRepository, USER_FIELDS, POST_FIELDS,
+    MESSAGE_FIELDS, NOTIFICATION_FIELDS, FRIEND_FIELDS, LIKE_LOG_FIELDS,
+    utc_now_iso, public_user, encode_id_set, decode_id_set,
+)
+from .csvio import TableCache, CsvWriter, IdSequence, DerivedIndex, RebuildIndex, file_lock, fsync_dir, ensure_csv_file, record_io
+from .segments import SegmentStore
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# USUÁRIOS
+# ========================================
+
+def normalize_login(value):
+    """Chave de busca de username/email (sem espaços nas pontas, minúsculas)"""
+    return (value or '').strip().casefold()
+
+class UserIndex(DerivedIndex):
+    """
+    Usuários por id e por login normalizado (username e email)
+    Cada chave de login guarda os candidatos em ordem do arquivo; a
+    comparação exata é feita na autenticação.
+    Para a busca por prefixo, `prefixes` mantém os pares (chave, id) ordenados.
+    """
+
+    def reset(self):
+        self.by_id = {}
+        self.by_login = {}
+        self.prefixes = []
+
+    def add(self, row):
+        uid = row.get('id')
+        if uid:
+            self.by_id.setdefault(uid, row)
+        for key in {normalize_login(row.get('username')), normalize_login(row.get('email'))}:
+            if key:
+                self.by_login.setdefault(key, []).append(row)
+                if uid:
+                    # Na reconstrução ordena uma vez no final
+                    if self._rebuilding:
+                        self.prefixes.append((key, uid))
+                    else:
+                        insort(self.prefixes, (key, uid))
+
+    def remove(self, row):
+        """Sem remoção incremental: o sync reconstrói"""
+        raise RebuildIndex('usuário removido')
+
+    def _rebuild(self, gen, rows, changes):
+        super()._rebuild(gen, rows, changes)
+        self.prefixes.sort()
+
+    def search(self, prefix, limit, exclude_id=None):
+        """IDs cujo login começa com `prefix`, na ordem das chaves, sem repetir"""
+        ids = []
+        i = bisect_left(self.prefixes, (prefix,))
+        while i < len(self.prefixes) and len(ids) < limit:
+            key, uid = self.prefixes[i]
+            if not key.startswith(prefix):
+                break
+            if uid != exclude_id and uid not in ids:
+                ids.append(uid)
+            i += 1
+        return ids
+
+class CsvUserRepository(UserRepository):
+
+    def __init__(self, store):
+        self.store = store
+        self.path = store.users_path
+        self.index = UserIndex(store.cache, self.path)
+
+    def get(self, user_id):
+        with self.index.synced() as idx:
+            row = idx.by_id.get(str(user_id))
+        return public_user(row) if row is not None else None
+
+    def get_many(self, user_ids):
+        with self.index.synced() as idx:
+            rows = [idx.by_id.get(str(uid)) for uid in user_ids]
+        return {r['id']: public_user(r) for r in rows if r is not None}
+
+    def exists(self, user_id):
+        with self.index.synced() as idx:
+            return str(user_id) in idx.by_id
+
+    def search(self, prefix, limit=10, exclude_id=None):
+        prefix = normalize_login(prefix)
+        if not prefix:
+            return []
+        exclude = str(exclude_id) if exclude_id is not None else None
+        with self.index.synced() as idx:
+            rows = [idx.by_id[uid] for uid in idx.search(prefix, limit, exclude)]
+        return [public_user(r) for r in rows]
+
+    def authenticate(self, login, password):
+        with self.index.synced() as idx:
+            candidates = list(idx.by_login.get(normalize_login(login), ()))
+
+        for row in candidates:
+            row_user = (row.get('username') or '').strip()
+            row_email = (row.get('email') or '').strip()
+            row_pass = (row.get('password') or '').strip()
+
+            credencial_ok = (login == row_user) or (login == row_email)
+            if credencial_ok and password == row_pass:
+                return {'id': row.get('id'), 'username': row_user, 'email': row_email}
+        return None
+
+    def create(self, username, password, email):
+        uid = self.store.user_ids.next()
+        # O append atualiza o cache sem mudar a geração: o índice só lê a linha nova
+        self.store.writer.append(self.path, [[uid, username, password, email]])
+        return str(uid)
+
+# ========================================
+# POSTS
+# ========================================
+
+def _insert_sorted(ids, value):
+    """Insere em lista ordenada sem repetir (O(1) no caso comum: maior que todos)"""
+    if not ids or value > ids[-1]:
+        ids.append(value)
+        return True
+    pos = bisect_left(ids, value)
+    if pos < len(ids) and ids[pos] == value:
+        return False
+    ids.insert(pos, value)
+    return True
+
+class PostIndex(DerivedIndex):
+    """Posts por id e IDs (int, crescentes) de cada autor"""
+
+    def reset(self):
+        self.by_id = {}
+        self.by_author = {}
+
+    def add(self, row):
+        try:
+            pid = int(row.get('id') or '')
+        except ValueError:
+            return
+        author = row.get('author_id')
+        if not author:
+            return
+        self.by_id[pid] = row
+        _insert_sorted(self.by_author.setdefault(author, []), pid)
+        self.notify('post_added', pid, author)
+
+    def remove(self, row):
+        """Sem remoção incremental: o sync reconstrói"""
+        raise RebuildIndex('post removido')
+
+    def update(self, old, new):
+        """Mesmo id e autor (compactação das curtidas): só troca a linha"""
+        pid = old.get('id')
+        if pid and pid.isdigit() and pid == new.get('id') and old.get('author_id') == new.get('author_id'):
+            if int(pid) in self.by_id:
+                self.by_id[int(pid)] = new
+                return
+        super().update(old, new)
+
+class CsvPostRepository(PostRepository):
+
+    def __init__(self, store):
+        self.store = store
+        self.path = store.posts_path
+        self.index = PostIndex(store.cache, self.path)
+
+    def all(self):
+        return self.store.cache.rows(self.path)
+
+    def page_by_author(self, author_id, before_id=None, limit=20):
+        with self.index.synced() as idx:
+            ids = idx.by_author.get(str(author_id), [])
+            end = bisect_left(ids, int(before_id)) if before_id else len(ids)
+            start = max(0, end - limit)
+            rows = [idx.by_id[pid] for pid in reversed(ids[start:end])]
+            return rows, (ids[start] if start > 0 else None)
+
+    def create(self, author_id, author_name, content):
+        pid = self.store.post_ids.next()
+        self.store.writer.append(self.path, [[
+            pid, author_id, author_name, utc_now_iso(), content,
+            0,   # likes
+            ''   # likes_by
+        ]])
+        return str(pid)
+
+# ========================================
+# CURTIDAS (LOG APPEND-ONLY)
+# ========================================
+
+class CsvLikeRepository(LikeRepository):
+    """
+    Curtidas como log append-only (post_id, user_id, +/-) em likes_log.csv
+    Mantém em memória um set de IDs inteiros por post: a base vem de
+    posts.csv (likes_by, em faixas) e o log é reaplicado por cima, lendo só o trecho
+    novo do arquivo. Um compactador em segundo plano dobra o log de volta
+    em posts.csv e zera o log.
+
+    O log não passa pelo CsvWriter: o toggle decide o sinal e grava sob o
+    mesmo lock do log (append com fsync), e o CsvWriter leria o log inteiro
+    a cada commit.
+
+    Mudanças de posts.csv na mesma geração do cache (posts novos, a própria
+    compactação) são aplicadas pelo changelog; a visão só é reconstruída
+    numa geração nova ou quando o log é trocado/encurtado por outro processo.
+
+    Cada mudança de curtida incrementa uma versão global e registra em que
+    versão cada post mudou pela última vez. A versão vai para o cliente como
+    token '<época>.<n>': a época é sorteada por processo, então um token de
+    outro processo (ou de antes de reiniciar) vale como "sem versão".
+    """
+
+    def __init__(self, store, compact_seconds=30):
+        self.store = store
+        self.posts_path = store.posts_path
+        self.log_path = store.likes_log_path
+        self.compact_seconds = compact_seconds
+        self._lock = threading.RLock()
+        self._base_gen = None
+        self._base_seen = 0
+        self._log_ino = None
+        self._offset = 0
+        self._pending = 0
+        self._likes = {}  # post_id -> set(int) de quem curtiu
+        self._authors = {}
+        self._compactor = None
+        self._rebuilt_from = None
+        self._epoch = secrets.token_hex(4)
+        self._version = 0
+        self._changed = {}  # post_id -> versão da última mudança
+
+    def _rebuild(self, gen, rows, changes, log_ino):
+        """Recarrega a visão a partir de posts.csv (o log será reaplicado inteiro)"""
+        old = self._likes
+        self._likes = {}
+        self._authors = {}
+        for r in rows:
+            pid = r.get('id')
+            if not pid:
+                continue
+            self._authors[pid] = r.get('author_id')
+            self._likes[pid] = decode_id_set(r.get('likes_by'))
+        record_io(rows_scanned=len(rows))
+        self._base_gen = gen
+        self._base_seen = len(changes)
+        self._log_ino = log_ino
+        self._offset = 0
+        self._pending = 0
+        # Marca só o que mudou em relação à visão anterior
+        # (depois de uma compactação, o log reaplicado volta ao mesmo estado)
+        self._rebuilt_from = old
+
+    def _settle_rebuild(self):
+        """Após reaplicar o log, versiona os posts que diferem da visão anterior"""
+        old = self._rebuilt_from
+        if old is None:
+            return
+        self._rebuilt_from = None
+        for pid in old.keys() | self._likes.keys():
+            if old.get(pid) != self._likes.get(pid):
+                self._bump(pid)
+
+    def _bump(self, pid):
+        self._version += 1
+        self._changed[pid] = self._version
+
+    def _apply(self, pid, uid, op):
+        if not uid.isdigit():
+            return
+        uid = int(uid)
+        likers = self._likes.setdefault(pid, set())
+        if op == '+':
+            likers.add(uid)
+        else:
+            likers.discard(uid)
+        if self._rebuilt_from is None:
+            self._bump(pid)
+
+    def _apply_changes(self, changes):
+        """Aplica os eventos novos do changelog de posts.csv"""
+        for event in changes[self._base_seen:]:
+            row = event[-1]
+            pid = row.get('id')
+            if not pid:
+                continue
+            if event[0] == 'remove':
+                self._authors.pop(pid, None)
+                self._likes.pop(pid, None)
+                self._bump(pid)
+            elif event[0] == 'add':
+                self._authors[pid] = row.get('author_id')
+                self._likes[pid] = decode_id_set(row.get('likes_by'))
+                self._bump(pid)
+            else:
+                # Nesta geração só a compactação muda likes_by, e ela dobra
+                # o que a visão já tem: o conjunto em memória continua valendo
+                self._authors[pid] = row.get('author_id')
+                self._likes.setdefault(pid, set())
+        self._base_seen = len(changes)
+
+    def _refresh(self):
+        """Sincroniza a visão com posts.csv e com o trecho novo do log"""
+        gen, _, rows, changes = self.store.cache.read_changelog(self.posts_path)
+        st = os.stat(self.log_path)
+        if gen != self._base_gen or st.st_ino != self._log_ino or st.st_size < self._offset:
+            self._rebuild(gen, rows, changes, st.st_ino)
+        elif len(changes) > self._base_seen:
+            self._apply_changes(changes)
+        try:
+            self._replay(st.st_size)
+        finally:
+            self._settle_rebuild()
+
+    def _replay(self, size):
+        """Reaplica o trecho do log entre o offset atual e `size`"""
+        if size <= self._offset:
+            return
+
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+
+        # Só consome linhas completas
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return
+        lines = chunk[:end].decode('utf-8').splitlines()
+        for rec in csv.reader(lines):
+            if len(rec) < 3 or rec[0] == 'post_id':
+                continue
+            self._apply(rec[0], rec[1], rec[2])
+            self._pending += 1
+        self._offset += end
+        record_io(files_opened=1, bytes_read=end, rows_scanned=len(lines))
+
+    def toggle(self, post_id, user_id):
+        pid = str(post_id)
+        uid = str(user_id)
+        with self._lock, file_lock(self.log_path + '.lock'):
+            self._refresh()
+            if pid not in self._authors:
+                return None
+
+            op = '-' if self._liked(pid, uid) else '+'
+            with open(self.log_path, 'a', newline='', encoding='utf-8') as f:
+                start = f.tell()
+                csv.writer(f).writerow([pid, uid, op, utc_now_iso()])
+                f.flush()
+                # Durável antes de responder, como os commits do escritor
+                os.fsync(f.fileno())
+                self._offset = f.tell()
+            record_io(files_opened=1, bytes_written=self._offset - start)
+            self._apply(pid, uid, op)
+            self._pending += 1
+            result = (op == '+', len(self._likes.get(pid, ())), self._authors[pid])
+
+        self._ensure_compactor()
+        return result
+
+    def _liked(self, pid, uid):
+        return uid.isdigit() and int(uid) in self._likes.get(pid, ())
+
+    def _state(self, pid, uid):
+        return len(self._likes.get(pid, ())), self._liked(pid, uid)
+
+    def snapshot(self):
+        with self._lock:
+            self._refresh()
+            return {pid: {str(x) for x in likers} for pid, likers in self._likes.items()}
+
+    def states(self, post_ids, user_id):
+        uid = str(user_id)
+        with self._lock:
+            self._refresh()
+            pids = self._authors if post_ids is None else (str(p) for p in post_ids)
+            return {pid: self._state(pid, uid) for pid in pids if pid in self._authors}
+
+    def _token(self):
+        return f'{self._epoch}.{self._version}'
+
+    def version(self):
+        with self._lock:
+            self._refresh()
+            return self._token()
+
+    def changed_since(self, token, post_ids, user_id):
+        epoch, _, n = (token or '').partition('.')
+        since = int(n) if epoch == self._epoch and n.isdigit() else None
+        uid = str(user_id)
+        with self._lock:
+            self._refresh()
+            changed = {}
+            for pid in post_ids:
+                pid = str(pid)
+                if pid not in self._authors:
+                    continue
+                if since is None or self._changed.get(pid, 0) > since:
+                    changed[pid] = self._state(pid, uid)
+            return self._token(), changed
+
+    def compact(self):
+        """Dobra o log em posts.csv e zera o log; retorna quantos eventos foram dobrados"""
+        with self._lock, file_lock(self.log_path + '.lock'):
+            self._refresh()
+            if not self._pending:
+                return 0
+
+            folded = self._pending
+            likes = self._likes
+
+            def fold(rows):
+                new_rows = []
+                changes = []
+                for r in rows:
+                    likers = likes.get(r.get('id'))
+                    if likers is not None:
+                        new = dict(r, likes=str(len(likers)), likes_by=encode_id_set(likers))
+                        if new != r:
+                            changes.append(('update', r, new))
+                            r = new
+                    new_rows.append(r)
+                # Reescrita descrita: mantém a geração (e os índices de posts e timelines)
+                return (new_rows if changes else None), None, changes
+
+            # Primeiro a nova base, depois o log vazio: reaplicar o log antigo
+            # sobre a base nova dá o mesmo resultado
+            self.store.writer.rewrite(self.posts_path, fold)
+            tmp = f'{self.log_path}.{os.getpid()}.tmp'
+            with open(tmp, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(LIKE_LOG_FIELDS)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.log_path)
+            fsync_dir(os.path.dirname(self.log_path))
+
+            # A visão já é a base nova: adota o log vazio sem reconstruir
+            st = os.stat(self.log_path)
+            self._log_ino = st.st_ino
+            self._offset = st.st_size
+            self._pending = 0
+            self._refresh()
+        return folded
+
+    def _ensure_compactor(self):
+        """Inicia (uma vez por processo) a thread de compactação"""
+        with self._lock:
+            if self._compactor is not None:
+                return
+            self._compactor = threading.Thread(target=self._compact_loop, name='likes-compactor', daemon=True)
+            self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.compact_seconds)
+            try:
+                self.compact()
+            except Exception:
+                logger.exception('Falha ao compactar o log de curtidas')
+
+# ========================================
+# MENSAGENS
+# ========================================
+
+def conversation_key(user_a, user_b):
+    """Chave da conversa entre dois usuários (independe de quem enviou)"""
+    a, b = str(user_a), str(user_b)
+    return (a, b) if a <= b else (b, a)
+
+class MessageIndex(DerivedIndex):
+    """
+    Mensagens por conversa, com os IDs de cada conversa em ordem
+    Busca por since_id com bisect: O(log n + mensagens novas)
+    """
+
+    def reset(self):
+        self.conversations = {}  # chave -> ([ids], [linhas]) paralelos
+
+    def add(self, row):
+        try:
+            mid = int(row.get('id') or '')
+        except ValueError:
+            return
+        key = conversation_key(row.get('sender_id'), row.get('receiver_id'))
+        self.touch(key)
+        ids, rows = self.conversations.setdefault(key, ([], []))
+        if not ids or mid > ids[-1]:
+            ids.append(mid)
+            rows.append(row)
+        else:
+            # Fora de ordem (CSV editado à mão): mantém a lista ordenada
+            pos = bisect_right(ids, mid)
+            ids.insert(pos, mid)
+            rows.insert(pos, row)
+
+    def remove(self, row):
+        """Sem remoção incremental: o sync reconstrói"""
+        raise RebuildIndex('mensagem removida')
+
+    def since(self, user_a, user_b, since_id):
+        ids, rows = self.conversations.get(conversation_key(user_a, user_b), ((), ()))
+        return list(rows[bisect_right(ids, since_id):])
+
+class CsvMessageRepository(MessageRepository):
+    """
+    messages.csv é o segmento ativo; o histórico fica em segmentos selados
+    (ver segments.py). Com segment_rows, ao passar desse número de linhas o
+    ativo é selado em segundo plano, então o índice em memória e o custo de
+    inicialização acompanham só o segmento ativo.
+    """
+
+    def __init__(self, store, segment_rows=0):
+        self.store = store
+        self.path = store.messages_path
+        self.index = MessageIndex(store.cache, self.path)
+        self.segments = SegmentStore(store.message_segments_dir)
+        self.segment_rows = segment_rows
+        self._rotate_lock = threading.Lock()
+        self._rotation_pending = threading.Lock()
+
+    def create(self, sender_id, receiver_id, content):
+        mid = self.store.message_ids.next()
+        now = utc_now_iso()
+        self.store.writer.append(self.path, [[mid, sender_id, receiver_id, now, content]])
+        if self.segment_rows and len(self.store.cache.rows(self.path)) >= self.segment_rows:
+            self._rotate_in_background()
+        return mid, now
+
+    def conversation(self, user_a, user_b, since_id=0):
+        # Ativo antes dos selados: uma rotação no meio pode repetir linhas, nunca perder
+        with self.index.synced() as idx:
+            active = idx.since(user_a, user_b, since_id)
+        sealed = self.segments.conversation(user_a, user_b, since_id)
+        if not sealed:
+            return active
+        seen = {r['id'] for r in active}
+        rows = [r for r in sealed if r['id'] not in seen] + active
+        rows.sort(key=lambda r: int(r['id']))
+        return rows
+
+    def version(self, user_a, user_b):
+        return self.index.version(conversation_key(user_a, user_b))
+
+    def all_rows(self):
+        """Todas as mensagens: seladas e depois as do arquivo ativo"""
+        yield from self.segments.rows()
+        yield from self.store.cache.rows(self.path)
+
+    def rotate(self, segment_rows=None, seal_all=False):
+        """
+        Sela o arquivo ativo em segmentos de segment_rows linhas
+        O resto (menos que um segmento) continua ativo, a não ser com seal_all
+        Retorna os nomes dos segmentos criados
+        """
+        size = segment_rows or self.segment_rows
+
+        def apply(current):
+            valid = sorted((r for r in current if (r.get('id') or '').isdigit()), key=lambda r: int(r['id']))
+            invalid = [r for r in current if not (r.get('id') or '').isdigit()]
+            count = len(valid) if seal_all or not size else len(valid) // size * size
+            if not count:
+                return None, []
+            step = size or count
+            sealed = [self.segments.seal(valid[i:i + step]).name for i in range(0, count, step)]
+            return invalid + valid[count:], sealed
+
+        with self._rotate_lock:
+            return self.store.writer.rewrite(self.path, apply)
+
+    def reindex(self):
+        """Reconstrói o índice de todos os segmentos selados; retorna {segmento: linhas}"""
+        return self.segments.reindex()
+
+    def _rotate_in_background(self):
+        """Dispara (no máximo uma por vez) a rotação numa thread"""
+        if not self._rotation_pending.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.rotate()
+            except Exception:
+                logger.exception('Falha ao rotacionar messages.csv')
+            finally:
+                self._rotation_pending.release()
+
+        threading.Thread(target=run, name='messages-rotation', daemon=True).start()
+
+# ========================================
+# NOTIFICAÇÕES
+# ========================================
+
+def _notification_id(row):
+    try:
+        return int(row.get('id') or 0)
+    except ValueError:
+        return 0
+
+class NotificationIndex(DerivedIndex):
+    """
+    Notificações por usuário em ordem de ID, com contador de não lidas
+    As mais recentes ficam no fim das listas: o topo sai por fatia reversa
+    """
+
+    def reset(self):
+        self.by_user = {}  # uid -> ([ids], [linhas]) paralelos
+        self.unread = {}   # uid -> nº de não lidas
+
+    def add(self, row):
+        uid = row.get('user_id')
+        nid = _notification_id(row)
+        self.touch(uid)
+        ids, rows = self.by_user.setdefault(uid, ([], []))
+        if not ids or nid >= ids[-1]:
+            ids.append(nid)
+            rows.append(row)
+        else:
+            pos = bisect_right(ids, nid)
+            ids.insert(pos, nid)
+            rows.insert(pos, row)
+        if (row.get('read') or '0') == '0':
+            self.unread[uid] = self.unread.get(uid, 0) + 1
+
+    def remove(self, row):
+        uid = row.get('user_id')
+        self.touch(uid)
+        ids, rows = self.by_user.get(uid, ((), ()))
+        pos = bisect_right(ids, _notification_id(row)) - 1
+        # IDs repetidos: procura a própria linha entre os iguais
+        while pos >= 0 and rows[pos] is not row:
+            pos -= 1
+        if pos < 0:
+            raise RebuildIndex('notificação fora do índice')
+        del ids[pos]
+        del rows[pos]
+        if (row.get('read') or '0') == '0':
+            self.unread[uid] -= 1
+
+    def latest(self, user_id, limit):
+        _, rows = self.by_user.get(user_id, ((), ()))
+        return rows[:-limit - 1:-1]
+
+class CsvNotificationRepository(NotificationRepository):
+
+    def __init__(self, store):
+        self.store = store
+        self.path = store.notifications_path
+        self.index = NotificationIndex(store.cache, self.path)
+
+    def create(self, user_id, type, actor_id, post_id, text):
+        return self.create_many([(user_id, type, actor_id, post_id, text)])[0]
+
+    def create_many(self, items):
+        if not items:
+            return []
+        # Um bloco de IDs e um único append para o lote inteiro
+        ids = self.store.notif_ids.reserve(len(items))
+        now = utc_now_iso()
+        self.store.writer.append(self.path, [
+            [
+                nid,
+                str(user_id),
+                type,
+                str(actor_id) if actor_id else '',
+                str(post_id) if post_id else '',
+                now,
+                '0',  # não lida
+                text
+            ]
+            for nid, (user_id, type, actor_id, post_id, text) in zip(ids, items)
+        ])
+        return [str(nid) for nid in ids]
+
+    def latest(self, user_id, limit=50):
+        user_id = str(user_id)
+        with self.index.synced() as idx:
+            return idx.latest(user_id, limit), idx.unread.get(user_id, 0)
+
+    def version(self, user_id):
+        return self.index.version(str(user_id))
+
+    def _remove_where(self, predicate):
+        """Reescreve o CSV sem as linhas que casam; retorna quantas saíram"""
+
+        def apply(current):
+            rows = []
+            changes = []
+            for r in current:
+                if predicate(r):
+                    changes.append(('remove', r))
+                else:
+                    rows.append(r)
+            return (rows if changes else None), len(changes), changes
+
+        return self.store.writer.rewrite(self.path, apply)
+
+    def remove_friend_requests(self, target_user_id, requester_id):
+        target_user_id = str(target_user_id)
+        requester_id = str(requester_id)
+
+        with self.index.synced() as idx:
+            # Nada a remover: evita reescrever o arquivo
+            if not any(r.get('type') == 'friend_request' and r.get('actor_id') == requester_id
+                       for r in idx.by_user.get(target_user_id, ((), ()))[1]):
+                return 0
+
+        # Remove notificações de friend_request relacionadas
+        return self._remove_where(
+            lambda r: (r.get('user_id') == target_user_id and
+                       r.get('type') == 'friend_request' and
+                       r.get('actor_id') == requester_id)
+        )
+
+    def clear_user(self, user_id):
+        user_id = str(user_id)
+
+        with self.index.synced() as idx:
+            if not idx.by_user.get(user_id, ((), ()))[0]:
+                return 0
+
+        return self._remove_where(lambda r: r.get('user_id') == user_id)
+
+    def compact(self, retention):
+
+        def apply(current):
+            keep, archived, coalesced = retention.split(current)
+            if not archived and not coalesced:
+                return None, {'archived': 0, 'coalesced': 0, 'segments': {}}
+            # Arquiva antes de trocar o arquivo: uma queda no meio duplica no arquivo, não perde
+            segments = retention.archive(archived)
+            changes = [('remove', r) for r in archived + coalesced]
+            return keep, {'archived': len(archived), 'coalesced': len(coalesced), 'segments': segments}, changes
+
+        return self.store.writer.rewrite(self.path, apply)
+
+# ========================================
+# AMIZADES
+# ========================================
+
+class FriendIndex(DerivedIndex):
+    """
+    Lista de adjacência das amizades
+    Por usuário: amigos aceitos, solicitações enviadas e recebidas
+    (pendentes). Conta as linhas de cada aresta, então linhas duplicadas
+    no CSV não somem do índice quando só uma delas é removida.
+    """
+
+    def reset(self):
+        self.accepted = {}   # uid -> {amigo: None} (ordem de inserção)
+        self.outgoing = {}   # uid -> {destinatário: linha}
+        self.incoming = {}   # uid -> {remetente: linha}
+        self.pairs = {}      # (menor, maior) -> nº de linhas entre os dois
+        self._edges = {}     # (status, user1, user2) -> nº de linhas
+
+    @staticmethod
+    def pair(a, b):
+        return (a, b) if a <= b else (b, a)
+
+    def add(self, row):
+        a, b, status = row.get('user1_id'), row.get('user2_id'), row.get('status')
+        if not a or not b:
+            return
+        self.touch(a, b)
+        key = self.pair(a, b)
+        self.pairs[key] = self.pairs.get(key, 0) + 1
+
+        edge = (status, a, b)
+        self._edges[edge] = self._edges.get(edge, 0) + 1
+        if status == '1' and a != b:
+            linked = b not in self.accepted.get(a, ())
+            self.accepted.setdefault(a, {})[b] = None
+            self.accepted.setdefault(b, {})[a] = None
+            if linked:
+                self.notify('friendship_changed', a, b, True)
+        elif status == '0':
+            self.outgoing.setdefault(a, {})[b] = row
+            self.incoming.setdefault(b, {})[a] = row
+
+    def remove(self, row):
+        a, b, status = row.get('user1_id'), row.get('user2_id'), row.get('status')
+        if not a or not b:
+            return
+        self.touch(a, b)
+        key = self.pair(a, b)
+        self.pairs[key] -= 1
+        if not self.pairs[key]:
+            del self.pairs[key]
+
+        edge = (status, a, b)
+        self._edges[edge] -= 1
+        if self._edges[edge]:
+            return
+        del self._edges[edge]
+        if status == '1' and a != b:
+            # Pode haver aresta aceita na direção oposta
+            if ('1', b, a) not in self._edges:
+                self.accepted[a].pop(b, None)
+                self.accepted[b].pop(a, None)
+                self.notify('friendship_changed', a, b, False)
+        elif status == '0':
+            self.outgoing[a].pop(b, None)
+            self.incoming[b].pop(a, None)
+
+class CsvFriendshipRepository(FriendshipRepository):
+
+    def __init__(self, store):
+        self.store = store
+        self.path = store.friends_path
+        self.index = FriendIndex(store.cache, self.path)
+
+    def version(self, user_id):
+        return self.index.version(str(user_id))
+
+    def friends_of(self, user_id):
+        with self.index.synced() as idx:
+            return list(idx.accepted.get(str(user_id), ()))
+
+    def are_friends(self, user_a, user_b):
+        with self.index.synced() as idx:
+            return str(user_b) in idx.accepted.get(str(user_a), ())
+
+    def incoming_requests(self, user_id):
+        # Status '0' = pendente, user2 é quem recebe
+        with self.index.synced() as idx:
+            return list(idx.incoming.get(str(user_id), {}).values())
+
+    def has_pending(self, user_a, user_b):
+        a = str(user_a)
+        b = str(user_b)
+        with self.index.synced() as idx:
+            return b in idx.outgoing.get(a, ()) or a in idx.outgoing.get(b, ())
+
+    def create_request(self, sender_id, receiver_id):
+        s = str(sender_id)
+        r = str(receiver_id)
+
+        # Sob o lock do índice: duas solicitações simultâneas não passam juntas
+        with self.index.synced() as idx:
+            # Verifica se já existe alguma relação
+            if idx.pair(s, r) in idx.pairs:
+                return False
+
+            # Cria nova solicitação pendente
+            self.store.writer.append(self.path, [[
+                s, r, '0', utc_now_iso()
+            ]])
+        return True
+
+    def update_status(self, requester_id, target_id, new_status):
+        requester_id = str(requester_id)
+        target_id = str(target_id)
+
+        def apply(current):
+            changes = []
+            rows = []
+            for row in current:
+                # Atualiza se encontrar a solicitação pendente
+                if (row.get('user1_id') == requester_id and
+                    row.get('user2_id') == target_id and
+                    row.get('status') == '0'):
+                    new_row = dict(row, status=str(new_status))
+                    changes.append(('update', row, new_row))
+                    row = new_row
+                rows.append(row)
+            # Só reescreve o arquivo se houve mudança
+            return (rows if changes else None), bool(changes), changes
+
+        return self.store.writer.rewrite(self.path, apply)
+
+    def delete_pending(self, requester_id, target_id):
+        requester_id = str(requester_id)
+        target_id = str(target_id)
+
+        def apply(current):
+            # Filtra removendo a solicitação pendente
+            rows = []
+            changes = []
+            for r in current:
+                if (r.get('user1_id') == requester_id and
+                    r.get('user2_id') == target_id and
+                    r.get('status') == '0'):
+                    changes.append(('remove', r))
+                else:
+                    rows.append(r)
+            # Só reescreve se removeu algo
+            return (rows if changes else None), bool(changes), changes
+
+        return self.store.writer.rewrite(self.path, apply)
+
+# ========================================
+# TIMELINE (FEED)
+# ========================================
+
+class CsvTimelineRepository(TimelineRepository):
+    """
+    Timeline materializada por usuário: IDs (crescentes) dos posts dele e
+    dos amigos. Montada na primeira leitura do usuário e depois mantida por
+    fan-out: post novo entra na timeline do autor e dos amigos; amizade
+    aceita traz os posts do novo amigo; amizade desfeita os retira.
+    Os índices de posts e amizades avisam as mudanças numa fila, aplicada
+    sob o lock da timeline antes de cada leitura.
+    Só as max_timelines usadas mais recentemente ficam montadas (LRU); a de
+    um usuário descartado é remontada pelo índice na próxima leitura.
+    """
+
+    def __init__(self, store, max_timelines=10000):
+        self.posts = store.posts.index
+        self.friends = store.friends.index
+        self.max_timelines = max(1, max_timelines)
+        self.lock = threading.RLock()
+        self.timelines = OrderedDict()
+        self._events = deque()
+        self.posts.observers.append(self)
+        self.friends.observers.append(self)
+
+    # Observador dos índices (chamado sob o lock deles: só enfileira)
+    # Sem timeline montada não há o que manter: a montagem já lê o índice atual
+    def post_added(self, pid, author):
+        if self.timelines:
+            self._events.append(('post', pid, author))
+
+    def friendship_changed(self, a, b, linked):
+        if self.timelines:
+            self._events.append(('friends', a, b, linked))
+
+    def index_reset(self, index):
+        self._events.append(('reset',))
+
+    def _build(self, user_id):
+        authors = [user_id, *self.friends.accepted.get(user_id, ())]
+        merged = heapq.merge(*(self.posts.by_author.get(a, ()) for a in authors))
+        ids = []
+        for pid in merged:
+            if not ids or ids[-1] != pid:
+                ids.append(pid)
+        return ids
+
+    def _drain(self):
+        """Aplica as mudanças enfileiradas às timelines já montadas"""
+        while self._events:
+            event = self._events.popleft()
+            if event[0] == 'reset':
+                self.timelines.clear()
+            elif event[0] == 'post':
+                _, pid, author = event
+                for uid in (author, *self.friends.accepted.get(author, ())):
+                    ids = self.timelines.get(uid)
+                    if ids is not None:
+                        _insert_sorted(ids, pid)
+            else:
+                _, a, b, linked = event
+                for user, other in ((a, b), (b, a)):
+                    ids = self.timelines.get(user)
+                    if ids is None:
+                        continue
+                    if linked:
+                        for pid in self.posts.by_author.get(other, ()):
+                            _insert_sorted(ids, pid)
+                    else:
+                        gone = set(self.posts.by_author.get(other, ()))
+                        ids[:] = [pid for pid in ids if pid not in gone]
+
+    def page(self, user_id, before_id=None, limit=20):
+        user_id = str(user_id)
+        with self.lock, self.friends.synced(), self.posts.synced():
+            self._drain()
+            ids = self.timelines.get(user_id)
+            if ids is None:
+                ids = self.timelines[user_id] = self._build(user_id)
+                while len(self.timelines) > self.max_timelines:
+                    self.timelines.popitem(last=False)
+            else:
+                self.timelines.move_to_end(user_id)
+
+            end = bisect_left(ids, int(before_id)) if before_id else len(ids)
+            start = max(0, end - limit)
+            rows = [self.posts.by_id[pid] for pid in reversed(ids[start:end])]
+            return rows, (ids[start] if start > 0 else None)
+
+# ========================================
+# STORAGE CSV
+# ========================================
+
+class CsvStorage(Storage):
+    """Motor padrão: um CSV por tabela em data_dir"""
+
+    name = 'csv'
+
+    def __init__(self, data_dir, write_batch_ms=2, likes_compact_seconds=30, message_segment_rows=0,
+                 timeline_cache=10000):
+        self.data_dir = data_dir
+        self.users_path = os.path.join(data_dir, 'users.csv')
+        self.messages_path = os.path.join(data_dir, 'messages.csv')
+        self.message_segments_dir = os.path.join(data_dir, 'messages')
+        self.posts_path = os.path.join(data_dir, 'posts.csv')
+        self.notifications_path = os.path.join(data_dir, 'notifications.csv')
+        self.friends_path = os.path.join(data_dir, 'friends.csv')
+        self.likes_log_path = os.path.join(data_dir, 'likes_log.csv')
+
+        # Sequências de IDs persistidas (geradas em tempo de execução)
+        self.seq_dir = os.path.join(data_dir, '.seq')
+
+        self.cache = TableCache()
+        self.writer = CsvWriter(self.cache, batch_ms=write_batch_ms)
+        self.init()
+
+        self.user_ids = IdSequence('users', self.seq_dir, self.users_path, self.cache)
+        # IDs de mensagens também já foram usados nos segmentos selados
+        self.message_ids = IdSequence(
+            'messages', self.seq_dir, self.messages_path, self.cache,
+            history_max=lambda: self.messages.segments.max_id(),
+        )
+        self.post_ids = IdSequence('posts', self.seq_dir, self.posts_path, self.cache)
+        self.notif_ids = IdSequence('notifications', self.seq_dir, self.notifications_path, self.cache)
+
+        self.users = CsvUserRepository(self)
+        self.posts = CsvPostRepository(self)
+        self.likes = CsvLikeRepository(self, compact_seconds=likes_compact_seconds)
+        self.messages = CsvMessageRepository(self, segment_rows=message_segment_rows)
+        self.notifications = CsvNotificationRepository(self)
+        self.friends = CsvFriendshipRepository(self)
+        self.timeline = CsvTimelineRepository(self, max_timelines=timeline_cache)
+
+    def init(self):
+        """Garante que todos os CSVs existem com cabeçalho"""
+        ensure_csv_file(self.users_path, USER_FIELDS)
+        ensure_csv_file(self.messages_path, MESSAGE_FIELDS)
+        ensure_csv_file(self.posts_path, POST_FIELDS)
+        ensure_csv_file(self.notifications_path, NOTIFICATION_FIELDS)
+        ensure_csv_file(self.friends_path, FRIEND_FIELDS)
+        ensure_csv_file(self.likes_log_path, LIKE_LOG_FIELDS)
+
+    def warm(self):
+        """Carrega as tabelas e monta os índices em memória"""
+        self.users.index.sync()
+        self.friends.index.sync()
+        self.posts.index.sync()
+        self.messages.index.sync()
+        self.notifications.index.sync()
+        self.likes.snapshot()
+
+    def close(self):
+        self.likes.compact()
+        self.writer.flush()
+
+    def stats(self):
+        return {
+            'cache': self.cache.stats(),
+            'writer': {'commits': self.writer.commits, 'mutations': self.writer.mutations},
+            'message_segments': len(self.messages.segments.list()),
+            'timelines': len(self.timeline.timelines),
+        }
@@ -0,0 +1,596 @@
+# storage/csvio.py
+"""
+========================================
+INFRAESTRUTURA DE E/S DOS CSVs
+========================================
+Peças usadas pelo motor CSV:
+- Cache de tabelas parseadas com invalidação por stat
+- Lock entre processos
+- Escritor único com group commit
+- Sequências persistentes de IDs
+- Versões por chave para GET condicional
+- Contadores de E/S por requisição
+"""
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+import itertools
+import threading
+import secrets
+import time
+import csv
+import os
+
+try:
+    import fcntl  # Lock entre processos (indisponível no Windows)
+except ImportError:
+    fcntl = None
+
+# ========================================
+# CONTADORES DE E/S
+# ========================================
+
+class IoStats:
+    """
+    E/S de CSV atribuída a uma unidade de trabalho (em geral, uma requisição)
+    Ligada à thread com track_io(); o escritor leva o contador de quem
+    submeteu cada mutação até a thread de commit. Mutações agrupadas num
+    mesmo commit dividem os bytes escritos.
+    """
+
+    FIELDS = ('files_opened', 'rows_scanned', 'bytes_read', 'bytes_written', 'rewrites', 'cache_hits')
+    __slots__ = FIELDS
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+
+    def add(self, **deltas):
+        for name, value in deltas.items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+_io_local = threading.local()
+
+def current_io():
+    """Contador ligado à thread atual (None se ninguém está medindo)"""
+    return getattr(_io_local, 'stats', None)
+
+def track_io(stats):
+    """Liga um IoStats à thread atual (None desliga); retorna o anterior"""
+    previous = current_io()
+    _io_local.stats = stats
+    return previous
+
+def record_io(stats=None, **deltas):
+    """Soma deltas ao contador dado ou ao da thread atual"""
+    stats = stats or current_io()
+    if stats is not None:
+        stats.add(**deltas)
+
+# ========================================
+# CACHE DE TABELAS CSV
+# ========================================
+
+class TableCache:
+    """
+    Mantém em memória as linhas já parseadas de cada CSV
+    O arquivo só é relido quando sua assinatura (inode, mtime, tamanho) muda
+    As linhas retornadas são compartilhadas: quem precisar alterar deve copiar
+
+    Cada versão carregada recebe uma geração e um changelog. Escritas deste
+    processo que descrevem o que mudaram (appends, reescritas com lista de
+    mudanças) mantêm a geração e acrescentam eventos ao changelog:
+    ('add', row), ('update', antiga, nova), ('remove', row). Reparse ou
+    reescrita sem descrição geram uma geração nova com changelog vazio.
+
+    Enquanto o escritor deste processo grava um arquivo (entre a escrita e
+    o install), quem lê esse arquivo espera o install em vez de reparsear.
+    """
+
+    # Acima disso o changelog é descartado (índices derivados se reconstroem)
+    MAX_CHANGES = 4096
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+        self._installed = threading.Condition(self._lock)
+        self._writing = {}  # caminho -> thread que está gravando
+        self._generations = itertools.count(1)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _signature(path):
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+
+    def read(self, path):
+        """Retorna (fieldnames, rows) do CSV, reaproveitando o parse se nada mudou"""
+        _, fieldnames, rows = self.read_versioned(path)
+        return fieldnames, rows
+
+    def read_versioned(self, path):
+        """Retorna (geração, fieldnames, rows) do CSV"""
+        gen, fieldnames, rows, _ = self.read_changelog(path)
+        return gen, fieldnames, rows
+
+    def read_changelog(self, path):
+        """Retorna (geração, fieldnames, rows, changelog) do CSV"""
+        sig = self._signature(path)
+        with self._lock:
+            while True:
+                entry = self._tables.get(path)
+                if entry is not None and entry[0] == sig:
+                    self.hits += 1
+                    record_io(cache_hits=1)
+                    return entry[3], entry[1], entry[2], entry[4]
+                # Escrita local em andamento: o install vai trazer a versão nova
+                writer = self._writing.get(path)
+                if writer is None or writer == threading.get_ident():
+                    break
+                self._installed.wait()
+                sig = self._signature(path)
+
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            rows = list(reader)
+            fieldnames = list(reader.fieldnames or [])
+        record_io(files_opened=1, bytes_read=sig[3], rows_scanned=len(rows))
+
+        with self._lock:
+            self.misses += 1
+            gen = next(self._generations)
+            # Se o arquivo mudou durante o parse, não guarda (a assinatura não bateria)
+            if self._signature(path) == sig:
+                self._tables[path] = (sig, fieldnames, rows, gen, ())
+        return gen, fieldnames, rows, ()
+
+    def rows(self, path):
+        """Atalho para apenas as linhas do CSV"""
+        return self.read(path)[1]
+
+    @contextmanager
+    def writing(self, path):
+        """Marca uma escrita deste processo em andamento (termina com o install)"""
+        with self._lock:
+            self._writing[path] = threading.get_ident()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._writing.pop(path, None)
+                self._installed.notify_all()
+
+    def install(self, path, before_sig, fieldnames, rows, appended=False, changes=None):
+        """
+        Atualiza o cache após uma escrita feita por este processo, sem reparse
+        Só aproveita a entrada se ela ainda corresponde ao arquivo antes da escrita
+        appended: rows são só as linhas novas do fim do arquivo
+        changes: eventos que levam a versão anterior a `rows` (mantém a geração)
+        """
+        sig = self._signature(path)
+        with self._lock:
+            entry = self._tables.get(path)
+            current = entry is not None and entry[0] == before_sig
+            if appended:
+                if not current:
+                    self._tables.pop(path, None)
+                    return
+                changes = [('add', r) for r in rows]
+                rows = entry[2] + rows
+
+            if current and changes is not None and len(entry[4]) + len(changes) <= self.MAX_CHANGES:
+                self._tables[path] = (sig, fieldnames, rows, entry[3], entry[4] + tuple(changes))
+            else:
+                self._tables[path] = (sig, fieldnames, rows, next(self._generations), ())
+
+    def invalidate(self, path=None):
+        """Descarta o cache de um arquivo (ou de todos)"""
+        with self._lock:
+            if path is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(path, None)
+
+    def stats(self):
+        """Contadores de acertos/faltas do cache"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'tables': len(self._tables)}
+
+class KeyVersions:
+    """
+    Versões monotônicas por chave (usuário, conversa...) de um índice derivado
+    Token '<época>.<global>.<chave>': a parte global sobe quando o índice é
+    reconstruído (muda para todas as chaves); a época é sorteada por
+    processo, então um token de outro processo nunca confere.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self.clock = 0
+        self.floor = 0
+        self.by_key = {}
+
+    def bump(self, *keys):
+        self.clock += 1
+        for key in keys:
+            self.by_key[key] = self.clock
+
+    def reset(self):
+        self.clock += 1
+        self.floor = self.clock
+        self.by_key.clear()
+
+    def token(self, key):
+        return f'{self.epoch}.{self.floor}.{self.by_key.get(key, 0)}'
+
+class RebuildIndex(Exception):
+    """Um evento do changelog não pode ser aplicado ao índice: o sync reconstrói"""
+
+class DerivedIndex(ABC):
+    """
+    Estrutura em memória derivada das linhas de um CSV
+    Acompanha a geração da tabela no cache: na mesma geração só aplica os
+    eventos novos do changelog; numa geração nova recomeça do zero.
+    Subclasses implementam reset(), add(row) e remove(row); consultam
+    dentro de `with self.synced():`. remove (ou add/update) levanta
+    RebuildIndex quando não dá para aplicar a mudança incrementalmente.
+
+    Observadores (estruturas que dependem do índice) recebem as mudanças
+    incrementais via notify() e index_reset(índice) após uma reconstrução.
+    São chamados com o lock do índice seguro, então não devem bloquear.
+
+    Subclasses marcam com touch() as chaves afetadas por cada linha;
+    version(chave) dá o token usado nos ETags.
+    """
+
+    def __init__(self, cache, path):
+        self.cache = cache
+        self.path = path
+        self.lock = threading.RLock()
+        self.observers = []
+        self._gen = None
+        self._seen = 0
+        self._rebuilding = False
+        self.versions = KeyVersions()
+
+    @abstractmethod
+    def reset(self):
+        ...
+
+    @abstractmethod
+    def add(self, row):
+        ...
+
+    @abstractmethod
+    def remove(self, row):
+        ...
+
+    def update(self, old, new):
+        self.remove(old)
+        self.add(new)
+
+    def touch(self, *keys):
+        """Marca chaves como alteradas (na reconstrução todas já mudam)"""
+        if not self._rebuilding:
+            self.versions.bump(*keys)
+
+    def version(self, key):
+        """Token da versão atual da chave"""
+        with self.synced():
+            return self.versions.token(key)
+
+    def notify(self, event, *args):
+        """Repassa uma mudança incremental aos observadores"""
+        if self._rebuilding:
+            return
+        for observer in self.observers:
+            getattr(observer, event)(*args)
+
+    def _rebuild(self, gen, rows, changes):
+        self._rebuilding = True
+        try:
+            self.versions.reset()
+            self.reset()
+            for row in rows:
+                self.add(row)
+        finally:
+            self._rebuilding = False
+        record_io(rows_scanned=len(rows))
+        self._gen = gen
+        self._seen = len(changes)
+        for observer in self.observers:
+            observer.index_reset(self)
+
+    def sync(self):
+        """Alinha o índice com a versão atual do CSV"""
+        gen, _, rows, changes = self.cache.read_changelog(self.path)
+        with self.lock:
+            if gen != self._gen:
+                self._rebuild(gen, rows, changes)
+                return
+            if len(changes) <= self._seen:
+                return
+            try:
+                for event in changes[self._seen:]:
+                    if event[0] == 'add':
+                        self.add(event[1])
+                    elif event[0] == 'update':
+                        self.update(event[1], event[2])
+                    else:
+                        self.remove(event[1])
+            except RebuildIndex:
+                self._rebuild(gen, rows, changes)
+                return
+            self._seen = len(changes)
+
+    @contextmanager
+    def synced(self):
+        """Segura o lock do índice já sincronizado"""
+        with self.lock:
+            self.sync()
+            yield self
+
+@contextmanager
+def file_lock(lock_path):
+    """Lock exclusivo entre processos sobre um arquivo .lock (no-op sem fcntl)"""
+    with open(lock_path, 'a+') as fh:
+        if fcntl:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+def fsync_dir(path):
+    """Garante em disco as entradas da pasta (após um os.replace); no-op onde não dá"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def ensure_csv_file(path, header):
+    """Cria o CSV só com o cabeçalho se ele ainda não existe"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(header)
+
+def replace_csv(path, fieldnames, rows):
+    """
+    Troca o CSV de forma atômica (arquivo temporário + os.replace); quem chama segura o lock
+    Retorna os bytes escritos
+    """
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+        written = f.tell()
+    os.replace(tmp, path)
+    return written
+
+# ========================================
+# ESCRITOR ÚNICO (GROUP COMMIT)
+# ========================================
+
+class CsvWriter:
+    """
+    Único caminho de escrita dos CSVs
+    Cada arquivo tem uma fila atendida por uma thread própria: as mutações
+    que chegam dentro de batch_ms são aplicadas juntas, sob o lock entre
+    processos do arquivo, num único append com fsync ou numa única
+    reescrita atômica. Quem submete recebe um Future com o resultado.
+
+    Mutações:
+    - ('append', [linhas]): linhas na ordem do cabeçalho
+    - ('rewrite', fn): fn(rows) -> (novas_rows ou None, resultado), chamada
+      com as linhas atuais do arquivo já lidas sob o lock. fn pode devolver
+      um terceiro item com os eventos da mudança (ver TableCache), o que
+      permite aos índices derivados se atualizarem sem reconstrução.
+    """
+
+    def __init__(self, cache, batch_ms=2):
+        self.cache = cache
+        self.batch_s = batch_ms / 1000.0
+        self._lock = threading.Lock()
+        self._queues = {}
+        self.commits = 0
+        self.mutations = 0
+
+    def _queue(self, path):
+        with self._lock:
+            q = self._queues.get(path)
+            if q is None:
+                q = {'cond': threading.Condition(), 'items': []}
+                worker = threading.Thread(target=self._run, args=(path, q), name=f'csv-writer:{os.path.basename(path)}', daemon=True)
+                self._queues[path] = q
+                worker.start()
+            return q
+
+    def submit(self, path, kind, payload):
+        """Enfileira uma mutação e retorna o Future da sua conclusão"""
+        future = Future()
+        q = self._queue(path)
+        with q['cond']:
+            q['items'].append((kind, payload, future, current_io()))
+            q['cond'].notify()
+        return future
+
+    def append(self, path, rows):
+        """Acrescenta linhas ao CSV e espera o commit"""
+        return self.submit(path, 'append', rows).result()
+
+    def rewrite(self, path, fn):
+        """Aplica fn às linhas atuais do CSV, reescreve se mudou e retorna o resultado de fn"""
+        return self.submit(path, 'rewrite', fn).result()
+
+    def flush(self):
+        """Espera todas as filas esvaziarem"""
+        for path in list(self._queues):
+            self.submit(path, 'append', []).result()
+
+    def _run(self, path, q):
+        while True:
+            with q['cond']:
+                while not q['items']:
+                    q['cond'].wait()
+            # Janela de agrupamento
+            if self.batch_s > 0:
+                time.sleep(self.batch_s)
+            with q['cond']:
+                batch, q['items'] = q['items'], []
+            try:
+                results = self._commit(path, batch)
+            except Exception as exc:
+                for _, _, future, _ in batch:
+                    future.set_exception(exc)
+            else:
+                for (_, _, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+    @staticmethod
+    def _as_dicts(fieldnames, rows):
+        return [
+            dict(zip(fieldnames, ('' if v is None else str(v) for v in row)))
+            for row in rows
+        ]
+
+    @staticmethod
+    def _record(batch, written, rewrite=False):
+        """Atribui um commit aos contadores de quem submeteu as mutações"""
+        share = written // len(batch)
+        for *_, stats in batch:
+            record_io(stats, files_opened=1, bytes_written=share, rewrites=int(rewrite))
+
+    def _commit(self, path, batch):
+        """Aplica um lote de mutações num único commit; retorna os resultados na ordem"""
+        with file_lock(path + '.lock'):
+            before_sig = TableCache._signature(path)
+            fieldnames, cached = self.cache.read(path)
+
+            # Só appends: uma escrita + fsync no fim do arquivo
+            if all(kind == 'append' for kind, *_ in batch):
+                lines = [row for _, rows, *_ in batch for row in rows]
+                if lines:
+                    with self.cache.writing(path):
+                        with open(path, 'a', newline='', encoding='utf-8') as f:
+                            start = f.tell()
+                            csv.writer(f).writerows(lines)
+                            f.flush()
+                            os.fsync(f.fileno())
+                            self._record(batch, f.tell() - start)
+                        self.cache.install(path, before_sig, fieldnames, self._as_dicts(fieldnames, lines), appended=True)
+                self.commits += 1
+                self.mutations += len(batch)
+                return [None] * len(batch)
+
+            # Há reescritas: aplica tudo em memória e troca o arquivo de uma vez
+            rows = cached
+            changed = False
+            changes = []
+            results = []
+            for kind, payload, *_ in batch:
+                if kind == 'append':
+                    added = self._as_dicts(fieldnames, payload)
+                    rows = rows + added
+                    changed = changed or bool(payload)
+                    if changes is not None:
+                        changes.extend(('add', r) for r in added)
+                    results.append(None)
+                else:
+                    new_rows, result, *described = payload(rows)
+                    if new_rows is not None:
+                        rows = new_rows
+                        changed = True
+                        if described and changes is not None:
+                            changes.extend(described[0])
+                        else:
+                            changes = None
+                    results.append(result)
+
+            if changed:
+                with self.cache.writing(path):
+                    self._record(batch, replace_csv(path, fieldnames, rows), rewrite=True)
+                    self.cache.install(path, before_sig, fieldnames, rows, changes=changes)
+            self.commits += 1
+            self.mutations += len(batch)
+            return results
+
+# ========================================
+# GERADORES DE ID
+# ========================================
+
+class IdSequence:
+    """
+    Sequência persistente de IDs de uma tabela
+    Guarda o último ID entregue em <seq_dir>/<nome>.seq, atualizado de forma
+    atômica (arquivo temporário + os.replace) sob lock entre processos.
+    Na primeira reserva do processo, sincroniza com o maior ID do CSV,
+    então nunca entrega um ID já usado mesmo se o CSV foi editado à mão.
+    history_max: função com o maior ID guardado fora do CSV (segmentos selados)
+    """
+
+    def __init__(self, name, seq_dir, table_path, cache, history_max=None):
+        self.name = name
+        self.seq_dir = seq_dir
+        self.table_path = table_path
+        self.cache = cache
+        self.history_max = history_max
+        self.path = os.path.join(seq_dir, f'{name}.seq')
+        self._lock = threading.Lock()
+        self._seeded = False
+
+    def _max_table_id(self):
+        ids = [int(r['id']) for r in self.cache.rows(self.table_path) if (r.get('id') or '').isdigit()]
+        if self.history_max is not None:
+            ids.append(self.history_max())
+        return max(ids) if ids else 0
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            record_io(files_opened=1, bytes_read=len(text))
+            return int(text.strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, value):
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        record_io(files_opened=1, bytes_written=len(str(value)))
+
+    def reserve(self, count=1):
+        """Reserva um bloco de `count` IDs consecutivos e retorna o range"""
+        if count < 1:
+            raise ValueError('count deve ser >= 1')
+        os.makedirs(self.seq_dir, exist_ok=True)
+        with self._lock, file_lock(self.path + '.lock'):
+            last = self._read()
+            if last is None or not self._seeded:
+                last = max(last or 0, self._max_table_id())
+                self._seeded = True
+            self._write(last + count)
+        return range(last + 1, last + count + 1)
+
+    def next(self):
+        """Entrega o próximo ID da sequência"""
+        return self.reserve(1)[0]
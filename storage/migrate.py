@@ -0,0 +1,140 @@
+# storage/migrate.py
+"""
+========================================
+MIGRAÇÕES
+========================================
+- CSV -> SQLite: copia o conteúdo dos CSVs de um CsvStorage para um
+  SqliteStorage, preservando os IDs. Curtidas são lidas da visão
+  materializada (posts.csv + log), então nada pendente no log se perde.
+- Timestamps: reescreve os formatos legados no formato canônico (UTC)
+"""
+
+from datetime import timezone
+
+from .base import canonical_timestamp
+from .sqlite_engine import SqliteStorage
+
+TABLES = ('users', 'posts', 'likes', 'messages', 'notifications', 'friends')
+
+# Tabelas com coluna timestamp
+TIMESTAMP_TABLES = ('posts', 'messages', 'notifications', 'friends')
+
+def _ids_ok(row, *fields):
+    return all((row.get(f) or '').strip().isdigit() for f in fields)
+
+def migrate_csv_to_sqlite(csv_store, sqlite_store, replace=False):
+    """
+    Importa todos os CSVs no banco SQLite numa única transação
+    replace=True apaga o conteúdo atual das tabelas antes de importar
+    Retorna {tabela: linhas importadas}
+    """
+    rows = csv_store.cache.rows
+    counts = {}
+
+    with sqlite_store.transaction() as conn:
+        if replace:
+            for table in TABLES:
+                conn.execute(f'DELETE FROM {table}')
+
+        users = [
+            (r['id'], r.get('username') or '', r.get('password') or '', r.get('email') or '')
+            for r in rows(csv_store.users_path) if _ids_ok(r, 'id')
+        ]
+        conn.executemany('INSERT OR REPLACE INTO users (id, username, password, email) VALUES (?, ?, ?, ?)', users)
+        counts['users'] = len(users)
+
+        posts = [
+            (r['id'], r['author_id'], r.get('author_name') or '', r.get('timestamp') or '', r.get('content') or '')
+            for r in rows(csv_store.posts_path) if _ids_ok(r, 'id', 'author_id')
+        ]
+        conn.executemany(
+            'INSERT OR REPLACE INTO posts (id, author_id, author_name, timestamp, content) VALUES (?, ?, ?, ?, ?)',
+            posts,
+        )
+        counts['posts'] = len(posts)
+
+        likes = [
+            (pid, uid)
+            for pid, likers in csv_store.likes.snapshot().items() if pid.isdigit()
+            for uid in likers if uid.isdigit()
+        ]
+        conn.executemany('INSERT OR IGNORE INTO likes (post_id, user_id) VALUES (?, ?)', likes)
+        counts['likes'] = len(likes)
+
+        messages = [
+            (r['id'], r['sender_id'], r['receiver_id'], r.get('timestamp') or '', r.get('content') or '')
+            for r in csv_store.messages.all_rows() if _ids_ok(r, 'id', 'sender_id', 'receiver_id')
+        ]
+        conn.executemany(
+            'INSERT OR REPLACE INTO messages (id, sender_id, receiver_id, timestamp, content) VALUES (?, ?, ?, ?, ?)',
+            messages,
+        )
+        counts['messages'] = len(messages)
+
+        notifications = [
+            (r['id'], r['user_id'], r.get('type') or '', r.get('actor_id') or '', r.get('message_id') or '',
+             r.get('timestamp') or '', r.get('read') or '0', r.get('text') or '')
+            for r in rows(csv_store.notifications_path) if _ids_ok(r, 'id', 'user_id')
+        ]
+        conn.executemany(
+            'INSERT OR REPLACE INTO notifications (id, user_id, type, actor_id, message_id, timestamp, read, text) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            notifications,
+        )
+        counts['notifications'] = len(notifications)
+
+        friends = [
+            (r['user1_id'], r['user2_id'], r.get('status') or '0', r.get('timestamp') or '')
+            for r in rows(csv_store.friends_path) if _ids_ok(r, 'user1_id', 'user2_id')
+        ]
+        conn.executemany(
+            'INSERT OR REPLACE INTO friends (user1_id, user2_id, status, timestamp) VALUES (?, ?, ?, ?)',
+            friends,
+        )
+        counts['friends'] = len(friends)
+
+    return counts
+
+def normalize_timestamps(store, legacy_tz=timezone.utc):
+    """
+    Converte para o formato canônico todos os timestamps legados do motor
+    DD/MM/YYYY HH:MM (relógio local do servidor) é lido em legacy_tz
+    Retorna {tabela: linhas alteradas}
+    """
+    convert = lambda value: canonical_timestamp(value, legacy_tz)
+    counts = {}
+
+    # Motor SQLite: UPDATE só nas linhas que mudam
+    if isinstance(store, SqliteStorage):
+        with store.transaction() as conn:
+            for table in TIMESTAMP_TABLES:
+                changed = [
+                    (new, rowid)
+                    for rowid, old in conn.execute(f'SELECT rowid, timestamp FROM {table}')
+                    for new in [convert(old)] if new != old
+                ]
+                conn.executemany(f'UPDATE {table} SET timestamp = ? WHERE rowid = ?', changed)
+                counts[table] = len(changed)
+        return counts
+
+    # Motor CSV: uma reescrita atômica por arquivo, pelo escritor único
+    paths = {
+        'posts': store.posts_path,
+        'messages': store.messages_path,
+        'notifications': store.notifications_path,
+        'friends': store.friends_path,
+    }
+    for table, path in paths.items():
+        def apply(current):
+            rows = []
+            changed = 0
+            for r in current:
+                new = convert(r.get('timestamp') or '')
+                if new != (r.get('timestamp') or ''):
+                    r = dict(r, timestamp=new)
+                    changed += 1
+                rows.append(r)
+            return (rows if changed else None), changed
+
+        counts[table] = store.writer.rewrite(path, apply)
+    return counts
@@ -0,0 +1,137 @@
+# storage/retention.py
+"""
+========================================
+RETENÇÃO DE NOTIFICAÇÕES
+========================================
+Mantém o arquivo/tabela de notificações pequeno:
+- coalesce curtidas repetidas (mesmo destinatário, ator e post): fica a mais nova
+- arquiva o que passou do máximo por usuário ou da idade máxima em
+  segmentos mensais archive/notifications-YYYY-MM.csv (pelo timestamp da linha)
+
+Os motores aplicam a política com NotificationRepository.compact(retention);
+RetentionCompactor repete isso periodicamente numa thread.
+"""
+
+from datetime import datetime, timedelta, timezone
+import threading
+import logging
+import csv
+import os
+
+from .base import NOTIFICATION_FIELDS, TIMESTAMP_FORMAT, canonical_timestamp, is_canonical_timestamp
+from .csvio import file_lock, record_io
+
+logger = logging.getLogger(__name__)
+
+def _notification_order(row):
+    nid = row.get('id') or ''
+    return int(nid) if nid.isdigit() else 0
+
+class NotificationRetention:
+    """Política de retenção (0 desliga o limite correspondente)"""
+
+    def __init__(self, archive_dir, max_per_user=200, max_age_days=90):
+        self.archive_dir = archive_dir
+        self.max_per_user = max_per_user
+        self.max_age_days = max_age_days
+
+    def split(self, rows, now=None):
+        """
+        Separa as linhas em (mantidas, arquivadas, coalescidas)
+        As mantidas preservam a ordem original; a contagem por usuário vai
+        da notificação mais nova para a mais antiga
+        """
+        cutoff = None
+        if self.max_age_days:
+            now = now or datetime.now(timezone.utc)
+            cutoff = (now - timedelta(days=self.max_age_days)).strftime(TIMESTAMP_FORMAT)
+
+        archived, coalesced = set(), set()
+        kept_per_user = {}
+        likes_seen = set()
+        for i in sorted(range(len(rows)), key=lambda i: _notification_order(rows[i]), reverse=True):
+            r = rows[i]
+            uid = r.get('user_id')
+            if r.get('type') == 'like':
+                key = (uid, r.get('actor_id'), r.get('message_id'))
+                if key in likes_seen:
+                    coalesced.add(i)
+                    continue
+                likes_seen.add(key)
+
+            kept = kept_per_user.get(uid, 0)
+            if self.max_per_user and kept >= self.max_per_user:
+                archived.add(i)
+                continue
+            if cutoff:
+                # Canônicos se comparam como texto; formatos desconhecidos ficam
+                ts = canonical_timestamp(r.get('timestamp') or '')
+                if is_canonical_timestamp(ts) and ts < cutoff:
+                    archived.add(i)
+                    continue
+            kept_per_user[uid] = kept + 1
+
+        keep = [r for i, r in enumerate(rows) if i not in archived and i not in coalesced]
+        return keep, [rows[i] for i in sorted(archived)], [rows[i] for i in sorted(coalesced)]
+
+    def segment_path(self, row):
+        """Segmento mensal de arquivo de uma linha"""
+        ts = canonical_timestamp(row.get('timestamp') or '')
+        bucket = ts[:7] if is_canonical_timestamp(ts) else 'undated'
+        return os.path.join(self.archive_dir, f'notifications-{bucket}.csv')
+
+    def archive(self, rows):
+        """Acrescenta as linhas aos segmentos mensais (com fsync); retorna {arquivo: linhas}"""
+        by_segment = {}
+        for r in rows:
+            by_segment.setdefault(self.segment_path(r), []).append(r)
+        if not by_segment:
+            return {}
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for path, segment_rows in by_segment.items():
+            with file_lock(path + '.lock'):
+                new = not os.path.exists(path)
+                with open(path, 'a', newline='', encoding='utf-8') as f:
+                    start = f.tell()
+                    writer = csv.DictWriter(f, fieldnames=NOTIFICATION_FIELDS, extrasaction='ignore')
+                    if new:
+                        writer.writeheader()
+                    writer.writerows(segment_rows)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    record_io(files_opened=1, bytes_written=f.tell() - start)
+        return {os.path.basename(p): len(r) for p, r in by_segment.items()}
+
+class RetentionCompactor:
+    """Aplica a retenção a cada `interval` segundos numa thread própria"""
+
+    def __init__(self, repository, retention, interval):
+        self.repository = repository
+        self.retention = retention
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self.last = None
+
+    def start(self):
+        """Inicia a thread (uma vez); não faz nada com interval <= 0"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='notifications-compactor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        """Uma passada da retenção; retorna {'archived': n, 'coalesced': m}"""
+        self.last = self.repository.compact(self.retention)
+        return self.last
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Falha ao aplicar a retenção das notificações')
@@ -0,0 +1,377 @@
+# storage/segments.py
+"""
+========================================
+SEGMENTOS SELADOS DE MENSAGENS
+========================================
+O histórico de mensagens sai do messages.csv (segmento ativo) em
+segmentos imutáveis de tamanho fixo, em <data>/messages/:
+- messages-<primeiro id>-<último id>.csv: CSV com cabeçalho, em ordem de id
+- messages-<primeiro id>-<último id>.idx: uma linha JSON de cabeçalho, uma
+  com o diretório das conversas (conversa -> posição da sua entrada) e uma
+  entrada por conversa: os IDs e o (offset, tamanho) em bytes de cada
+  linha no .csv
+
+A faixa de IDs está no nome, então listar os segmentos não lê nada. O
+catálogo (conversa -> segmentos que a contêm) é montado uma vez a partir
+dos diretórios e estendido a cada selo, então uma leitura de histórico só
+abre os segmentos daquela conversa e só lê a entrada dela no .idx; as
+linhas são lidas por mmap direto nos offsets, sem parsear o resto.
+"""
+
+from collections import OrderedDict
+from bisect import bisect_right, insort
+import threading
+import logging
+import mmap
+import json
+import csv
+import io
+import os
+
+from .base import MESSAGE_FIELDS
+from .csvio import record_io
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'messages-'
+INDEX_FORMAT = 2  # .idx de outro formato é reconstruído
+
+def conversation_token(user_a, user_b):
+    """Chave textual da conversa no .idx (independe de quem enviou)"""
+    a, b = str(user_a), str(user_b)
+    return f'{a}:{b}' if a <= b else f'{b}:{a}'
+
+def iter_records(buf, start=0):
+    """
+    (offset, tamanho, campos) de cada registro CSV de buf a partir de start
+    Registros com quebra de linha dentro de aspas ocupam várias linhas
+    """
+    state = {'pos': start}
+
+    def lines():
+        end = len(buf)
+        while state['pos'] < end:
+            nl = buf.find(b'\n', state['pos'])
+            nxt = end if nl < 0 else nl + 1
+            line = buf[state['pos']:nxt]
+            state['pos'] = nxt
+            yield line.decode('utf-8')
+
+    # O csv.reader consome só as linhas do registro atual
+    record_start = start
+    for fields in csv.reader(lines()):
+        yield record_start, state['pos'] - record_start, fields
+        record_start = state['pos']
+
+class Segment:
+    """Um segmento selado (faixa de IDs vem do nome do arquivo)"""
+
+    __slots__ = ('path', 'first_id', 'last_id')
+
+    def __init__(self, path, first_id, last_id):
+        self.path = path
+        self.first_id = first_id
+        self.last_id = last_id
+
+    @property
+    def index_path(self):
+        return self.path[:-4] + '.idx'
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @classmethod
+    def parse(cls, seg_dir, filename):
+        """Segment a partir do nome do arquivo (None se não é um segmento)"""
+        if not (filename.startswith(SEGMENT_PREFIX) and filename.endswith('.csv')):
+            return None
+        first, _, last = filename[len(SEGMENT_PREFIX):-4].partition('-')
+        if not (first.isdigit() and last.isdigit()):
+            return None
+        return cls(os.path.join(seg_dir, filename), int(first), int(last))
+
+class SegmentIndex:
+    """.idx aberto com o cabeçalho lido; entradas lidas pela posição"""
+
+    def __init__(self, fh):
+        self._fh = fh
+        try:
+            self.header = json.loads(fh.readline())
+            if not isinstance(self.header, dict) or self.header.get('format') != INDEX_FORMAT:
+                raise ValueError('formato antigo')
+        except Exception:
+            fh.close()
+            raise
+
+    def directory(self):
+        """(conversas, posições, tamanhos) das entradas no .idx, em listas paralelas"""
+        tokens, positions, sizes = json.loads(self._fh.readline())
+        base = self._fh.tell()
+        return tokens, [base + pos for pos in positions], sizes
+
+    def entry(self, pos, size):
+        """[ids, offsets, tamanhos] da conversa"""
+        self._fh.seek(pos)
+        return json.loads(self._fh.read(size))
+
+    def close(self):
+        self._fh.close()
+
+class LoadedSegment:
+    """Segmento aberto: .csv mapeado e .idx pronto para ler entradas"""
+
+    def __init__(self, segment, index, fh, mapped):
+        self.segment = segment
+        self.fieldnames = index.header['fieldnames']
+        self._index = index
+        self._fh = fh
+        self.map = mapped
+
+    def close(self):
+        self.map.close()
+        self._fh.close()
+        self._index.close()
+
+    def rows(self, pos, size, since_id):
+        """Linhas da conversa (entrada em pos/size no .idx) com id > since_id, em ordem de id"""
+        ids, offsets, lengths = self._index.entry(pos, size)
+        out = []
+        read = size
+        for i in range(bisect_right(ids, since_id), len(ids)):
+            off, length = offsets[i], lengths[i]
+            raw = self.map[off:off + length]
+            read += length
+            fields = next(csv.reader(io.StringIO(raw.decode('utf-8'), newline='')))
+            out.append(dict(zip(self.fieldnames, fields)))
+        record_io(bytes_read=read, rows_scanned=len(out))
+        return out
+
+class SegmentStore:
+    """Segmentos selados de uma pasta, com catálogo das conversas e LRU dos segmentos abertos"""
+
+    def __init__(self, seg_dir, max_loaded=8):
+        self.seg_dir = seg_dir
+        self.max_loaded = max_loaded
+        self._lock = threading.RLock()
+        self._listing = (None, [])  # (mtime da pasta, [Segment])
+        self._loaded = OrderedDict()  # caminho -> LoadedSegment
+        self._catalog = {}  # conversa -> [(primeiro id, caminho, posição, tamanho)] em ordem
+        self._cataloged = {}  # caminho -> (Segment, tamanho do .csv) já no catálogo
+
+    def list(self):
+        """Segmentos em ordem de ID (relistados só quando a pasta muda)"""
+        try:
+            mtime = os.stat(self.seg_dir).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if self._listing[0] != mtime:
+                found = (Segment.parse(self.seg_dir, f) for f in os.listdir(self.seg_dir))
+                self._listing = (mtime, sorted((s for s in found if s), key=lambda s: s.first_id))
+            return self._listing[1]
+
+    def max_id(self):
+        """Maior ID já selado (0 se não há segmentos)"""
+        segments = self.list()
+        return segments[-1].last_id if segments else 0
+
+    # ---------- escrita ----------
+
+    def seal(self, rows, fieldnames=MESSAGE_FIELDS):
+        """Grava as linhas (já em ordem de id) como um segmento novo, com seu índice"""
+        os.makedirs(self.seg_dir, exist_ok=True)
+        first_id, last_id = int(rows[0]['id']), int(rows[-1]['id'])
+        path = os.path.join(self.seg_dir, f'{SEGMENT_PREFIX}{first_id:010d}-{last_id:010d}.csv')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+            record_io(files_opened=1, bytes_written=f.tell())
+        segment = Segment(path, first_id, last_id)
+        # O índice vem antes do .csv: um segmento visível sempre tem .idx
+        index = self._build_index(tmp)
+        directory = self._write_index(segment, index)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._cataloged and path not in self._cataloged:
+                self._add_to_catalog(segment, index['size'], directory)
+        return segment
+
+    def _build_index(self, path):
+        """Varre o .csv e monta o conteúdo do .idx"""
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                records = iter_records(buf)
+                _, _, fieldnames = next(records)
+                id_col = fieldnames.index('id')
+                sender_col = fieldnames.index('sender_id')
+                receiver_col = fieldnames.index('receiver_id')
+                conversations = {}
+                rows = 0
+                for offset, length, fields in records:
+                    if len(fields) <= max(id_col, sender_col, receiver_col) or not fields[id_col].isdigit():
+                        continue
+                    token = conversation_token(fields[sender_col], fields[receiver_col])
+                    ids, offsets, lengths = conversations.setdefault(token, ([], [], []))
+                    ids.append(int(fields[id_col]))
+                    offsets.append(offset)
+                    lengths.append(length)
+                    rows += 1
+        record_io(files_opened=1, bytes_read=size, rows_scanned=rows)
+        return {'size': size, 'rows': rows, 'fieldnames': fieldnames, 'conversations': conversations}
+
+    def _write_index(self, segment, sidecar):
+        """
+        Grava o .idx: cabeçalho, diretório e uma entrada por conversa
+        Retorna o diretório como SegmentIndex.directory()
+        """
+        tokens, positions, sizes, entries = [], [], [], []
+        pos = 0
+        for token, entry in sidecar['conversations'].items():
+            line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+            tokens.append(token)
+            positions.append(pos)
+            sizes.append(len(line))
+            entries.append(line)
+            pos += len(line)
+        header = {
+            'format': INDEX_FORMAT,
+            'size': sidecar['size'],
+            'rows': sidecar['rows'],
+            'fieldnames': sidecar['fieldnames'],
+        }
+        head = (json.dumps(header, separators=(',', ':')) + '\n').encode('utf-8')
+        head += (json.dumps([tokens, positions, sizes], separators=(',', ':')) + '\n').encode('utf-8')
+        tmp = f'{segment.index_path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(head)
+            f.writelines(entries)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, segment.index_path)
+        return tokens, [len(head) + pos for pos in positions], sizes
+
+    def _read_directory(self, segment, size):
+        """Diretório do .idx do segmento; reconstrói o .idx ausente, velho ou de outro formato"""
+        try:
+            index = SegmentIndex(open(segment.index_path, 'rb'))
+            try:
+                if index.header.get('size') != size:
+                    raise ValueError('tamanho diferente do .csv')
+                directory = index.directory()
+            finally:
+                index.close()
+            record_io(files_opened=1)
+            return directory
+        except (FileNotFoundError, ValueError) as exc:
+            logger.warning('Reindexando %s (%s)', segment.name, exc)
+        return self._write_index(segment, self._build_index(segment.path))
+
+    def reindex(self):
+        """Reconstrói o .idx de todos os segmentos; retorna {segmento: linhas}"""
+        counts = {}
+        with self._lock:
+            self._drop_loaded()
+            self._reset_catalog()
+            for segment in self.list():
+                sidecar = self._build_index(segment.path)
+                self._write_index(segment, sidecar)
+                counts[segment.name] = sidecar['rows']
+        return counts
+
+    # ---------- leitura ----------
+
+    def _drop_loaded(self):
+        for loaded in self._loaded.values():
+            loaded.close()
+        self._loaded.clear()
+
+    def _reset_catalog(self):
+        self._catalog = {}
+        self._cataloged = {}
+
+    def _add_to_catalog(self, segment, size, directory):
+        catalog = self._catalog
+        first_id, path = segment.first_id, segment.path
+        for token, pos, length in zip(*directory):
+            key = (first_id, path, pos, length)
+            entries = catalog.get(token)
+            if entries is None:
+                catalog[token] = [key]
+            elif entries[-1][0] < first_id:
+                entries.append(key)
+            else:
+                insort(entries, key)
+        self._cataloged[path] = (segment, size)
+
+    def _sync_catalog(self):
+        """Inclui no catálogo os segmentos novos (recomeça se algum sumiu)"""
+        segments = self.list()
+        current = {s.path for s in segments}
+        if self._cataloged.keys() - current:
+            self._drop_loaded()
+            self._reset_catalog()
+        for segment in segments:
+            if segment.path not in self._cataloged:
+                size = os.stat(segment.path).st_size
+                self._add_to_catalog(segment, size, self._read_directory(segment, size))
+
+    def _load(self, segment, size):
+        """Segmento aberto (sob demanda, com LRU); None se não confere com o catálogo"""
+        loaded = self._loaded.get(segment.path)
+        if loaded is not None:
+            self._loaded.move_to_end(segment.path)
+            return loaded
+
+        fh = open(segment.path, 'rb')
+        try:
+            index = SegmentIndex(open(segment.index_path, 'rb'))
+        except (FileNotFoundError, ValueError):
+            fh.close()
+            return None
+        if os.fstat(fh.fileno()).st_size != size or index.header.get('size') != size:
+            index.close()
+            fh.close()
+            return None
+        record_io(files_opened=2)
+
+        loaded = LoadedSegment(segment, index, fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+        self._loaded[segment.path] = loaded
+        while len(self._loaded) > self.max_loaded:
+            _, old = self._loaded.popitem(last=False)
+            old.close()
+        return loaded
+
+    def conversation(self, user_a, user_b, since_id=0):
+        """Mensagens seladas da conversa com id > since_id, em ordem de id"""
+        token = conversation_token(user_a, user_b)
+        with self._lock:
+            for _ in range(2):
+                self._sync_catalog()
+                out = []
+                for _, path, pos, length in self._catalog.get(token, ()):
+                    segment, size = self._cataloged[path]
+                    if segment.last_id <= since_id:
+                        continue
+                    loaded = self._load(segment, size)
+                    if loaded is None:
+                        break
+                    out.extend(loaded.rows(pos, length, since_id))
+                else:
+                    return out
+                # Arquivos trocados desde que entraram no catálogo: recomeça
+                logger.warning('Segmento %s mudou; refazendo o catálogo', segment.name)
+                self._drop_loaded()
+                self._reset_catalog()
+            return out
+
+    def rows(self):
+        """Todas as linhas seladas, segmento a segmento (migração)"""
+        for segment in self.list():
+            with open(segment.path, newline='', encoding='utf-8') as f:
+                yield from csv.DictReader(f)
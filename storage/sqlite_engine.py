@@ -0,0 +1,562 @@
+# storage/sqlite_engine.py
+"""
+========================================
+MOTOR DE ARMAZENAMENTO SQLITE
+========================================
+Mesmos repositórios do motor CSV sobre um banco SQLite:
+- Modo WAL (leitores não bloqueiam o escritor)
+- Índices para as buscas das rotas (autor, conversa, destinatário...)
+- Uma conexão por thread
+"""
+
+from contextlib import contextmanager
+import threading
+import sqlite3
+import os
+
+from .base import (
+    Storage, UserRepository, PostRepository, LikeRepository, MessageRepository,
+    NotificationRepository, FriendshipRepository, TimelineRepository, utc_now_iso,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL,
+    email TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+-- Busca por prefixo (LIKE 'abc%' usa estes índices)
+CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    author_id INTEGER NOT NULL,
+    author_name TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_posts_author ON posts(author_id, id);
+
+CREATE TABLE IF NOT EXISTS likes (
+    post_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (post_id, user_id)
+) WITHOUT ROWID;
+
+-- Versão global das curtidas e versão da última mudança de cada post
+CREATE TABLE IF NOT EXISTS like_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO like_version (id, version) VALUES (1, 0);
+
+CREATE TABLE IF NOT EXISTS like_changes (
+    post_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    sender_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_messages_pair ON messages(sender_id, receiver_id, id);
+
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    actor_id TEXT NOT NULL DEFAULT '',
+    message_id TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT '',
+    read TEXT NOT NULL DEFAULT '0',
+    text TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id, id);
+
+CREATE TABLE IF NOT EXISTS friends (
+    user1_id INTEGER NOT NULL,
+    user2_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    timestamp TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (user1_id, user2_id)
+);
+CREATE INDEX IF NOT EXISTS idx_friends_user2 ON friends(user2_id, status);
+
+-- Versões por usuário/conversa para GET condicional (ETag), mantidas por
+-- gatilhos: valem para qualquer processo que escreva no banco
+CREATE TABLE IF NOT EXISTS data_versions (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trg_messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO data_versions (scope, key, version) VALUES ('messages', min(NEW.sender_id, NEW.receiver_id) || ':' || max(NEW.sender_id, NEW.receiver_id), 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_notifications_insert AFTER INSERT ON notifications BEGIN
+    INSERT INTO data_versions (scope, key, version) VALUES ('notifications', NEW.user_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_notifications_delete AFTER DELETE ON notifications BEGIN
+    INSERT INTO data_versions (scope, key, version) VALUES ('notifications', OLD.user_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_friends_insert AFTER INSERT ON friends BEGIN
+    INSERT INTO data_versions (scope, key, version) VALUES ('friends', NEW.user1_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+    INSERT INTO data_versions (scope, key, version) VALUES ('friends', NEW.user2_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_friends_update AFTER UPDATE ON friends BEGIN
+    INSERT INTO data_versions (scope, key, version) VALUES ('friends', OLD.user1_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+    INSERT INTO data_versions (scope, key, version) VALUES ('friends', OLD.user2_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+    INSERT INTO data_versions (scope, key, version) VALUES ('friends', NEW.user1_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+    INSERT INTO data_versions (scope, key, version) VALUES ('friends', NEW.user2_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_friends_delete AFTER DELETE ON friends BEGIN
+    INSERT INTO data_versions (scope, key, version) VALUES ('friends', OLD.user1_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+    INSERT INTO data_versions (scope, key, version) VALUES ('friends', OLD.user2_id, 1)
+    ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+END;
+"""
+
+def _as_row(cursor, values):
+    """Linha do SQLite como dict de str (mesmo formato das linhas do CSV)"""
+    return {
+        col[0]: '' if v is None else str(v)
+        for col, v in zip(cursor.description, values)
+    }
+
+# ========================================
+# REPOSITÓRIOS
+# ========================================
+
+class SqliteUserRepository(UserRepository):
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, user_id):
+        rows = self.store.query('SELECT id, username, email FROM users WHERE id = ?', (user_id,))
+        return rows[0] if rows else None
+
+    def get_many(self, user_ids):
+        ids = list(dict.fromkeys(str(uid) for uid in user_ids))
+        result = {}
+        # Em blocos para respeitar o limite de parâmetros do SQLite
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            for row in self.store.query(f'SELECT id, username, email FROM users WHERE id IN ({marks})', chunk):
+                result[row['id']] = row
+        return result
+
+    def exists(self, user_id):
+        return self.get(user_id) is not None
+
+    def search(self, prefix, limit=10, exclude_id=None):
+        prefix = (prefix or '').strip()
+        if not prefix:
+            return []
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sql = (
+            'SELECT id, username, email FROM ('
+            " SELECT id, username, email, username AS k FROM users WHERE username LIKE ? ESCAPE '\\'"
+            ' UNION ALL'
+            " SELECT id, username, email, email AS k FROM users WHERE email LIKE ? ESCAPE '\\'"
+            ')'
+        )
+        params = [pattern, pattern]
+        if exclude_id is not None:
+            sql += ' WHERE id != ?'
+            params.append(exclude_id)
+        # Um usuário pode aparecer pelas duas chaves: busca o dobro e tira repetidos
+        sql += ' ORDER BY k COLLATE NOCASE, id LIMIT ?'
+        params.append(limit * 2)
+        result = {}
+        for row in self.store.query(sql, params):
+            result.setdefault(row['id'], row)
+        return list(result.values())[:limit]
+
+    def authenticate(self, login, password):
+        rows = self.store.query(
+            'SELECT id, username, email FROM users '
+            'WHERE (username = ? OR email = ?) AND password = ? ORDER BY id LIMIT 1',
+            (login, login, password),
+        )
+        return rows[0] if rows else None
+
+    def create(self, username, password, email):
+        with self.store.transaction() as conn:
+            cur = conn.execute(
+                'INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
+                (username, password, email),
+            )
+            return str(cur.lastrowid)
+
+class SqlitePostRepository(PostRepository):
+
+    def __init__(self, store):
+        self.store = store
+
+    def all(self):
+        return self.store.query('SELECT * FROM posts ORDER BY id')
+
+    def page_by_author(self, author_id, before_id=None, limit=20):
+        rows = self.store.query(
+            'SELECT * FROM posts WHERE author_id = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (author_id, int(before_id) if before_id else 2 ** 62, limit + 1),
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return rows, (rows[-1]['id'] if more else None)
+
+    def create(self, author_id, author_name, content):
+        with self.store.transaction() as conn:
+            cur = conn.execute(
+                'INSERT INTO posts (author_id, author_name, timestamp, content) VALUES (?, ?, ?, ?)',
+                (author_id, author_name, utc_now_iso(), content),
+            )
+            return str(cur.lastrowid)
+
+class SqliteLikeRepository(LikeRepository):
+
+    def __init__(self, store):
+        self.store = store
+
+    def toggle(self, post_id, user_id):
+        with self.store.transaction() as conn:
+            post = conn.execute('SELECT author_id FROM posts WHERE id = ?', (post_id,)).fetchone()
+            if post is None:
+                return None
+
+            cur = conn.execute('DELETE FROM likes WHERE post_id = ? AND user_id = ?', (post_id, user_id))
+            liked = cur.rowcount == 0
+            if liked:
+                conn.execute('INSERT INTO likes (post_id, user_id) VALUES (?, ?)', (post_id, user_id))
+            conn.execute('UPDATE like_version SET version = version + 1 WHERE id = 1')
+            conn.execute(
+                'INSERT INTO like_changes (post_id, version) SELECT ?, version FROM like_version WHERE id = 1 '
+                'ON CONFLICT(post_id) DO UPDATE SET version = excluded.version',
+                (post_id,),
+            )
+            total = conn.execute('SELECT COUNT(*) FROM likes WHERE post_id = ?', (post_id,)).fetchone()[0]
+            return liked, total, str(post[0])
+
+    def snapshot(self):
+        conn = self.store.conn()
+        result = {str(r[0]): set() for r in conn.execute('SELECT id FROM posts')}
+        for post_id, user_id in conn.execute('SELECT post_id, user_id FROM likes'):
+            result.setdefault(str(post_id), set()).add(str(user_id))
+        return result
+
+    @staticmethod
+    def _states(conn, chunk, user_id):
+        """{post_id: (total, se user_id curtiu)} de um lote de posts"""
+        marks = ','.join('?' * len(chunk))
+        sql = (
+            'SELECT p.id, COUNT(l.user_id), COALESCE(MAX(l.user_id = ?), 0) '
+            f'FROM posts p LEFT JOIN likes l ON l.post_id = p.id WHERE p.id IN ({marks}) GROUP BY p.id'
+        )
+        return {str(pid): (total, bool(mine)) for pid, total, mine in conn.execute(sql, [user_id] + chunk)}
+
+    def states(self, post_ids, user_id):
+        conn = self.store.conn()
+        if post_ids is None:
+            sql = (
+                'SELECT p.id, COUNT(l.user_id), COALESCE(MAX(l.user_id = ?), 0) '
+                'FROM posts p LEFT JOIN likes l ON l.post_id = p.id GROUP BY p.id'
+            )
+            return {str(pid): (total, bool(mine)) for pid, total, mine in conn.execute(sql, (user_id,))}
+
+        ids = list(dict.fromkeys(str(pid) for pid in post_ids if str(pid).isdigit()))
+        result = {}
+        for i in range(0, len(ids), 500):
+            result.update(self._states(conn, ids[i:i + 500], user_id))
+        return result
+
+    def version(self):
+        return str(self.store.conn().execute('SELECT version FROM like_version WHERE id = 1').fetchone()[0])
+
+    def changed_since(self, token, post_ids, user_id):
+        ids = list(dict.fromkeys(str(pid) for pid in post_ids if str(pid).isdigit()))
+        since = int(token) if (token or '').isdigit() else None
+        conn = self.store.conn()
+        # Leitura consistente: versão e curtidas do mesmo instante
+        conn.execute('BEGIN')
+        try:
+            current = conn.execute('SELECT version FROM like_version WHERE id = 1').fetchone()[0]
+            if since is not None and since > current:
+                since = None  # token de outro banco
+            changed = {}
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+                if since is None:
+                    sql = f'SELECT id FROM posts WHERE id IN ({marks})'
+                    params = chunk
+                else:
+                    sql = f'SELECT post_id FROM like_changes WHERE post_id IN ({marks}) AND version > ?'
+                    params = chunk + [since]
+                hits = [str(pid) for (pid,) in conn.execute(sql, params)]
+                if hits:
+                    changed.update(self._states(conn, hits, user_id))
+        finally:
+            conn.execute('COMMIT')
+        return str(current), changed
+
+class SqliteMessageRepository(MessageRepository):
+
+    def __init__(self, store):
+        self.store = store
+
+    def create(self, sender_id, receiver_id, content):
+        now = utc_now_iso()
+        with self.store.transaction() as conn:
+            cur = conn.execute(
+                'INSERT INTO messages (sender_id, receiver_id, timestamp, content) VALUES (?, ?, ?, ?)',
+                (sender_id, receiver_id, now, content),
+            )
+            return cur.lastrowid, now
+
+    def version(self, user_a, user_b):
+        a, b = sorted((int(user_a), int(user_b)))
+        return self.store.data_version('messages', f'{a}:{b}')
+
+    def conversation(self, user_a, user_b, since_id=0):
+        return self.store.query(
+            'SELECT * FROM messages '
+            'WHERE ((sender_id = ? AND receiver_id = ?) OR (sender_id = ? AND receiver_id = ?)) '
+            'AND id > ? ORDER BY id',
+            (user_a, user_b, user_b, user_a, since_id),
+        )
+
+class SqliteNotificationRepository(NotificationRepository):
+
+    def __init__(self, store):
+        self.store = store
+
+    def create(self, user_id, type, actor_id, post_id, text):
+        return self.create_many([(user_id, type, actor_id, post_id, text)])[0]
+
+    def create_many(self, items):
+        now = utc_now_iso()
+        ids = []
+        with self.store.transaction() as conn:
+            for user_id, type, actor_id, post_id, text in items:
+                cur = conn.execute(
+                    'INSERT INTO notifications (user_id, type, actor_id, message_id, timestamp, read, text) '
+                    "VALUES (?, ?, ?, ?, ?, '0', ?)",
+                    (user_id, type, str(actor_id) if actor_id else '', str(post_id) if post_id else '', now, text),
+                )
+                ids.append(str(cur.lastrowid))
+        return ids
+
+    def latest(self, user_id, limit=50):
+        rows = self.store.query(
+            'SELECT * FROM notifications WHERE user_id = ? ORDER BY id DESC LIMIT ?', (user_id, limit)
+        )
+        unread = self.store.conn().execute(
+            "SELECT COUNT(*) FROM notifications WHERE user_id = ? AND read = '0'", (user_id,)
+        ).fetchone()[0]
+        return rows, unread
+
+    def version(self, user_id):
+        return self.store.data_version('notifications', str(user_id))
+
+    def remove_friend_requests(self, target_user_id, requester_id):
+        with self.store.transaction() as conn:
+            cur = conn.execute(
+                "DELETE FROM notifications WHERE user_id = ? AND type = 'friend_request' AND actor_id = ?",
+                (target_user_id, str(requester_id)),
+            )
+            return cur.rowcount
+
+    def clear_user(self, user_id):
+        with self.store.transaction() as conn:
+            return conn.execute('DELETE FROM notifications WHERE user_id = ?', (user_id,)).rowcount
+
+    def compact(self, retention):
+        # Leitura, arquivo e remoção sob o mesmo BEGIN IMMEDIATE: dois
+        # compactadores (um por worker) não arquivam as mesmas linhas
+        with self.store.transaction() as conn:
+            rows = self.store.query('SELECT * FROM notifications ORDER BY id')
+            _, archived, coalesced = retention.split(rows)
+            segments = retention.archive(archived)
+            removed = [(r['id'],) for r in archived + coalesced]
+            if removed:
+                conn.executemany('DELETE FROM notifications WHERE id = ?', removed)
+        return {'archived': len(archived), 'coalesced': len(coalesced), 'segments': segments}
+
+class SqliteFriendshipRepository(FriendshipRepository):
+
+    def __init__(self, store):
+        self.store = store
+
+    def version(self, user_id):
+        return self.store.data_version('friends', str(user_id))
+
+    def friends_of(self, user_id):
+        rows = self.store.conn().execute(
+            "SELECT user2_id FROM friends WHERE user1_id = ? AND status = '1' AND user2_id != user1_id "
+            "UNION ALL "
+            "SELECT user1_id FROM friends WHERE user2_id = ? AND status = '1' AND user2_id != user1_id",
+            (user_id, user_id),
+        )
+        return [str(r[0]) for r in rows]
+
+    def are_friends(self, user_a, user_b):
+        row = self.store.conn().execute(
+            "SELECT 1 FROM friends WHERE status = '1' AND user1_id != user2_id AND "
+            "((user1_id = ? AND user2_id = ?) OR (user1_id = ? AND user2_id = ?)) LIMIT 1",
+            (user_a, user_b, user_b, user_a),
+        ).fetchone()
+        return row is not None
+
+    def incoming_requests(self, user_id):
+        return self.store.query(
+            "SELECT * FROM friends WHERE user2_id = ? AND status = '0'", (user_id,)
+        )
+
+    def has_pending(self, user_a, user_b):
+        row = self.store.conn().execute(
+            "SELECT 1 FROM friends WHERE status = '0' AND "
+            "((user1_id = ? AND user2_id = ?) OR (user1_id = ? AND user2_id = ?)) LIMIT 1",
+            (user_a, user_b, user_b, user_a),
+        ).fetchone()
+        return row is not None
+
+    def create_request(self, sender_id, receiver_id):
+        with self.store.transaction() as conn:
+            # Verifica se já existe alguma relação
+            exists = conn.execute(
+                'SELECT 1 FROM friends WHERE (user1_id = ? AND user2_id = ?) OR (user1_id = ? AND user2_id = ?)',
+                (sender_id, receiver_id, receiver_id, sender_id),
+            ).fetchone()
+            if exists:
+                return False
+            conn.execute(
+                "INSERT INTO friends (user1_id, user2_id, status, timestamp) VALUES (?, ?, '0', ?)",
+                (sender_id, receiver_id, utc_now_iso()),
+            )
+            return True
+
+    def update_status(self, requester_id, target_id, new_status):
+        with self.store.transaction() as conn:
+            cur = conn.execute(
+                "UPDATE friends SET status = ? WHERE user1_id = ? AND user2_id = ? AND status = '0'",
+                (str(new_status), requester_id, target_id),
+            )
+            return cur.rowcount > 0
+
+    def delete_pending(self, requester_id, target_id):
+        with self.store.transaction() as conn:
+            cur = conn.execute(
+                "DELETE FROM friends WHERE user1_id = ? AND user2_id = ? AND status = '0'",
+                (requester_id, target_id),
+            )
+            return cur.rowcount > 0
+
+class SqliteTimelineRepository(TimelineRepository):
+    """Feed por consulta: o índice (author_id, id) limita a leitura a cada página"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def page(self, user_id, before_id=None, limit=20):
+        rows = self.store.query(
+            'SELECT * FROM posts WHERE id < ? AND author_id IN ('
+            '  SELECT CAST(? AS INTEGER) '
+            "  UNION SELECT user2_id FROM friends WHERE user1_id = ? AND status = '1' "
+            "  UNION SELECT user1_id FROM friends WHERE user2_id = ? AND status = '1'"
+            ') ORDER BY id DESC LIMIT ?',
+            (int(before_id) if before_id else 2 ** 62, user_id, user_id, user_id, limit + 1),
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return rows, (rows[-1]['id'] if more else None)
+
+# ========================================
+# STORAGE SQLITE
+# ========================================
+
+class SqliteStorage(Storage):
+    """Motor SQLite (WAL) para bases maiores"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.init()
+
+        self.users = SqliteUserRepository(self)
+        self.posts = SqlitePostRepository(self)
+        self.likes = SqliteLikeRepository(self)
+        self.messages = SqliteMessageRepository(self)
+        self.notifications = SqliteNotificationRepository(self)
+        self.friends = SqliteFriendshipRepository(self)
+        self.timeline = SqliteTimelineRepository(self)
+
+    def conn(self):
+        """Conexão da thread atual (aberta sob demanda)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Transação de escrita (BEGIN IMMEDIATE ... COMMIT)"""
+        conn = self.conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def query(self, sql, params=()):
+        """Executa um SELECT e retorna as linhas como dicts de str"""
+        cur = self.conn().execute(sql, params)
+        return [_as_row(cur, r) for r in cur.fetchall()]
+
+    def data_version(self, scope, key):
+        """Versão de uma chave em data_versions (mantida pelos gatilhos)"""
+        row = self.conn().execute(
+            'SELECT version FROM data_versions WHERE scope = ? AND key = ?', (scope, key)
+        ).fetchone()
+        return str(row[0]) if row else '0'
+
+    def init(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.conn().executescript(SCHEMA)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self):
+        counts = {}
+        for table in ('users', 'posts', 'likes', 'messages', 'notifications', 'friends'):
+            counts[table] = self.conn().execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        return {'rows': counts}